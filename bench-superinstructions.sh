@@ -0,0 +1,38 @@
+#!/bin/bash
+
+# Compares the interpreter with and without superinstructions, both without
+# the JIT, on the given programs or the benchmarks in pycket/test.
+# Build the two executables first:
+#   make translate-no-jit translate-no-jit-no-superinstructions
+
+WITH=./pycket-c-nojit
+WITHOUT=./pycket-c-nojit-no-superinstructions
+
+for exe in $WITH $WITHOUT; do
+    if [ ! -x $exe ]; then
+        echo "File does not exist or is not executable: $exe"
+        exit 1
+    fi
+done
+
+if [ $# -eq 0 ]; then
+    set -- pycket/test/ack.rkt pycket/test/binarytree.rkt \
+        pycket/test/bubble.rkt pycket/test/ctak.rkt pycket/test/earley.rkt \
+        pycket/test/fannkuch-redux.rkt pycket/test/nbody.rkt \
+        pycket/test/nqueens.rkt pycket/test/paraffins.rkt \
+        pycket/test/puzzle.rkt pycket/test/spectral-norm.rkt \
+        pycket/test/sumloop.rkt pycket/test/treerec.rkt \
+        pycket/test/triangle.rkt
+fi
+
+TIMEFORMAT=%R
+printf "%-40s %10s %10s\n" program with without
+for program in "$@"; do
+    # the first run expands the program and writes the AST cache
+    $WITH $program >/dev/null 2>&1
+    with=$( { time $WITH $program >/dev/null 2>&1; } 2>&1 )
+    without=$( { time $WITHOUT $program >/dev/null 2>&1; } 2>&1 )
+    printf "%-40s %10s %10s\n" $program $with $without
+done
+
+exit 0
@@ -1,7 +1,7 @@
 from rpython.rlib import jit
 
 class AST(object):
-    _attrs_ = ["should_enter", "mvars", "surrounding_lambda", "_stringrepr", "app_like", "count", "the_lam", "in_cycle", "is_bad"]
+    _attrs_ = ["should_enter", "mvars", "surrounding_lambda", "_stringrepr", "app_like", "count", "the_lam", "in_cycle"]
     _immutable_fields_ = ["should_enter", "surrounding_lambda", "app_like"]
     _settled_ = True
 
@@ -19,8 +19,6 @@ class AST(object):
 
     the_lam = None
 
-    is_bad = False
-
     count = 0
 
     def defined_vars(self): return {}
@@ -36,6 +34,12 @@ class AST(object):
     def interpret_simple(self, env):
         raise NotImplementedError("abstract base class")
 
+    def interpret_direct(self, env):
+        """ the value of an AST that cannot capture its continuation (see
+        nonescaping in interpreter.py), computed without one """
+        assert self.simple
+        return self.interpret_simple(env)
+
     def set_surrounding_lambda(self, lam):
         from pycket.interpreter import Lambda
         assert isinstance(lam, Lambda)
@@ -62,20 +66,25 @@ class AST(object):
     def direct_children(self):
         return []
 
+    def call_cache_counts(self):
+        """ the hits and misses of the inline cache of a call """
+        return 0, 0
+
     def free_vars(self):
         free_vars = {}
         for child in self.direct_children():
             free_vars.update(child.free_vars())
         return free_vars
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         """ make a copy of the AST that converts all writable variables into
         using cells. In addition, compute the state of the environment for
         every AST node that needs to know.
 
         The vars argument contains the variables that need to use cells.
         The env_structure is an instance of SymList (or None) describing the
-        environment at that AST node.
+        environment at that AST node. known is the KnownDefinitions of the
+        module that is being converted, or None if nothing is folded.
         """
         raise NotImplementedError("abstract base class")
 
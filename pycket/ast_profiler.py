@@ -0,0 +1,241 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Execution profile of the ASTs, collected by the two-state interpreter loop
+# with --profile-ast and reported per lambda at exit.
+#
+# The interpreter only runs when the JIT does not: inner_interpret_two_state
+# counts every AST it executes (ast.count). Whenever compiled code is left,
+# the JIT restarts the portal, i.e. inner_interpret_two_state, at the AST
+# where execution continues. The last AST that called can_enter_jit before
+# that without returning is where the JIT was entered.
+#
+import time
+
+from rpython.rlib.listsort import make_timsort_class
+
+from pycket import pycket_json
+from pycket.warmup import module_lambdas, body_nodes
+
+LambdaBaseSorter = make_timsort_class()
+ASTBaseSorter = make_timsort_class()
+
+class ASTProfiler(object):
+    def __init__(self):
+        self.active = False
+        self.start_time = 0.0
+        self.jit_time = 0.0
+        self.entering = None
+        self.enter_time = 0.0
+        self.jit_entries = {}
+        self.jit_exits = {}
+
+    def start(self):
+        self.active = True
+        self.start_time = time.time()
+
+    def before_can_enter_jit(self, ast):
+        self.entering = ast
+        self.enter_time = time.time()
+
+    def after_can_enter_jit(self):
+        # returning from can_enter_jit means the JIT was not entered
+        self.entering = None
+
+    def portal_entered(self, ast):
+        if self.entering is not None:
+            self.left_jit(ast)
+
+    def left_jit(self, ast):
+        entering = self.entering
+        assert entering is not None
+        self.entering = None
+        self.jit_time += time.time() - self.enter_time
+        self.jit_entries[entering] = self.jit_entries.get(entering, 0) + 1
+        if ast is not None:
+            self.jit_exits[ast] = self.jit_exits.get(ast, 0) + 1
+
+    def finish(self, modules):
+        """ Stop profiling and collect the profile of the lambdas of
+        modules. """
+        if self.entering is not None:
+            # the program ended in compiled code
+            self.left_jit(None)
+        self.active = False
+        total_time = time.time() - self.start_time
+        profile = Profile(total_time - self.jit_time, self.jit_time)
+        for module in modules:
+            for lam in module_lambdas(module):
+                if lam.is_lazy():
+                    continue
+                lam_profile = LambdaProfile(lam)
+                nodes = body_nodes(lam)
+                for i in range(len(nodes)):
+                    ast = nodes[i]
+                    hits, misses = ast.call_cache_counts()
+                    ast_profile = ASTProfile(ast, i, ast.count,
+                                             self.jit_entries.get(ast, 0),
+                                             self.jit_exits.get(ast, 0),
+                                             hits, misses)
+                    lam_profile.add(ast_profile)
+                if lam_profile.executions or lam_profile.jit_entries:
+                    profile.lambdas.append(lam_profile)
+        profile.sort()
+        return profile
+
+ast_profiler = ASTProfiler()
+
+class ASTProfile(object):
+    def __init__(self, ast, index, executions, jit_entries, jit_exits,
+                 cache_hits, cache_misses):
+        self.ast = ast
+        self.index = index
+        self.executions = executions
+        self.jit_entries = jit_entries
+        self.jit_exits = jit_exits
+        # hits and misses of the inline cache of a call
+        self.cache_hits = cache_hits
+        self.cache_misses = cache_misses
+
+    def tojson(self):
+        return pycket_json.JsonObject({
+            "index": pycket_json.JsonInt(self.index),
+            "executions": pycket_json.JsonInt(self.executions),
+            "jit-entries": pycket_json.JsonInt(self.jit_entries),
+            "jit-exits": pycket_json.JsonInt(self.jit_exits),
+            "cache-hits": pycket_json.JsonInt(self.cache_hits),
+            "cache-misses": pycket_json.JsonInt(self.cache_misses),
+            "should-enter": json_bool(self.ast.should_enter),
+            "ast": pycket_json.JsonString(self.ast.tostring()),
+        })
+
+class LambdaProfile(object):
+    def __init__(self, lam):
+        self.lam = lam
+        self.asts = []
+        self.executions = 0
+        self.jit_entries = 0
+        self.jit_exits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, ast_profile):
+        self.asts.append(ast_profile)
+        self.executions += ast_profile.executions
+        self.jit_entries += ast_profile.jit_entries
+        self.jit_exits += ast_profile.jit_exits
+        self.cache_hits += ast_profile.cache_hits
+        self.cache_misses += ast_profile.cache_misses
+
+    def calls(self):
+        """ the calls of the lambda that were interpreted """
+        return self.lam.body[0].count
+
+    def location(self):
+        lam = self.lam
+        if not lam.srcfile:
+            return "?"
+        if lam.srcpos < 0:
+            return lam.srcfile
+        return "%s:%s" % (lam.srcfile, lam.srcpos)
+
+    def tojson(self):
+        lam = self.lam
+        return pycket_json.JsonObject({
+            "source": pycket_json.JsonString(lam.srcfile or ""),
+            "position": pycket_json.JsonInt(lam.srcpos),
+            "calls": pycket_json.JsonInt(self.calls()),
+            "executions": pycket_json.JsonInt(self.executions),
+            "jit-entries": pycket_json.JsonInt(self.jit_entries),
+            "jit-exits": pycket_json.JsonInt(self.jit_exits),
+            "cache-hits": pycket_json.JsonInt(self.cache_hits),
+            "cache-misses": pycket_json.JsonInt(self.cache_misses),
+            "in-cycle": json_bool(lam.body[0].in_cycle),
+            "asts": pycket_json.JsonArray([a.tojson() for a in self.asts]),
+        })
+
+class Profile(object):
+    def __init__(self, interpreter_time, jit_time):
+        self.interpreter_time = interpreter_time
+        self.jit_time = jit_time
+        self.lambdas = []
+
+    def sort(self):
+        LambdaSorter(self.lambdas).sort()
+
+    def cold_asts(self):
+        """ the ASTs that were executed most often by the interpreter without
+        the JIT ever being entered there """
+        result = []
+        for lam_profile in self.lambdas:
+            if lam_profile.jit_entries:
+                continue
+            for ast_profile in lam_profile.asts:
+                if ast_profile.executions:
+                    result.append(ast_profile)
+        ASTSorter(result).sort()
+        return result
+
+    def report(self, max_asts=20):
+        lines = ["AST profile: %s s interpreted, %s s in the JIT "
+                 "(including tracing)" % (self.interpreter_time, self.jit_time),
+                 "",
+                 "  executions       calls jit-entries   jit-exits  lambda"]
+        for lam_profile in self.lambdas:
+            cycle = " (in cycle)" if lam_profile.lam.body[0].in_cycle else ""
+            lines.append("%s%s%s%s  %s%s" % (
+                pad(lam_profile.executions, 12), pad(lam_profile.calls(), 12),
+                pad(lam_profile.jit_entries, 12), pad(lam_profile.jit_exits, 12),
+                lam_profile.location(), cycle))
+        hits = 0
+        misses = 0
+        for lam_profile in self.lambdas:
+            hits += lam_profile.cache_hits
+            misses += lam_profile.cache_misses
+        if hits or misses:
+            lines.append("")
+            lines.append("inline caches of calls: %s hits, %s misses (%s%% hits)"
+                         % (hits, misses, hits * 100 / (hits + misses)))
+        cold = self.cold_asts()
+        if cold:
+            lines.append("")
+            lines.append("ASTs of lambdas the JIT never entered:")
+            lines.append("  executions  ast")
+            for ast_profile in cold[:max_asts]:
+                lines.append("%s  %s" % (pad(ast_profile.executions, 12),
+                                         shorten(ast_profile.ast.tostring(), 66)))
+        lines.append("")
+        return "\n".join(lines)
+
+    def tojson(self):
+        return pycket_json.JsonObject({
+            "interpreter-time": pycket_json.JsonFloat(self.interpreter_time),
+            "jit-time": pycket_json.JsonFloat(self.jit_time),
+            "lambdas": pycket_json.JsonArray([l.tojson() for l in self.lambdas]),
+        })
+
+class LambdaSorter(LambdaBaseSorter):
+    def lt(self, a, b):
+        return a.executions > b.executions
+
+class ASTSorter(ASTBaseSorter):
+    def lt(self, a, b):
+        return a.executions > b.executions
+
+def json_bool(b):
+    if b:
+        return pycket_json.json_true
+    return pycket_json.json_false
+
+def shorten(s, width):
+    if len(s) <= width:
+        return s
+    stop = width - 3
+    assert stop >= 0
+    return s[:stop] + "..."
+
+def pad(n, width):
+    s = str(n)
+    if len(s) < width:
+        s = " " * (width - len(s)) + s
+    return s
@@ -60,6 +60,10 @@ class W_Object(W_ProtoObject):
     def is_proper_list(self):
         return False
 
+    def list_length(self):
+        """ the length of a proper list, only called if is_proper_list() """
+        raise NotImplementedError("not a proper list")
+
     def is_impersonator(self):
         return self.is_chaperone()
     def is_chaperone(self):
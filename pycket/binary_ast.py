@@ -0,0 +1,850 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compact binary serialization of assign-converted modules.
+#
+# A file consists of a header followed by four tables and the tree:
+#
+#   header     magic, format version, configuration flags, length and hash
+#              of the source file the module was expanded from and of the
+#              expanded JSON it was parsed from
+#   strings    every Python string used by the tree (module names, srcfiles)
+#   symbols    every W_Symbol, with a flag telling how to recreate it; gensyms
+#              are recreated once per load so identity is preserved
+#   symlists   the env structures (SymList), each referring to its prev
+#   constants  the quoted values
+#   tree       the Module, in preorder; the bodies of lambdas are prefixed
+#              with their size, so that they can be skipped and decoded only
+#              when needed (see config.lazy_bodies and LazyBody)
+#
+# and ends with the magic string again, so that truncated files are rejected
+# before anything is decoded.
+#
+# All integers are written as variable length quantities, so the decoder is a
+# single linear pass over the data.
+#
+from rpython.rlib.rstring import StringBuilder
+from rpython.rlib.rarithmetic import (intmask, longlongmask, r_ulonglong,
+    r_uint, LONG_BIT)
+from rpython.rlib.rbigint import rbigint
+from rpython.rlib.longlong2float import float2longlong, longlong2float
+
+from pycket.error import SchemeException
+from pycket.env import SymList
+from pycket.interpreter import (Module, Require, Cell, Quote, QuoteSyntax,
+    VariableReference, WithContinuationMark, App, Begin0, Begin, CellRef,
+    LexicalVar, ModuleVar, ToplevelVar, SetBang, If, CaseLambda, Lambda,
+    Letrec, Let, DefineValues, LazyBody)
+from pycket import config
+from pycket import values, values_string, values_regex, values_struct
+from pycket import values_hash
+from pycket import vector
+
+MAGIC = "PYCKETAST"
+FORMAT_VERSION = 3
+
+class BinaryASTError(SchemeException):
+    pass
+
+# ____________________________________________________________
+# node tags
+
+TAG_MODULE            = 1
+TAG_REQUIRE           = 2
+TAG_CELL              = 3
+TAG_QUOTE             = 4
+TAG_QUOTE_SYNTAX      = 5
+TAG_VARIABLE_REF      = 6
+TAG_WCM               = 7
+TAG_APP               = 8
+TAG_BEGIN0            = 9
+TAG_BEGIN             = 10
+TAG_CELL_REF          = 11
+TAG_LEXICAL_VAR       = 12
+TAG_MODULE_VAR        = 13
+TAG_TOPLEVEL_VAR      = 14
+TAG_SET_BANG          = 15
+TAG_IF                = 16
+TAG_CASE_LAMBDA       = 17
+TAG_LAMBDA            = 18
+TAG_LETREC            = 19
+TAG_LET               = 20
+TAG_DEFINE_VALUES     = 21
+
+# value tags
+VAL_FALSE             = 1
+VAL_TRUE              = 2
+VAL_NULL              = 3
+VAL_VOID              = 4
+VAL_FIXNUM            = 5
+VAL_FLONUM            = 6
+VAL_BIGNUM            = 7
+VAL_RATIONAL          = 8
+VAL_COMPLEX           = 9
+VAL_CHAR              = 10
+VAL_STRING            = 11
+VAL_BYTES             = 12
+VAL_SYMBOL            = 13
+VAL_KEYWORD           = 14
+VAL_PAIR              = 15
+VAL_VECTOR            = 16
+VAL_BOX               = 17
+VAL_PATH              = 18
+VAL_HASH              = 19
+VAL_PREFAB            = 20
+VAL_REGEXP            = 21
+VAL_PREGEXP           = 22
+VAL_BYTE_REGEXP       = 23
+VAL_BYTE_PREGEXP      = 24
+
+# symbol kinds
+SYM_INTERNED          = 0
+SYM_UNINTERNED        = 1
+SYM_UNREADABLE        = 2
+
+
+def source_hash(s):
+    """ FNV-1a over the bytes of s. Unlike compute_hash it gives the same
+    result translated and untranslated. """
+    x = intmask(0x811c9dc5)
+    for c in s:
+        x = intmask((x ^ ord(c)) * 16777619)
+    return x
+
+
+def header_flags():
+    flags = 0
+    if config.prune_env:
+        flags |= 1
+    return flags
+
+# ____________________________________________________________
+# encoding
+
+class Output(object):
+    def __init__(self):
+        self.builder = StringBuilder()
+
+    def write_varint(self, u):
+        while u >= r_uint(0x80):
+            self.builder.append(chr(intmask(u & r_uint(0x7f)) | 0x80))
+            u = u >> 7
+        self.builder.append(chr(intmask(u)))
+
+    def write_uint(self, n):
+        assert n >= 0
+        self.write_varint(r_uint(n))
+
+    def write_int(self, n):
+        # zigzag, so that small negative numbers stay small
+        self.write_varint((r_uint(n) << 1) ^ r_uint(n >> (LONG_BIT - 1)))
+
+    def write_bool(self, b):
+        self.builder.append(chr(1) if b else chr(0))
+
+    def write_str(self, s):
+        self.write_uint(len(s))
+        self.builder.append(s)
+
+    def write_float(self, f):
+        ll = float2longlong(f)
+        for i in range(8):
+            self.builder.append(chr(intmask(ll >> (8 * i)) & 0xff))
+
+    def build(self):
+        return self.builder.build()
+
+
+class Encoder(object):
+    def __init__(self):
+        self.strings = []
+        self.string_index = {}
+        self.symbols = []
+        self.symbol_index = {}
+        self.symlists = []
+        self.symlist_index = {}
+        self.constants = Output()
+        self.num_constants = 0
+        self.tree = Output()
+
+    # tables
+
+    def string(self, s):
+        try:
+            return self.string_index[s]
+        except KeyError:
+            index = len(self.strings)
+            self.strings.append(s)
+            self.string_index[s] = index
+            return index
+
+    def symbol(self, w_sym):
+        assert isinstance(w_sym, values.W_Symbol)
+        try:
+            return self.symbol_index[w_sym]
+        except KeyError:
+            index = len(self.symbols)
+            self.symbols.append(w_sym)
+            self.symbol_index[w_sym] = index
+            return index
+
+    def symlist(self, symlist):
+        if symlist is None:
+            return -1
+        try:
+            return self.symlist_index[symlist]
+        except KeyError:
+            pass
+        # make sure the previous structures get the smaller indexes
+        self.symlist(symlist.prev)
+        for w_sym in symlist.elems:
+            self.symbol(w_sym)
+        index = len(self.symlists)
+        self.symlists.append(symlist)
+        self.symlist_index[symlist] = index
+        return index
+
+    def constant(self, w_val):
+        index = self.num_constants
+        self.num_constants += 1
+        self.write_value(self.constants, w_val)
+        return index
+
+    def write_opt_string(self, out, s):
+        if s is None:
+            out.write_int(-1)
+        else:
+            out.write_int(self.string(s))
+
+    def write_symbols(self, out, syms):
+        out.write_uint(len(syms))
+        for w_sym in syms:
+            out.write_uint(self.symbol(w_sym))
+
+    # values
+
+    def write_value(self, out, w_val):
+        if w_val is values.w_false:
+            out.write_uint(VAL_FALSE)
+        elif w_val is values.w_true:
+            out.write_uint(VAL_TRUE)
+        elif w_val is values.w_null:
+            out.write_uint(VAL_NULL)
+        elif w_val is values.w_void:
+            out.write_uint(VAL_VOID)
+        elif isinstance(w_val, values.W_Fixnum):
+            out.write_uint(VAL_FIXNUM)
+            out.write_int(w_val.value)
+        elif isinstance(w_val, values.W_Flonum):
+            out.write_uint(VAL_FLONUM)
+            out.write_float(w_val.value)
+        elif isinstance(w_val, values.W_Bignum):
+            out.write_uint(VAL_BIGNUM)
+            out.write_str(w_val.value.str())
+        elif isinstance(w_val, values.W_Rational):
+            out.write_uint(VAL_RATIONAL)
+            out.write_str(w_val._numerator.str())
+            out.write_str(w_val._denominator.str())
+        elif isinstance(w_val, values.W_Complex):
+            out.write_uint(VAL_COMPLEX)
+            self.write_value(out, w_val.real)
+            self.write_value(out, w_val.imag)
+        elif isinstance(w_val, values.W_Character):
+            out.write_uint(VAL_CHAR)
+            out.write_uint(ord(w_val.value))
+        elif isinstance(w_val, values_string.W_String):
+            out.write_uint(VAL_STRING)
+            out.write_str(w_val.as_str_utf8())
+        elif isinstance(w_val, values.W_Bytes):
+            out.write_uint(VAL_BYTES)
+            out.write_str(w_val.as_str())
+        elif isinstance(w_val, values.W_Symbol):
+            out.write_uint(VAL_SYMBOL)
+            out.write_uint(self.symbol(w_val))
+        elif isinstance(w_val, values.W_Keyword):
+            out.write_uint(VAL_KEYWORD)
+            out.write_str(w_val.value)
+        elif isinstance(w_val, values.W_Cons):
+            out.write_uint(VAL_PAIR)
+            self.write_value(out, w_val.car())
+            self.write_value(out, w_val.cdr())
+        elif isinstance(w_val, vector.W_Vector):
+            out.write_uint(VAL_VECTOR)
+            out.write_uint(w_val.length())
+            for i in range(w_val.length()):
+                self.write_value(out, w_val.ref(i))
+        elif isinstance(w_val, values.W_IBox):
+            out.write_uint(VAL_BOX)
+            self.write_value(out, w_val.value)
+        elif isinstance(w_val, values.W_Path):
+            out.write_uint(VAL_PATH)
+            out.write_str(w_val.path)
+        elif isinstance(w_val, (values_hash.W_EqualHashTable,
+                                values_hash.W_ImmutableEqualHashTable)):
+            out.write_uint(VAL_HASH)
+            items = w_val.hash_items()
+            out.write_uint(len(items))
+            for w_k, w_v in items:
+                self.write_value(out, w_k)
+                self.write_value(out, w_v)
+        elif isinstance(w_val, values_struct.W_Struct):
+            w_type = w_val.struct_type()
+            if not w_type.isprefab:
+                raise BinaryASTError("can't serialize struct %s" % w_val.tostring())
+            out.write_uint(VAL_PREFAB)
+            key = values_struct.W_PrefabKey.from_struct_type(w_type).key()
+            self.write_value(out, values.to_list(key))
+            fields = w_val.vals()
+            out.write_uint(len(fields))
+            for w_field in fields:
+                if isinstance(w_field, values.W_Cell):
+                    w_field = w_field.get_val()
+                self.write_value(out, w_field)
+        elif isinstance(w_val, values_regex.W_AnyRegexp):
+            if isinstance(w_val, values_regex.W_PRegexp):
+                out.write_uint(VAL_PREGEXP)
+            elif isinstance(w_val, values_regex.W_ByteRegexp):
+                out.write_uint(VAL_BYTE_REGEXP)
+            elif isinstance(w_val, values_regex.W_BytePRegexp):
+                out.write_uint(VAL_BYTE_PREGEXP)
+            else:
+                out.write_uint(VAL_REGEXP)
+            out.write_str(w_val.source)
+        else:
+            raise BinaryASTError("can't serialize value %s" % w_val.tostring())
+
+    # asts
+
+    def write_module(self, module):
+        out = self.tree
+        out.write_uint(TAG_MODULE)
+        out.write_uint(self.string(module.name))
+        out.write_uint(len(module.config))
+        for k, v in module.config.iteritems():
+            out.write_uint(self.string(k))
+            out.write_uint(self.string(v))
+        self.write_asts(module.body)
+
+    def write_asts(self, asts):
+        self.tree.write_uint(len(asts))
+        for ast in asts:
+            self.write_ast(ast)
+
+    def write_ast(self, ast):
+        out = self.tree
+        if isinstance(ast, Require):
+            out.write_uint(TAG_REQUIRE)
+            out.write_uint(self.string(ast.modname))
+        elif isinstance(ast, Cell):
+            out.write_uint(TAG_CELL)
+            out.write_uint(len(ast.need_cell_flags))
+            for flag in ast.need_cell_flags:
+                out.write_bool(flag)
+            self.write_ast(ast.expr)
+        elif isinstance(ast, Quote):
+            out.write_uint(TAG_QUOTE)
+            out.write_uint(self.constant(ast.w_val))
+        elif isinstance(ast, QuoteSyntax):
+            out.write_uint(TAG_QUOTE_SYNTAX)
+            out.write_uint(self.constant(ast.w_val))
+        elif isinstance(ast, VariableReference):
+            out.write_uint(TAG_VARIABLE_REF)
+            self.write_opt_string(out, ast.path)
+            out.write_bool(ast.is_mut)
+            if ast.var is None:
+                out.write_bool(False)
+            else:
+                out.write_bool(True)
+                self.write_ast(ast.var)
+        elif isinstance(ast, WithContinuationMark):
+            out.write_uint(TAG_WCM)
+            self.write_ast(ast.key)
+            self.write_ast(ast.value)
+            self.write_ast(ast.body)
+        elif isinstance(ast, App):
+            # covers SimplePrimApp1/2, App.make specializes again
+            out.write_uint(TAG_APP)
+            out.write_int(self.symlist(ast.env_structure))
+            self.write_ast(ast.rator)
+            self.write_asts(ast.rands)
+        elif isinstance(ast, Begin0):
+            out.write_uint(TAG_BEGIN0)
+            self.write_ast(ast.first)
+            self.write_ast(ast.body)
+        elif isinstance(ast, Begin):
+            out.write_uint(TAG_BEGIN)
+            self.write_asts(ast.body)
+        elif isinstance(ast, CellRef):
+            out.write_uint(TAG_CELL_REF)
+            out.write_uint(self.symbol(ast.sym))
+            out.write_int(self.symlist(ast.env_structure))
+        elif isinstance(ast, LexicalVar):
+            out.write_uint(TAG_LEXICAL_VAR)
+            out.write_uint(self.symbol(ast.sym))
+            out.write_int(self.symlist(ast.env_structure))
+        elif isinstance(ast, ModuleVar):
+            out.write_uint(TAG_MODULE_VAR)
+            out.write_uint(self.symbol(ast.sym))
+            self.write_opt_string(out, ast.srcmod)
+            out.write_uint(self.symbol(ast.srcsym))
+        elif isinstance(ast, ToplevelVar):
+            out.write_uint(TAG_TOPLEVEL_VAR)
+            out.write_uint(self.symbol(ast.sym))
+            out.write_int(self.symlist(ast.env_structure))
+        elif isinstance(ast, SetBang):
+            out.write_uint(TAG_SET_BANG)
+            self.write_ast(ast.var)
+            self.write_ast(ast.rhs)
+        elif isinstance(ast, If):
+            out.write_uint(TAG_IF)
+            self.write_ast(ast.tst)
+            self.write_ast(ast.thn)
+            self.write_ast(ast.els)
+        elif isinstance(ast, CaseLambda):
+            out.write_uint(TAG_CASE_LAMBDA)
+            if ast.recursive_sym is None:
+                out.write_int(-1)
+            else:
+                out.write_int(self.symbol(ast.recursive_sym))
+            out.write_uint(len(ast.lams))
+            for lam in ast.lams:
+                self.write_ast(lam)
+        elif isinstance(ast, Lambda):
+            out.write_uint(TAG_LAMBDA)
+            self.write_symbols(out, ast.formals)
+            if ast.rest is None:
+                out.write_int(-1)
+            else:
+                out.write_int(self.symbol(ast.rest))
+            out.write_int(self.symlist(ast.args))
+            out.write_int(self.symlist(ast.frees))
+            out.write_int(self.symlist(ast.enclosing_env_structure))
+            out.write_int(self.symlist(ast.env_structure))
+            out.write_int(ast.srcpos)
+            self.write_opt_string(out, ast.srcfile)
+            ast.materialize_body()
+            self.tree = Output()
+            self.write_asts(ast.body)
+            body = self.tree.build()
+            self.tree = out
+            out.write_str(body)
+        elif isinstance(ast, Letrec):
+            out.write_uint(TAG_LETREC)
+            out.write_int(self.symlist(ast.args))
+            self.write_counts(ast.counts)
+            self.write_asts(ast.rhss)
+            self.write_asts(ast.body)
+        elif isinstance(ast, Let):
+            out.write_uint(TAG_LET)
+            out.write_int(self.symlist(ast.args))
+            self.write_counts(ast.counts)
+            self.write_counts(ast.remove_num_envs)
+            self.write_asts(ast.rhss)
+            self.write_asts(ast.body)
+        elif isinstance(ast, DefineValues):
+            out.write_uint(TAG_DEFINE_VALUES)
+            self.write_symbols(out, ast.names)
+            self.write_symbols(out, ast.display_names)
+            self.write_ast(ast.rhs)
+        else:
+            raise BinaryASTError("can't serialize ast %s" % ast.tostring())
+
+    def write_counts(self, counts):
+        self.tree.write_uint(len(counts))
+        for count in counts:
+            self.tree.write_uint(count)
+
+    # putting it together
+
+    def finish(self, source, expanded):
+        out = Output()
+        out.builder.append(MAGIC)
+        out.write_uint(FORMAT_VERSION)
+        out.write_uint(header_flags())
+        out.write_uint(len(source))
+        out.write_int(source_hash(source))
+        out.write_uint(len(expanded))
+        out.write_int(source_hash(expanded))
+
+        out.write_uint(len(self.strings))
+        for s in self.strings:
+            out.write_str(s)
+
+        out.write_uint(len(self.symbols))
+        for w_sym in self.symbols:
+            if w_sym.unreadable:
+                out.write_uint(SYM_UNREADABLE)
+            elif w_sym.is_interned():
+                out.write_uint(SYM_INTERNED)
+            else:
+                out.write_uint(SYM_UNINTERNED)
+            out.write_str(w_sym.utf8value)
+
+        out.write_uint(len(self.symlists))
+        for symlist in self.symlists:
+            out.write_int(self.symlist_index[symlist.prev]
+                          if symlist.prev is not None else -1)
+            out.write_uint(len(symlist.elems))
+            for w_sym in symlist.elems:
+                out.write_uint(self.symbol_index[w_sym])
+
+        constants = self.constants.build()
+        out.write_uint(self.num_constants)
+        out.builder.append(constants)
+
+        out.builder.append(self.tree.build())
+        out.builder.append(MAGIC)
+        return out.build()
+
+
+def dumps(module, source, expanded=""):
+    """ serialize the assign-converted module, source is the content of the
+    file it was expanded from and expanded the JSON it was parsed from """
+    encoder = Encoder()
+    encoder.write_module(module)
+    return encoder.finish(source, expanded)
+
+# ____________________________________________________________
+# decoding
+
+class Decoder(object):
+    def __init__(self, data, modtable):
+        self.data = data
+        self.pos = 0
+        self.modtable = modtable
+        self.strings = []
+        self.symbols = []
+        self.symlists = []
+        self.constants = []
+
+    # primitives
+
+    def read_byte(self):
+        pos = self.pos
+        if pos >= len(self.data):
+            raise BinaryASTError("unexpected end of binary ast")
+        self.pos = pos + 1
+        return ord(self.data[pos])
+
+    def read_varint(self):
+        result = r_uint(0)
+        shift = 0
+        while True:
+            if shift >= LONG_BIT:
+                raise BinaryASTError("integer too large in binary ast")
+            byte = self.read_byte()
+            result |= r_uint(byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def read_uint(self):
+        n = intmask(self.read_varint())
+        if n < 0:
+            raise BinaryASTError("integer too large in binary ast")
+        return n
+
+    def read_int(self):
+        u = self.read_varint()
+        return intmask(u >> 1) ^ -intmask(u & r_uint(1))
+
+    def read_bool(self):
+        return self.read_byte() != 0
+
+    def read_str(self):
+        length = self.read_uint()
+        start = self.pos
+        stop = start + length
+        if stop > len(self.data):
+            raise BinaryASTError("unexpected end of binary ast")
+        assert start >= 0
+        self.pos = stop
+        return self.data[start:stop]
+
+    def read_float(self):
+        ull = r_ulonglong(0)
+        for i in range(8):
+            ull |= r_ulonglong(self.read_byte()) << (8 * i)
+        return longlong2float(longlongmask(ull))
+
+    def read_opt_string(self):
+        index = self.read_int()
+        if index < 0:
+            return None
+        return self.strings[index]
+
+    def read_symbol(self):
+        return self.symbols[self.read_uint()]
+
+    def read_opt_symbol(self):
+        index = self.read_int()
+        if index < 0:
+            return None
+        return self.symbols[index]
+
+    def read_symbols(self):
+        return [self.read_symbol() for i in range(self.read_uint())]
+
+    def read_symlist(self):
+        index = self.read_int()
+        if index < 0:
+            return None
+        return self.symlists[index]
+
+    def read_counts(self):
+        return [self.read_uint() for i in range(self.read_uint())]
+
+    # header and tables
+
+    def read_header(self, source, expanded):
+        """ returns False if the data was written for a different source,
+        expansion or configuration """
+        if not self.data.startswith(MAGIC) or not self.data.endswith(MAGIC):
+            return False
+        self.pos = len(MAGIC)
+        if self.read_uint() != FORMAT_VERSION:
+            return False
+        if self.read_uint() != header_flags():
+            return False
+        if not self.read_key(source):
+            return False
+        return self.read_key(expanded)
+
+    def read_key(self, content):
+        length = self.read_uint()
+        h = self.read_int()
+        if content is None:
+            return True
+        return length == len(content) and h == source_hash(content)
+
+    def read_tables(self):
+        for i in range(self.read_uint()):
+            self.strings.append(self.read_str())
+        for i in range(self.read_uint()):
+            kind = self.read_uint()
+            name = self.read_str()
+            if kind == SYM_INTERNED:
+                w_sym = values.W_Symbol.make(name)
+            elif kind == SYM_UNREADABLE:
+                w_sym = values.W_Symbol.make_unreadable(name)
+            else:
+                w_sym = values.W_Symbol(name.decode("utf-8"))
+            self.symbols.append(w_sym)
+        for i in range(self.read_uint()):
+            prev = self.read_symlist()
+            elems = self.read_symbols()
+            self.symlists.append(SymList(elems, prev))
+        for i in range(self.read_uint()):
+            self.constants.append(self.read_value())
+
+    # values
+
+    def read_value(self):
+        tag = self.read_uint()
+        if tag == VAL_FALSE:
+            return values.w_false
+        if tag == VAL_TRUE:
+            return values.w_true
+        if tag == VAL_NULL:
+            return values.w_null
+        if tag == VAL_VOID:
+            return values.w_void
+        if tag == VAL_FIXNUM:
+            return values.W_Fixnum.make(self.read_int())
+        if tag == VAL_FLONUM:
+            return values.W_Flonum.make(self.read_float())
+        if tag == VAL_BIGNUM:
+            return values.W_Bignum(rbigint.fromdecimalstr(self.read_str()))
+        if tag == VAL_RATIONAL:
+            num = rbigint.fromdecimalstr(self.read_str())
+            den = rbigint.fromdecimalstr(self.read_str())
+            return values.W_Rational.frombigint(num, den)
+        if tag == VAL_COMPLEX:
+            real = self.read_value()
+            imag = self.read_value()
+            assert isinstance(real, values.W_Number)
+            assert isinstance(imag, values.W_Number)
+            return values.W_Complex.make(real, imag)
+        if tag == VAL_CHAR:
+            return values.W_Character.make(unichr(self.read_uint()))
+        if tag == VAL_STRING:
+            return values_string.W_String.make(self.read_str())
+        if tag == VAL_BYTES:
+            return values.W_Bytes.from_string(self.read_str())
+        if tag == VAL_SYMBOL:
+            return self.read_symbol()
+        if tag == VAL_KEYWORD:
+            return values.W_Keyword.make(self.read_str())
+        if tag == VAL_PAIR:
+            w_car = self.read_value()
+            w_cdr = self.read_value()
+            return values.W_Cons.make(w_car, w_cdr)
+        if tag == VAL_VECTOR:
+            elems = [self.read_value() for i in range(self.read_uint())]
+            return vector.W_Vector.fromelements(elems, immutable=True)
+        if tag == VAL_BOX:
+            return values.W_IBox(self.read_value())
+        if tag == VAL_PATH:
+            return values.W_Path(self.read_str())
+        if tag == VAL_HASH:
+            keys = []
+            vals = []
+            for i in range(self.read_uint()):
+                keys.append(self.read_value())
+                vals.append(self.read_value())
+            return values_hash.W_ImmutableEqualHashTable.from_lists(keys, vals)
+        if tag == VAL_PREFAB:
+            w_key = self.read_value()
+            fields = [self.read_value() for i in range(self.read_uint())]
+            return values_struct.W_Struct.make_prefab(w_key, fields)
+        if tag == VAL_REGEXP:
+            return values_regex.W_Regexp(self.read_str())
+        if tag == VAL_PREGEXP:
+            return values_regex.W_PRegexp(self.read_str())
+        if tag == VAL_BYTE_REGEXP:
+            return values_regex.W_ByteRegexp(self.read_str())
+        if tag == VAL_BYTE_PREGEXP:
+            return values_regex.W_BytePRegexp(self.read_str())
+        raise BinaryASTError("unknown value tag %s" % tag)
+
+    # asts
+
+    def read_module(self):
+        if self.read_uint() != TAG_MODULE:
+            raise BinaryASTError("expected a module")
+        name = self.strings[self.read_uint()]
+        mod_config = {}
+        for i in range(self.read_uint()):
+            k = self.strings[self.read_uint()]
+            mod_config[k] = self.strings[self.read_uint()]
+        body = self.read_asts()
+        return Module(name, body, mod_config)
+
+    def read_asts(self):
+        return [self.read_ast() for i in range(self.read_uint())]
+
+    def read_body(self, start, stop):
+        """ the body of a lambda, stored between start and stop """
+        pos = self.pos
+        self.pos = start
+        body = self.read_asts()
+        if self.pos != stop:
+            raise BinaryASTError("bad lambda body in binary ast")
+        self.pos = pos
+        return body
+
+    def read_ast(self):
+        from pycket.expand import _to_require
+        tag = self.read_uint()
+        if tag == TAG_REQUIRE:
+            return _to_require(self.strings[self.read_uint()], self.modtable)
+        if tag == TAG_CELL:
+            flags = [self.read_bool() for i in range(self.read_uint())]
+            return Cell(self.read_ast(), flags)
+        if tag == TAG_QUOTE:
+            return Quote(self.constants[self.read_uint()])
+        if tag == TAG_QUOTE_SYNTAX:
+            return QuoteSyntax(self.constants[self.read_uint()])
+        if tag == TAG_VARIABLE_REF:
+            path = self.read_opt_string()
+            is_mut = self.read_bool()
+            var = self.read_ast() if self.read_bool() else None
+            return VariableReference(var, path, is_mut)
+        if tag == TAG_WCM:
+            key = self.read_ast()
+            value = self.read_ast()
+            body = self.read_ast()
+            return WithContinuationMark(key, value, body)
+        if tag == TAG_APP:
+            env_structure = self.read_symlist()
+            rator = self.read_ast()
+            rands = self.read_asts()
+            return App.make(rator, rands, env_structure)
+        if tag == TAG_BEGIN0:
+            fst = self.read_ast()
+            rst = self.read_ast()
+            return Begin0(fst, rst)
+        if tag == TAG_BEGIN:
+            return Begin(self.read_asts())
+        if tag == TAG_CELL_REF:
+            sym = self.read_symbol()
+            return CellRef(sym, self.read_symlist())
+        if tag == TAG_LEXICAL_VAR:
+            sym = self.read_symbol()
+            return LexicalVar(sym, self.read_symlist())
+        if tag == TAG_MODULE_VAR:
+            sym = self.read_symbol()
+            srcmod = self.read_opt_string()
+            srcsym = self.read_symbol()
+            return ModuleVar(sym, srcmod, srcsym)
+        if tag == TAG_TOPLEVEL_VAR:
+            sym = self.read_symbol()
+            return ToplevelVar(sym, self.read_symlist())
+        if tag == TAG_SET_BANG:
+            var = self.read_ast()
+            rhs = self.read_ast()
+            return SetBang(var, rhs)
+        if tag == TAG_IF:
+            tst = self.read_ast()
+            thn = self.read_ast()
+            els = self.read_ast()
+            return If(tst, thn, els)
+        if tag == TAG_CASE_LAMBDA:
+            recursive_sym = self.read_opt_symbol()
+            lams = []
+            for i in range(self.read_uint()):
+                lam = self.read_ast()
+                assert isinstance(lam, Lambda)
+                lams.append(lam)
+            return CaseLambda(lams, recursive_sym)
+        if tag == TAG_LAMBDA:
+            formals = self.read_symbols()
+            rest = self.read_opt_symbol()
+            args = self.read_symlist()
+            frees = self.read_symlist()
+            enclosing_env_structure = self.read_symlist()
+            env_structure = self.read_symlist()
+            srcpos = self.read_int()
+            srcfile = self.read_opt_string()
+            size = self.read_uint()
+            start = self.pos
+            stop = start + size
+            if stop > len(self.data):
+                raise BinaryASTError("unexpected end of binary ast")
+            if config.lazy_bodies:
+                self.pos = stop
+                body = [LazyBody(self, start, stop)]
+            else:
+                body = self.read_body(start, stop)
+                self.pos = stop
+            return Lambda(formals, rest, args, frees, body, srcpos, srcfile,
+                          enclosing_env_structure, env_structure)
+        if tag == TAG_LETREC:
+            args = self.read_symlist()
+            counts = self.read_counts()
+            rhss = self.read_asts()
+            body = self.read_asts()
+            return Letrec(args, counts, rhss, body)
+        if tag == TAG_LET:
+            args = self.read_symlist()
+            counts = self.read_counts()
+            remove_num_envs = self.read_counts()
+            rhss = self.read_asts()
+            body = self.read_asts()
+            return Let.make(args, counts, rhss, body, remove_num_envs)
+        if tag == TAG_DEFINE_VALUES:
+            names = self.read_symbols()
+            display_names = self.read_symbols()
+            rhs = self.read_ast()
+            return DefineValues(names, rhs, display_names)
+        raise BinaryASTError("unknown ast tag %s" % tag)
+
+
+def loads(data, modtable, source=None, expanded=None):
+    """ the module stored in data, or None if it was written for a different
+    source file content, expanded JSON or pycket configuration """
+    decoder = Decoder(data, modtable)
+    if not decoder.read_header(source, expanded):
+        return None
+    decoder.read_tables()
+    return decoder.read_module()
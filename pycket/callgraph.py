@@ -3,19 +3,35 @@ from rpython.rlib import jit
 # TODO: Find heavily executed lambdas that do not participate in a loop in the
 # callgraph.
 
+class Component(object):
+    """ A strongly connected component of the callgraph. The components are
+    kept in a topological order (see CallGraph.add_edge). """
+    def __init__(self, lam, order):
+        self.members = [lam]
+        self.order = order
+        self.succs = {}
+        self.preds = {}
+        self.recursive = False
+
 class CallGraph(object):
     def __init__(self):
         self.calls     = {}
         self.recursive = {}
+        self.components = {}
+        # the components by their position in the order, with holes where
+        # merged components used to be
+        self.by_order = []
 
     def register_call(self, lam, calling_app, cont, env):
+        """ Returns whether registering the call again can't change anything,
+        as long as it returns to the same AST. """
         if jit.we_are_jitted():
-            return
+            return False
         if not calling_app:
-            return
+            return False
         calling_lam = calling_app.surrounding_lambda
         if not calling_lam:
-            return
+            return True
         subdct = self.calls.get(calling_lam, None)
         if subdct is None:
             self.calls[calling_lam] = subdct = {}
@@ -27,7 +43,8 @@ class CallGraph(object):
         is_recursive = False
         if not lam_in_subdct:
             subdct[lam] = None
-            if self.is_recursive(calling_lam, lam):
+            self.add_edge(calling_lam, lam)
+            if self.is_recursive(calling_lam):
                 is_recursive = True
                 if config.log_callgraph:
                     print "enabling jitting", calling_lam.tostring()
@@ -37,49 +54,145 @@ class CallGraph(object):
         same_lambda = cont_ast and cont_ast.surrounding_lambda is calling_lam
         if same_lambda:
             if lam_in_subdct: # did not call is_recursive yet
-                is_recursive = self.is_recursive(calling_lam, lam)
+                is_recursive = self.is_recursive(calling_lam)
             if is_recursive:
                 if cont_ast.set_should_enter() and config.log_callgraph:
                     print "jitting downrecursion", cont_ast.tostring()
+            # the recursion may only be found later
+            return cont_ast.should_enter
+        return True
 
-    def is_recursive(self, lam, starting_from=None):
-        # quatratic in theory, hopefully not very bad in practice
-        if lam in self.recursive:
-            lam.set_in_cycle()
-            return True
-        if starting_from is None:
-            starting_from = lam
-        reachable = self.calls.get(starting_from, None)
-        if reachable is None:
-            return False
-        todo = []
-        for key in reachable:
-            todo.append((key, Path(starting_from, None)))
-        visited = {}
-        while todo:
-            current, path = todo.pop()
-            if current is lam:
-                lam.set_in_cycle()
-                self.recursive[lam] = None
-                # all the lambdas in the path are recursive too
-                while path:
-                    path.node.set_in_cycle()
-                    self.recursive[path.node] = None
-                    path = path.prev
-                return True
-            if current in visited:
+    def is_recursive(self, lam):
+        """ whether lam is part of a cycle of the callgraph """
+        return lam in self.recursive
+
+    def get_component(self, lam):
+        component = self.components.get(lam, None)
+        if component is None:
+            component = Component(lam, len(self.by_order))
+            self.by_order.append(component)
+            self.components[lam] = component
+        return component
+
+    def add_edge(self, caller, callee):
+        """ Add the edge caller -> callee, merging the components that form a
+        cycle with it. This is the dynamic topological sort of Pearce and
+        Kelly: as long as the edge agrees with the current order of the
+        components nothing needs to be done, otherwise only the components
+        between the two in the order are searched and reordered. """
+        source = self.get_component(caller)
+        target = self.get_component(callee)
+        if source is target:
+            self.mark_recursive(source)
+            return
+        if target in source.succs:
+            return
+        source.succs[target] = None
+        target.preds[source] = None
+        if source.order < target.order:
+            return
+        forward = self.search(target, source.order, True)
+        backward = self.search(source, target.order, False)
+        # walking the affected part of the order collects the components
+        # already sorted, which is cheaper than sorting them afterwards
+        orders = []
+        cycle = []
+        lowers = []
+        uppers = []
+        for order in range(target.order, source.order + 1):
+            component = self.by_order[order]
+            if component is None:
+                continue
+            if component in forward:
+                if component in backward:
+                    cycle.append(component)
+                else:
+                    uppers.append(component)
+            elif component in backward:
+                lowers.append(component)
+            else:
                 continue
-            reachable = self.calls.get(current, None)
-            if reachable:
-                for key in reachable:
-                    todo.append((key, Path(current, path)))
-            visited[current] = None
-        return False
+            orders.append(order)
+            self.by_order[order] = None
+        # the components that reach the caller move before the ones reachable
+        # from the callee, reusing their positions in the order
+        for i in range(len(lowers)):
+            self.place(lowers[i], orders[i])
+        if cycle:
+            self.place(self.merge(cycle), orders[len(lowers)])
+        offset = len(orders) - len(uppers)
+        for i in range(len(uppers)):
+            self.place(uppers[i], orders[offset + i])
 
-class Path(object):
-    def __init__(self, node, prev):
-        self.node = node
-        self.prev = prev
+    def place(self, component, order):
+        component.order = order
+        self.by_order[order] = component
 
-    def __repr__(self):
-        return "%s -> %s" % (self.node, self.prev)
+    def search(self, start, bound, forward):
+        """ the components reachable from start (following the edges backwards
+        if not forward) without leaving the affected region of the order """
+        visited = {start: None}
+        todo = [start]
+        while todo:
+            component = todo.pop()
+            if forward:
+                neighbours = component.succs
+            else:
+                neighbours = component.preds
+            for other in neighbours:
+                if other in visited:
+                    continue
+                if forward and other.order > bound:
+                    continue
+                if not forward and other.order < bound:
+                    continue
+                visited[other] = None
+                todo.append(other)
+        return visited
+
+    def merge(self, cycle):
+        # merge into the biggest component, so that every lambda is moved
+        # only a logarithmic number of times
+        result = cycle[0]
+        merged = {}
+        for component in cycle:
+            merged[component] = None
+            if len(component.members) > len(result.members):
+                result = component
+        succs = result.succs
+        preds = result.preds
+        for component in cycle:
+            if component is result:
+                continue
+            if component in succs:
+                del succs[component]
+            if component in preds:
+                del preds[component]
+            for succ in component.succs:
+                if succ not in merged:
+                    del succ.preds[component]
+                    succ.preds[result] = None
+                    succs[succ] = None
+            for pred in component.preds:
+                if pred not in merged:
+                    del pred.succs[component]
+                    pred.succs[result] = None
+                    preds[pred] = None
+        self.mark_recursive(result)
+        for component in cycle:
+            if component is not result:
+                for lam in component.members:
+                    result.members.append(lam)
+                    self.components[lam] = result
+                    if not component.recursive:
+                        lam.set_in_cycle()
+                        self.recursive[lam] = None
+        return result
+
+    def mark_recursive(self, component):
+        if component.recursive:
+            return
+        component.recursive = True
+        for lam in component.members:
+            lam.set_in_cycle()
+            self.recursive[lam] = None
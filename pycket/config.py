@@ -25,6 +25,14 @@ pycketoption_descr = OptionDescription(
                default=True, cmdline="--type-size-specialization"),
     BoolOption("prune_env", "prune environment",
                default=True, cmdline="--prune-env"),
+    BoolOption("lazy_bodies", "decode the bodies of cached lambdas on first use",
+               default=True, cmdline="--lazy-bodies"),
+    BoolOption("superinstructions", "evaluate lets of simple expressions without continuations",
+               default=True, cmdline="--superinstructions"),
+    BoolOption("escape_analysis", "also evaluate lets of ifs of simple expressions without continuations",
+               default=True, cmdline="--escape-analysis"),
+    BoolOption("fold_constants", "fold constants and inline small functions defined in modules",
+               default=True, cmdline="--fold-constants"),
 ])
 
 def get_testing_config(**overrides):
@@ -47,6 +55,14 @@ def compute_executable_suffix(config):
         res.append("-no-strategies")
     if not config.type_size_specialization:
         res.append("-no-type-size-specialization")
+    if not config.lazy_bodies:
+        res.append("-no-lazy-bodies")
+    if not config.superinstructions:
+        res.append("-no-superinstructions")
+    if not config.escape_analysis:
+        res.append("-no-escape-analysis")
+    if not config.fold_constants:
+        res.append("-no-fold-constants")
     if config.fuse_conts:
         res.append("-fuse-conts")
     if config.track_header:
@@ -65,6 +81,10 @@ def compute_executable_suffix(config):
 exposed_options = ['strategies',
                    'type_size_specialization',
                    'prune_env',
+                   'lazy_bodies',
+                   'superinstructions',
+                   'escape_analysis',
+                   'fold_constants',
 ]
 
 def expose_options(config):
@@ -4,11 +4,15 @@
 # _____ Define and setup target ___
 
 def make_entry_point(pycketconfig=None):
-    from pycket.expand import load_json_ast_rpython, expand_to_ast, PermException, ModTable
+    from pycket.expand import (load_ast_cached, expand_to_ast, PermException,
+                               ModTable, expand_requires_parallel)
     from pycket.interpreter import interpret_one, ToplevelEnv, interpret_module
     from pycket.error import SchemeException
-    from pycket.option_helper import parse_args, ensure_json_ast
+    from pycket.option_helper import parse_args, ensure_json_ast, jobs_option
     from pycket.values_string import W_String
+    from pycket.warmup import warmup_profile
+    from pycket.ast_profiler import ast_profiler
+    from pycket.sampling_profiler import sampling_profiler
 
     from rpython.rlib import jit
 
@@ -30,21 +34,44 @@ def make_entry_point(pycketconfig=None):
             return retval
         args_w = [W_String.fromstr_utf8(arg) for arg in args]
         module_name, json_ast = ensure_json_ast(config, names)
+        if 'warmup-profile' in names:
+            warmup_profile.load(names['warmup-profile'])
         modtable = ModTable()
+        if json_ast is not None:
+            expand_requires_parallel(json_ast, jobs_option(names))
         if json_ast is None:
             ast = expand_to_ast(module_name, modtable)
         else:
-            ast = load_json_ast_rpython(json_ast, modtable)
+            ast = load_ast_cached(module_name, json_ast, modtable)
         env = ToplevelEnv(pycketconfig)
         env.globalconfig.load(ast)
         env.commandline_arguments = args_w
         env.module_env.add_module(module_name, ast)
+        if 'profile-ast' in names:
+            ast_profiler.start()
+        if 'profile-sample' in names:
+            sampling_profiler.start()
         try:
             val = interpret_module(ast, env)
         finally:
+            if 'profile-sample' in names:
+                sampling_profiler.dump(names['profile-sample'])
             from pycket.prims.input_output import shutdown
             shutdown(env)
+            if 'warmup-profile' in names:
+                warmup_profile.dump(names['warmup-profile'],
+                                    env.module_env.modules.values())
+            if 'profile-ast' in names:
+                report_ast_profile(env, names['profile-ast'])
         return 0
+
+    def report_ast_profile(env, json_file):
+        from pycket.expand import writefile_rpython
+        profile = ast_profiler.finish(env.module_env.modules.values())
+        print profile.report()
+        if json_file:
+            writefile_rpython(json_file, profile.tojson().tostring())
+
     return entry_point
 
 def target(driver, args): #pragma: no cover
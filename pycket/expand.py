@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 #
 import os
+import stat
 import sys
 
-from rpython.rlib import streamio
+from rpython.rlib import streamio, rsocket
 from rpython.rlib.rbigint import rbigint
 from rpython.rlib.objectmodel import specialize, we_are_translated
 from rpython.rlib.rstring import ParseStringError, ParseStringOverflowError
@@ -39,6 +40,11 @@ def readfile_rpython(fname):
     f.close()
     return s
 
+def writefile_rpython(fname, s):
+    f = streamio.open_file_as_stream(fname, "w")
+    f.write(s)
+    f.close()
+
 
 #### ========================== Functions for expanding code to json
 
@@ -90,6 +96,124 @@ def expand_file(fname):
         raise ExpandException("Racket produced an error")
     return data
 
+# A client for a running `racket -l pycket/expand -- --server <socket>`.
+# Expanding through the server saves the startup of Racket and of the
+# expander for every module; the connection is kept open for the whole run.
+# If there is no server, the expand functions below start a racket process
+# per file, as before.
+
+def _expander_socket_name():
+    name = os.environ.get("PYCKET_EXPAND_SOCKET")
+    if name is None:
+        directory = os.environ.get("XDG_RUNTIME_DIR")
+        if not directory:
+            directory = "/tmp/pycket-%d" % os.getuid()
+        name = directory + "/pycket-expand.sock"
+    return name
+
+def _owned_and_private(st):
+    return st.st_uid == os.getuid() and not st.st_mode & 0022
+
+def _private_socket(name):
+    """ whether name is a socket of the current user in a directory that
+    only the user can write to. Anybody else could answer the requests with
+    code that pycket runs. """
+    index = name.rfind("/")
+    if index < 0:
+        directory = "."
+    elif index == 0:
+        directory = "/"
+    else:
+        directory = name[:index]
+    try:
+        st = os.lstat(name)
+        dir_st = os.lstat(directory)
+    except OSError:
+        return False
+    return (stat.S_ISSOCK(st.st_mode) and _owned_and_private(st) and
+            stat.S_ISDIR(dir_st.st_mode) and _owned_and_private(dir_st))
+
+class ExpanderDaemon(object):
+    def __init__(self):
+        self.sock = None
+        self.buffer = ""
+        self.disabled = False
+
+    def connect(self):
+        if self.sock is not None:
+            return True
+        if self.disabled or not rsocket.HAS_AF_UNIX:
+            return False
+        name = _expander_socket_name()
+        if not name or not _private_socket(name):
+            self.disabled = True
+            return False
+        sock = rsocket.RSocket(rsocket.AF_UNIX, rsocket.SOCK_STREAM)
+        try:
+            sock.connect(rsocket.UNIXAddress(name))
+        except rsocket.SocketError:
+            sock.close()
+            self.disabled = True
+            return False
+        self.sock = sock
+        self.buffer = ""
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.buffer = ""
+
+    def _fill(self):
+        assert self.sock is not None
+        data = self.sock.recv(65536)
+        if not data:
+            raise rsocket.RSocketError("expander closed the connection")
+        self.buffer += data
+
+    def _read_line(self):
+        while True:
+            index = self.buffer.find("\n")
+            if index >= 0:
+                line = self.buffer[:index]
+                self.buffer = self.buffer[index + 1:]
+                return line
+            self._fill()
+
+    def _read_bytes(self, n):
+        while len(self.buffer) < n:
+            self._fill()
+        assert n >= 0
+        data = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return data
+
+    def expand(self, rkt_file):
+        """ the JSON for rkt_file, or None if no expander server is available """
+        if not self.connect():
+            return None
+        assert self.sock is not None
+        path = os.path.abspath(rkt_file)
+        try:
+            self.sock.sendall("expand %d\n%s" % (len(path), path))
+            header = self._read_line()
+            index = header.find(" ")
+            if index < 0:
+                raise rsocket.RSocketError("bad response from expander")
+            kind = header[:index]
+            data = self._read_bytes(string_to_int(header[index + 1:]))
+        except (rsocket.SocketError, ParseStringError, ParseStringOverflowError):
+            # the server went away, don't try again
+            self.close()
+            self.disabled = True
+            return None
+        if kind != "ok":
+            raise ExpandException("Racket produced an error and said '%s'" % data)
+        return data
+
+expander_daemon = ExpanderDaemon()
+
 # Call the Racket expander and read its output from STDOUT rather than producing an
 # intermediate (possibly cached) file.
 def expand_file_rpython(rkt_file):
@@ -97,6 +221,9 @@ def expand_file_rpython(rkt_file):
     cmd = "racket %s --stdout \"%s\" 2>&1" % (fn, rkt_file)
     if not os.access(rkt_file, os.R_OK):
         raise ValueError("Cannot access file %s" % rkt_file)
+    data = expander_daemon.expand(rkt_file)
+    if data is not None:
+        return data
     pipe = create_popen_file(cmd, "r")
     out = pipe.read()
     err = os.WEXITSTATUS(pipe.close())
@@ -109,12 +236,12 @@ def expand_file_cached(rkt_file, modtable):
         json_file = ensure_json_ast_run(rkt_file)
     except PermException:
         return expand_to_ast(rkt_file, modtable)
-    return load_json_ast_rpython(json_file, modtable)
+    return load_ast_cached(rkt_file, json_file, modtable)
 
 # Expand and load the module without generating intermediate JSON files.
 def expand_to_ast(fname, modtable):
     data = expand_file_rpython(fname)
-    return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
+    return _read_module(data, modtable).assign_convert_module()
 
 def expand(s, wrap=False, stdlib=False):
     data = expand_string(s)
@@ -159,6 +286,10 @@ def _expand_file_to_json(rkt_file, json_file):
     except OSError:
         pass
     print "Expanding %s to %s" % (rkt_file, json_file)
+    data = expander_daemon.expand(rkt_file)
+    if data is not None:
+        writefile_rpython(json_file, data)
+        return json_file
     cmd = "racket %s --output \"%s\" \"%s\" 2>&1" % (
         fn,
         json_file, rkt_file)
@@ -214,6 +345,222 @@ def ensure_json_ast_run(file_name):
     else:
         return json
 
+#### ========================== Expanding required modules in parallel
+
+# The expander writes the module paths of requires as {"require":[...]}
+# objects and the language as "language":"...". Finding those by searching the
+# text is much cheaper than parsing the JSON, and can't be fooled by the
+# contents of string literals, where the quotes would be escaped.
+_REQUIRE_KEY = '{"require":['
+_LANGUAGE_KEY = '"language":'
+
+def _scan_json_string(data, start):
+    """ returns the string starting with the quote at data[start] and the
+    position after it """
+    pos = start + 1
+    while pos < len(data) and data[pos] != '"':
+        if data[pos] == '\\':
+            pos += 1
+        pos += 1
+    stop = pos + 1
+    assert stop >= 0
+    raw = data[start:stop]
+    if '\\' in raw:
+        return pycket_json.loads(raw).value_string(), stop
+    return raw[1:-1], stop
+
+def json_requires(data):
+    """ the module files required by the expanded module in data """
+    result = []
+    pos = data.find(_LANGUAGE_KEY)
+    if pos >= 0:
+        pos += len(_LANGUAGE_KEY)
+        if pos < len(data) and data[pos] == '"':
+            fname, pos = _scan_json_string(data, pos)
+            result.append(fname)
+    pos = data.find(_REQUIRE_KEY)
+    while pos >= 0:
+        pos += len(_REQUIRE_KEY)
+        while pos < len(data) and data[pos] == '"':
+            fname, pos = _scan_json_string(data, pos)
+            result.append(fname)
+            if pos < len(data) and data[pos] == ',':
+                pos += 1
+        pos = data.find(_REQUIRE_KEY, pos)
+    return [fname for fname in result if fname and not fname.startswith("#%")]
+
+def _count_cpu_list(s):
+    """ the number of processors in a list like 0-3,8,10-11 """
+    count = 0
+    for part in s.strip().split(","):
+        if not part:
+            continue
+        index = part.find("-")
+        try:
+            if index < 0:
+                string_to_int(part)
+                count += 1
+            else:
+                first = string_to_int(part[:index])
+                last = string_to_int(part[index + 1:])
+                count += max(last - first + 1, 0)
+        except (ParseStringError, ParseStringOverflowError):
+            return 0
+    return count
+
+def _allowed_cpus(status):
+    """ the number of processors the process may run on, from the
+    Cpus_allowed_list of /proc/self/status, 0 if it is not there """
+    key = "Cpus_allowed_list:"
+    pos = status.find(key)
+    if pos < 0:
+        return 0
+    end = status.find("\n", pos)
+    if end < 0:
+        end = len(status)
+    start = pos + len(key)
+    assert end >= start
+    return _count_cpu_list(status[start:end])
+
+def _cgroup_cpus(cpu_max):
+    """ the processors the quota in the cpu.max of a cgroup allows, rounded
+    up, 0 if there is no limit """
+    parts = cpu_max.strip().split(" ")
+    if len(parts) != 2 or parts[0] == "max":
+        return 0
+    try:
+        quota = string_to_int(parts[0])
+        period = string_to_int(parts[1])
+    except (ParseStringError, ParseStringOverflowError):
+        return 0
+    if quota <= 0 or period <= 0:
+        return 0
+    return (quota + period - 1) // period
+
+def _count_processors(cpuinfo):
+    count = 0
+    pos = 0
+    while True:
+        pos = cpuinfo.find("processor", pos)
+        if pos < 0:
+            break
+        if pos == 0 or cpuinfo[pos - 1] == '\n':
+            count += 1
+        pos += 1
+    return count
+
+def _read_proc(fname):
+    try:
+        return readfile_rpython(fname)
+    except OSError:
+        return ""
+
+def cpu_count():
+    """ the number of processors this process can use, honouring its CPU
+    affinity and a cgroup (v2) quota. This reads the Linux /proc and /sys
+    files, elsewhere it is 1. """
+    count = _allowed_cpus(_read_proc("/proc/self/status"))
+    if count == 0:
+        count = _count_processors(_read_proc("/proc/cpuinfo"))
+    limit = _cgroup_cpus(_read_proc("/sys/fs/cgroup/cpu.max"))
+    if limit > 0 and limit < count:
+        count = limit
+    return max(count, 1)
+
+def _find_executable(name):
+    """ the path of the program name in $PATH, like execvp does, or None """
+    path = os.environ.get("PATH")
+    if path is None:
+        path = "/bin:/usr/bin"
+    for directory in path.split(":"):
+        if not directory:
+            directory = "."
+        fname = directory + "/" + name
+        if os.access(fname, os.X_OK):
+            return fname
+    return None
+
+def _spawn_expander(rkt_file, json_file):
+    print "Expanding %s to %s" % (rkt_file, json_file)
+    # the file names go to racket as they are, without a shell
+    racket = _find_executable("racket")
+    args = ["racket", "-l", "pycket/expand", "--",
+            "--output", json_file, rkt_file]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            if racket is not None:
+                # errors are reported when the module is loaded, which
+                # expands it again
+                null = os.open("/dev/null", os.O_WRONLY, 0)
+                os.dup2(null, 1)
+                os.dup2(null, 2)
+                os.execv(racket, args)
+        finally:
+            os._exit(127)
+    return pid
+
+def _wait_expander(pids, block):
+    """ wait for one of the expanders in pids, which maps their pids to the
+    files they expand, and remove it. Returns the pid, or 0 if none has
+    finished and block is false. """
+    for pid in pids.keys():
+        options = 0 if block else os.WNOHANG
+        finished, status = os.waitpid(pid, options)
+        if finished == 0:
+            continue
+        rkt_file = pids[pid]
+        del pids[pid]
+        if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+            # the JSON may be partial, the module is expanded again when it
+            # is loaded, which reports the error
+            print "Expanding %s failed" % rkt_file
+            try:
+                os.unlink(_json_name(rkt_file))
+            except OSError:
+                pass
+        return pid
+    return 0
+
+def expand_files_parallel(rkt_files, jobs):
+    """ expand rkt_files to JSON, running up to jobs racket processes at once.
+    Only the started processes are waited for. """
+    pids = {}
+    index = 0
+    while index < len(rkt_files) or pids:
+        while len(pids) < jobs and index < len(rkt_files):
+            rkt_file = rkt_files[index]
+            index += 1
+            pids[_spawn_expander(rkt_file, _json_name(rkt_file))] = rkt_file
+        if _wait_expander(pids, False) == 0:
+            _wait_expander(pids, True)
+
+def expand_requires_parallel(json_file, jobs=0):
+    """ Expand all out of date modules required, transitively, by the module
+    in json_file, up to jobs (or one per processor) at a time. Loading the
+    module afterwards doesn't have to wait for Racket anymore. """
+    if jobs <= 0:
+        jobs = cpu_count()
+    if jobs <= 1:
+        return
+    seen = {}
+    todo = json_requires(readfile_rpython(json_file))
+    while todo:
+        level = []
+        for fname in todo:
+            if fname not in seen:
+                seen[fname] = None
+                level.append(fname)
+        stale = [fname for fname in level
+                     if os.access(fname, os.W_OK) and
+                        needs_update(fname, _json_name(fname))]
+        expand_files_parallel(stale, jobs)
+        todo = []
+        for fname in level:
+            json = _json_name(fname)
+            if os.access(json, os.R_OK):
+                todo.extend(json_requires(readfile_rpython(json)))
+
 def ensure_json_ast_load(file_name):
     return ensure_json_ast_run(file_name)
 
@@ -229,11 +576,49 @@ def ensure_json_ast_eval(code, file_name, stdlib=True, mcons=False, wrap=True):
 
 def load_json_ast(fname):
     data = readfile(fname)
-    return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
+    return _read_module(data, modtable).assign_convert_module()
 
 def load_json_ast_rpython(fname, modtable):
     data = readfile_rpython(fname)
-    return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
+    return _read_module(data, modtable).assign_convert_module()
+
+def _bin_name(file_name):
+    return file_name + '.bin'
+
+def load_ast_cached(rkt_file, json_file, modtable):
+    """ Load the module expanded from rkt_file. The assign-converted module is
+    cached in binary form next to rkt_file and used as long as rkt_file and
+    json_file have the same content, otherwise json_file is parsed and the
+    cache rewritten. Only .rkt sources are cached.
+    """
+    from pycket import binary_ast
+    if not rkt_file.endswith(".rkt") or not os.access(rkt_file, os.R_OK):
+        return load_json_ast_rpython(json_file, modtable)
+    source = readfile_rpython(rkt_file)
+    expanded = readfile_rpython(json_file)
+    bin_file = _bin_name(rkt_file)
+    if os.access(bin_file, os.R_OK):
+        module = None
+        try:
+            module = binary_ast.loads(readfile_rpython(bin_file), modtable,
+                                      source, expanded)
+        except binary_ast.BinaryASTError:
+            pass
+        except OSError:
+            pass
+        if module is not None:
+            return module
+    module = _read_module(expanded, modtable).assign_convert_module()
+    try:
+        data = binary_ast.dumps(module, source, expanded)
+        tmp_file = bin_file + ".tmp"
+        writefile_rpython(tmp_file, data)
+        os.rename(tmp_file, bin_file)
+    except binary_ast.BinaryASTError:
+        pass
+    except OSError:
+        pass
+    return module
 
 def parse_ast(json_string):
     json = pycket_json.loads(json_string)
@@ -241,14 +626,13 @@ def parse_ast(json_string):
     return to_ast(json, modtable)
 
 def parse_module(json_string):
-    json = pycket_json.loads(json_string)
     modtable = ModTable()
-    return _to_module(json, modtable).assign_convert_module()
+    return _read_module(json_string, modtable).assign_convert_module()
 
 
 def to_ast(json, modtable):
     ast = _to_ast(json, modtable)
-    return ast.assign_convert(variable_set(), None)
+    return ast.assign_convert(variable_set(), None, None)
 
 
 #### ========================== Implementation functions
@@ -321,6 +705,51 @@ def _to_module(json, modtable):
     else:
         assert 0
 
+def _read_module(data, modtable):
+    """ Like _to_module(pycket_json.loads(data), modtable), but the body forms
+    are converted one at a time while parsing, so that the JSON of the whole
+    module never has to be in memory. """
+    parser = pycket_json.JsonPullParser(data)
+    parser.start_object()
+    name = None
+    config = {}
+    lang = []
+    seen_lang = False
+    body = []
+    json_body = None
+    seen_body = False
+    while True:
+        key = parser.next_key()
+        if key is None:
+            break
+        if key == "module-name":
+            name = parser.read_value().value_string()
+        elif key == "language":
+            l = parser.read_value().value_string()
+            if l != "":
+                lang = [_to_require(l, modtable)]
+            seen_lang = True
+        elif key == "config":
+            for (k, _v) in parser.read_value().value_object().iteritems():
+                config[k] = _v.value_string()
+        elif key == "body-forms":
+            seen_body = True
+            if seen_lang:
+                parser.start_array()
+                while parser.next_item():
+                    body.append(_to_ast(parser.read_value(), modtable))
+            else:
+                # the language has to be required first
+                json_body = parser.read_value()
+        else:
+            parser.skip_value()
+    parser.finish()
+    if json_body is not None:
+        body = [_to_ast(x, modtable) for x in json_body.value_array()]
+    if name is None or not seen_body:
+        assert 0
+    return Module(name, lang + body, config)
+
 # A table listing all the module files that have been loaded.
 # A module need only be loaded once.
 # Modules (aside from builtins like #%kernel) are listed in the table
@@ -356,7 +785,7 @@ class ModTable(object):
 
 def _to_require(fname, modtable):
     if modtable.has_module(fname):
-        return Quote(values.w_void)
+        return Require(fname, None)
     modtable.add_module(fname)
     modtable.push(fname)
     module = expand_file_cached(fname, modtable)
@@ -574,7 +1003,7 @@ def to_value(json):
         if "char" in obj:
             return values.W_Character.make(unichr(int(obj["char"].value_string())))
         if "hash-keys" in obj and "hash-vals" in obj:
-            return values_hash.W_EqualHashTable(
+            return values_hash.W_ImmutableEqualHashTable.from_lists(
                     [to_value(i) for i in obj["hash-keys"].value_array()],
                     [to_value(i) for i in obj["hash-vals"].value_array()])
         if "regexp" in obj:
@@ -0,0 +1,277 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Persistent hash maps as hash array mapped tries (Bagwell, "Ideal Hash
+# Trees"). Every level of the trie consumes BITS bits of the hash, a node
+# only stores the children that exist and finds them with a bitmap. Adding or
+# removing a key copies the nodes on the path to it, at most
+# HASH_BITS / BITS of them with at most 32 children each; the rest of the
+# trie is shared between the old and the new map.
+#
+# The maps are parametrized by the key comparison only. The callers pass the
+# hash of the key to every operation, so that keys can be compared in
+# different ways than they are hashed (see ImmutableObjectHashmapStrategy).
+#
+from rpython.rlib.rarithmetic import intmask, r_uint
+
+BITS = 5
+MASK = (1 << BITS) - 1
+# only the lower HASH_BITS of the hashes are used, keys that agree on them
+# end up in a collision node
+HASH_BITS = 30
+HASH_MASK = (1 << HASH_BITS) - 1
+
+def bit_count(x):
+    x = x - ((x >> 1) & r_uint(0x55555555))
+    x = (x & r_uint(0x33333333)) + ((x >> 2) & r_uint(0x33333333))
+    x = (x + (x >> 4)) & r_uint(0x0f0f0f0f)
+    return intmask(((x * r_uint(0x01010101)) & r_uint(0xffffffff)) >> 24)
+
+def bit_for(h, shift):
+    return r_uint(1) << ((h >> shift) & MASK)
+
+class Added(object):
+    """ set by assoc when the key was not in the map yet """
+    def __init__(self):
+        self.added = False
+
+def make_persistent_map(name, eq_key):
+    """ A persistent map class whose keys are compared with eq_key. """
+
+    class Node(object):
+        _attrs_ = []
+        _settled_ = True
+
+        def find(self, key, h, shift):
+            """ the leaf of key, or None """
+            raise NotImplementedError("abstract base class")
+
+        def assoc(self, leaf, shift, added):
+            raise NotImplementedError("abstract base class")
+
+        def without(self, key, h, shift):
+            """ the node without key, None if it became empty """
+            raise NotImplementedError("abstract base class")
+
+        def with_hash(self, h, shift, result):
+            """ add the leaves whose keys have the hash h to result """
+            raise NotImplementedError("abstract base class")
+
+        def collect(self, result):
+            raise NotImplementedError("abstract base class")
+
+    class HashNode(Node):
+        """ a node whose keys all have the same hash, it can be anywhere on
+        the path of that hash """
+        _attrs_ = _immutable_fields_ = ["hash"]
+
+    class Leaf(HashNode):
+        _attrs_ = _immutable_fields_ = ["key", "val"]
+
+        def __init__(self, key, h, val):
+            self.key = key
+            self.hash = h
+            self.val = val
+
+        def find(self, key, h, shift):
+            if self.hash == h and eq_key(self.key, key):
+                return self
+            return None
+
+        def assoc(self, leaf, shift, added):
+            if self.hash != leaf.hash:
+                added.added = True
+                return pair_node(self, leaf, shift)
+            if eq_key(self.key, leaf.key):
+                return leaf
+            added.added = True
+            return Collision(self.hash, [self, leaf])
+
+        def without(self, key, h, shift):
+            if self.hash == h and eq_key(self.key, key):
+                return None
+            return self
+
+        def with_hash(self, h, shift, result):
+            if self.hash == h:
+                result.append(self)
+
+        def collect(self, result):
+            result.append(self)
+
+    class Collision(HashNode):
+        _attrs_ = _immutable_fields_ = ["leaves[*]"]
+
+        def __init__(self, h, leaves):
+            self.hash = h
+            self.leaves = leaves
+
+        def index(self, key):
+            for i in range(len(self.leaves)):
+                if eq_key(self.leaves[i].key, key):
+                    return i
+            return -1
+
+        def find(self, key, h, shift):
+            if self.hash != h:
+                return None
+            i = self.index(key)
+            if i < 0:
+                return None
+            return self.leaves[i]
+
+        def assoc(self, leaf, shift, added):
+            if self.hash != leaf.hash:
+                added.added = True
+                return pair_node(self, leaf, shift)
+            i = self.index(leaf.key)
+            if i < 0:
+                added.added = True
+                return Collision(self.hash, self.leaves + [leaf])
+            leaves = self.leaves[:]
+            leaves[i] = leaf
+            return Collision(self.hash, leaves)
+
+        def without(self, key, h, shift):
+            if self.hash != h:
+                return self
+            i = self.index(key)
+            if i < 0:
+                return self
+            if len(self.leaves) == 2:
+                return self.leaves[1 - i]
+            return Collision(self.hash, self.leaves[:i] + self.leaves[i + 1:])
+
+        def with_hash(self, h, shift, result):
+            if self.hash == h:
+                result.extend(self.leaves)
+
+        def collect(self, result):
+            result.extend(self.leaves)
+
+    class Bitmap(Node):
+        _attrs_ = _immutable_fields_ = ["bitmap", "children[*]"]
+
+        def __init__(self, bitmap, children):
+            self.bitmap = bitmap
+            self.children = children
+
+        def index(self, bit):
+            i = bit_count(self.bitmap & (bit - 1))
+            assert i >= 0
+            return i
+
+        def find(self, key, h, shift):
+            bit = bit_for(h, shift)
+            if not self.bitmap & bit:
+                return None
+            return self.children[self.index(bit)].find(key, h, shift + BITS)
+
+        def assoc(self, leaf, shift, added):
+            bit = bit_for(leaf.hash, shift)
+            i = self.index(bit)
+            if not self.bitmap & bit:
+                added.added = True
+                children = self.children[:i] + [leaf] + self.children[i:]
+                return Bitmap(self.bitmap | bit, children)
+            children = self.children[:]
+            children[i] = children[i].assoc(leaf, shift + BITS, added)
+            return Bitmap(self.bitmap, children)
+
+        def without(self, key, h, shift):
+            bit = bit_for(h, shift)
+            if not self.bitmap & bit:
+                return self
+            i = self.index(bit)
+            child = self.children[i]
+            new_child = child.without(key, h, shift + BITS)
+            if new_child is child:
+                return self
+            if new_child is None:
+                if len(self.children) == 1:
+                    return None
+                if len(self.children) == 2:
+                    other = self.children[1 - i]
+                    if isinstance(other, HashNode):
+                        return other
+                return Bitmap(self.bitmap & ~bit,
+                              self.children[:i] + self.children[i + 1:])
+            if len(self.children) == 1 and isinstance(new_child, HashNode):
+                return new_child
+            children = self.children[:]
+            children[i] = new_child
+            return Bitmap(self.bitmap, children)
+
+        def with_hash(self, h, shift, result):
+            bit = bit_for(h, shift)
+            if self.bitmap & bit:
+                self.children[self.index(bit)].with_hash(h, shift + BITS, result)
+
+        def collect(self, result):
+            for child in self.children:
+                child.collect(result)
+
+    def pair_node(node, leaf, shift):
+        """ the node containing two nodes with different hashes """
+        assert isinstance(node, HashNode)
+        bit1 = bit_for(node.hash, shift)
+        bit2 = bit_for(leaf.hash, shift)
+        if bit1 == bit2:
+            return Bitmap(bit1, [pair_node(node, leaf, shift + BITS)])
+        if bit1 < bit2:
+            return Bitmap(bit1 | bit2, [node, leaf])
+        return Bitmap(bit1 | bit2, [leaf, node])
+
+    class PersistentMap(object):
+        _immutable_fields_ = ["root", "size"]
+
+        def __init__(self, root, size):
+            self.root = root
+            self.size = size
+
+        def find(self, key, h):
+            if self.root is None:
+                return None
+            return self.root.find(key, h & HASH_MASK, 0)
+
+        def get(self, key, h, default):
+            leaf = self.find(key, h)
+            if leaf is None:
+                return default
+            return leaf.val
+
+        def assoc(self, key, h, val):
+            leaf = Leaf(key, h & HASH_MASK, val)
+            if self.root is None:
+                return PersistentMap(leaf, 1)
+            added = Added()
+            root = self.root.assoc(leaf, 0, added)
+            return PersistentMap(root, self.size + 1 if added.added else self.size)
+
+        def without(self, key, h):
+            if self.root is None:
+                return self
+            root = self.root.without(key, h & HASH_MASK, 0)
+            if root is self.root:
+                return self
+            return PersistentMap(root, self.size - 1)
+
+        def leaves_with_hash(self, h):
+            result = []
+            if self.root is not None:
+                self.root.with_hash(h & HASH_MASK, 0, result)
+            return result
+
+        def leaves(self):
+            result = []
+            if self.root is not None:
+                self.root.collect(result)
+            return result
+
+        def items(self):
+            return [(leaf.key, leaf.val) for leaf in self.leaves()]
+
+    PersistentMap.__name__ = name
+    PersistentMap.Leaf = Leaf
+    PersistentMap.EMPTY = PersistentMap(None, 0)
+    return PersistentMap
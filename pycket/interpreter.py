@@ -7,6 +7,9 @@ from pycket.cont              import Cont, nil_continuation, label
 from pycket.env               import SymList, ConsEnv, ToplevelEnv
 from pycket.arity             import Arity
 from pycket                   import config
+from pycket.warmup            import warmup_profile
+from pycket.ast_profiler      import ast_profiler
+from pycket.sampling_profiler import sampling_profiler
 
 from rpython.rlib             import jit, debug, objectmodel
 from rpython.rlib.objectmodel import r_dict, compute_hash, specialize
@@ -400,7 +403,15 @@ class Module(object):
 
     def assign_convert_module(self):
         local_muts = self.mod_mutated_vars()
-        new_body = [b.assign_convert(local_muts, None) for b in self.body]
+        known = None
+        if config.fold_constants:
+            known = KnownDefinitions(local_muts)
+        new_body = []
+        for b in self.body:
+            new_b = b.assign_convert(local_muts, None, known)
+            if known is not None:
+                known.learn(b, new_b)
+            new_body.append(new_b)
         return Module(self.name, new_body, self.config)
 
     def tostring(self):
@@ -435,6 +446,153 @@ class Module(object):
                 continue
         module_env.current_module = old
 
+# the primitives without effects whose applications to constants are folded
+pure_primitives = dict.fromkeys([values.W_Symbol.make(name) for name in [
+    "+", "-", "*", "/", "<", "<=", ">", ">=", "=", "add1", "sub1", "abs",
+    "min", "max", "quotient", "remainder", "modulo", "zero?", "positive?",
+    "negative?", "even?", "odd?", "exact->inexact", "inexact->exact",
+    "fx+", "fx-", "fx*", "fx<", "fx<=", "fx>", "fx>=", "fx=",
+    "fl+", "fl-", "fl*", "fl/", "fl<", "fl<=", "fl>", "fl>=", "fl=",
+    "bitwise-and", "bitwise-ior", "bitwise-xor", "bitwise-not",
+    "not", "eq?", "eqv?", "equal?", "null?", "pair?",
+    "number?", "fixnum?", "flonum?", "integer?", "exact?", "inexact?",
+    "symbol?", "string?", "boolean?", "char?", "procedure?", "vector?",
+    "char->integer"]])
+
+# the largest lambda body, in number of ASTs, that is inlined
+MAX_INLINE_SIZE = 16
+
+class KnownDefinitions(object):
+    """ The module-level definitions of the module that is being
+    assign-converted that its later forms use directly: the unmutated
+    variables bound to constants are replaced by the constants and the calls
+    of small functions that only apply primitives and earlier such functions
+    are inlined. Applications of pure primitives to constants and ifs of
+    constants are folded on the way. """
+
+    def __init__(self, mutated):
+        self.mutated = mutated
+        self.constants = {}
+        self.functions = {}
+
+    def learn(self, form, new_form):
+        """ record the definition in form, new_form is its assign-converted
+        version """
+        if not isinstance(form, DefineValues) or len(form.names) != 1:
+            return
+        assert isinstance(new_form, DefineValues)
+        name = form.names[0]
+        if ModuleVar(name, None, name) in self.mutated:
+            return
+        rhs = new_form.rhs
+        if isinstance(rhs, Quote):
+            self.constants[name] = rhs.w_val
+        lam = self.inlinable_lambda(form.rhs)
+        if lam is not None:
+            self.functions[name] = lam
+
+    def inlinable_lambda(self, rhs):
+        if not isinstance(rhs, CaseLambda) or len(rhs.lams) != 1:
+            return None
+        if rhs.recursive_sym is not None:
+            return None
+        lam = rhs.lams[0]
+        if lam.rest is not None:
+            return None
+        lam.materialize_body()
+        size = 0
+        for b in lam.body:
+            body_size = self.inlinable_size(b)
+            if body_size < 0:
+                return None
+            size += body_size
+        if size > MAX_INLINE_SIZE:
+            return None
+        return lam
+
+    def inlinable_size(self, ast):
+        """ the number of ASTs of ast, or -1 if it must not be inlined: it
+        creates closures, mutates variables, calls other procedures than
+        primitives and inlinable functions or uses a variable of the module
+        that is not a constant. The function itself is not known yet, so
+        recursive functions are never inlined. """
+        if isinstance(ast, Quote) or isinstance(ast, LexicalVar):
+            return 1
+        if isinstance(ast, ModuleVar):
+            if ast.is_primitive() or self.constant(ast) is not None:
+                return 1
+            return -1
+        if isinstance(ast, App):
+            rator = ast.rator
+            if not isinstance(rator, ModuleVar):
+                return -1
+            if not rator.is_primitive() and self.function(rator, len(ast.rands)) is None:
+                return -1
+            children = ast.rands
+        elif isinstance(ast, If) or isinstance(ast, Begin):
+            children = ast.direct_children()
+        elif type(ast) is Let:
+            children = ast.rhss + ast.body
+        else:
+            return -1
+        size = 1
+        for child in children:
+            child_size = self.inlinable_size(child)
+            if child_size < 0:
+                return -1
+            size += child_size
+        return size
+
+    def constant(self, var):
+        if var.srcmod is not None:
+            return None
+        return self.constants.get(var.srcsym, None)
+
+    def function(self, rator, argc):
+        """ the lambda to inline for a call of rator with argc arguments """
+        if not isinstance(rator, ModuleVar) or rator.srcmod is not None:
+            return None
+        lam = self.functions.get(rator.srcsym, None)
+        if lam is None or len(lam.formals) != argc:
+            return None
+        return lam
+
+def fold_primitive(rator, rands):
+    """ the value of the application of a pure primitive to constants, or
+    None if it cannot be computed ahead of time """
+    if not isinstance(rator, ModuleVar) or not rator.is_primitive():
+        return None
+    if rator.srcsym not in pure_primitives:
+        return None
+    args_w = [None] * len(rands)
+    for i in range(len(rands)):
+        rand = rands[i]
+        if not isinstance(rand, Quote):
+            return None
+        w_arg = rand.w_val
+        # the work on other numbers, e.g. bignums, is not bounded, and the
+        # application may never be evaluated
+        if (isinstance(w_arg, values.W_Number) and
+                not isinstance(w_arg, values.W_Fixnum) and
+                not isinstance(w_arg, values.W_Flonum)):
+            return None
+        args_w[i] = w_arg
+    try:
+        w_prim = rator._lookup_primitive()
+        if not isinstance(w_prim, values.W_Prim) or not w_prim.simple_n:
+            return None
+        w_res = w_prim.simple_n(args_w)
+    except SchemeException:
+        # the error is raised when the application is evaluated
+        return None
+    # the results must not have an identity that could tell them apart, nor
+    # make the module or its cache grow
+    if (isinstance(w_res, values.W_Fixnum) or isinstance(w_res, values.W_Flonum)
+            or isinstance(w_res, values.W_Bool)
+            or isinstance(w_res, values.W_Character)):
+        return w_res
+    return None
+
 class Require(AST):
     _immutable_fields_ = ["modname", "module"]
     simple = True
@@ -446,11 +604,14 @@ class Require(AST):
     def _mutated_vars(self):
         return variable_set()
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         return self
 
     # Interpret the module and add it to the module environment
+    # module is None if the module was already loaded by an earlier require
     def interpret_simple(self, env):
+        if self.module is None:
+            return values.w_void
         top = env.toplevel_env()
         top.module_env.add_module(self.modname, self.module)
         self.module.interpret_mod(top)
@@ -498,8 +659,8 @@ class Cell(AST):
     def interpret(self, env, cont):
         return self.expr, env, CellCont(self, env, cont)
 
-    def assign_convert(self, vars, env_structure):
-        return Cell(self.expr.assign_convert(vars, env_structure))
+    def assign_convert(self, vars, env_structure, known):
+        return Cell(self.expr.assign_convert(vars, env_structure, known))
 
     def direct_children(self):
         return [self.expr]
@@ -519,7 +680,7 @@ class Quote(AST):
     def interpret_simple(self, env):
         return self.w_val
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         return self
 
     def direct_children(self):
@@ -545,7 +706,7 @@ class QuoteSyntax(AST):
     def interpret_simple(self, env):
         return values.W_Syntax(self.w_val)
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         return self
 
     def direct_children(self):
@@ -577,7 +738,7 @@ class VariableReference(AST):
     def interpret_simple(self, env):
         return values.W_VariableReference(self)
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         v = self.var
         if isinstance(v, LexicalVar) and v in vars:
             return VariableReference(v, self.path, True)
@@ -610,10 +771,10 @@ class WithContinuationMark(AST):
                                                     self.value.tostring(),
                                                     self.body.tostring())
 
-    def assign_convert(self, vars, env_structure):
-        return WithContinuationMark(self.key.assign_convert(vars, env_structure),
-                                    self.value.assign_convert(vars, env_structure),
-                                    self.body.assign_convert(vars, env_structure))
+    def assign_convert(self, vars, env_structure, known):
+        return WithContinuationMark(self.key.assign_convert(vars, env_structure, known),
+                                    self.value.assign_convert(vars, env_structure, known),
+                                    self.body.assign_convert(vars, env_structure, known))
 
     def direct_children(self):
         return [self.key, self.value, self.body]
@@ -627,10 +788,41 @@ class WithContinuationMark(AST):
     def interpret(self, env, cont):
         return self.key, env, WCMKeyCont(self, env, cont)
 
+class CallCacheEntry(object):
+    """ An entry of the inline cache of an App: the clause of the
+    case-lambda that the arguments select, and whether the call needs to be
+    registered in the callgraph when it returns to return_ast. """
+    _attrs_ = ["caselam", "index", "settled", "return_ast"]
+    _immutable_fields_ = ["caselam", "index"]
+
+    def __init__(self, caselam, index):
+        self.caselam = caselam
+        self.index = index
+        self.settled = False
+        self.return_ast = None
+
+# calls of an App with more different case-lambdas than this (megamorphic
+# call sites) do not get new cache entries
+INLINE_CACHE_SIZE = 4
+
+def inline_call(lam, rands):
+    """ the body of lam with its formals bound to rands, before assign
+    conversion. The lexical names are unique per module, so the body cannot
+    capture any variable of rands. """
+    if not rands:
+        return Begin.make(lam.body)
+    return Let(SymList(lam.formals[:]), [1] * len(rands), rands, lam.body)
+
 class App(AST):
     _immutable_fields_ = ["rator", "rands[*]", "env_structure"]
     app_like = True
 
+    # the inline cache of the calls of closures, only used by the interpreter
+    # since the JIT specializes on the promoted case-lambda anyway
+    cache = None
+    cache_hits = 0
+    cache_misses = 0
+
     def __init__ (self, rator, rands, env_structure=None):
         assert rator.simple
         for r in rands:
@@ -652,6 +844,8 @@ class App(AST):
                         return SimplePrimApp1(rator, rands, env_structure, w_prim)
                     if w_prim.simple2 and len(rands) == 2:
                         return SimplePrimApp2(rator, rands, env_structure, w_prim)
+                    if w_prim.simple_n:
+                        return SimplePrimAppN(rator, rands, env_structure, w_prim)
         return App(rator, rands, env_structure)
 
     @staticmethod
@@ -660,9 +854,16 @@ class App(AST):
         fresh_vars = []
         fresh_rhss = []
 
+        # applications of primitives are simple but can have effects, they
+        # are bound as well if a later argument is, to keep the order
+        last_bound = -1
+        for i in range(len(all_args)):
+            if not all_args[i].simple:
+                last_bound = i
+
         name = "AppRator_"
         for i, rand in enumerate(all_args):
-            if not rand.simple:
+            if not rand.simple or (i < last_bound and isinstance(rand, App)):
                 fresh_rand = Gensym.gensym(name)
                 fresh_rand_var = LexicalVar(fresh_rand)
                 if isinstance(rand, Let) and len(rand.body) == 1:
@@ -684,10 +885,19 @@ class App(AST):
         else:
             return App.make(rator, rands)
 
-    def assign_convert(self, vars, env_structure):
-        return App.make(self.rator.assign_convert(vars, env_structure),
-                   [e.assign_convert(vars, env_structure) for e in self.rands],
-                   env_structure=env_structure)
+    def assign_convert(self, vars, env_structure, known):
+        if known is not None:
+            lam = known.function(self.rator, len(self.rands))
+            if lam is not None:
+                return inline_call(lam, self.rands).assign_convert(
+                    vars, env_structure, known)
+        rator = self.rator.assign_convert(vars, env_structure, known)
+        rands = [e.assign_convert(vars, env_structure, known) for e in self.rands]
+        if known is not None:
+            w_val = fold_primitive(rator, rands)
+            if w_val is not None:
+                return Quote(w_val)
+        return App.make(rator, rands, env_structure=env_structure)
 
     def direct_children(self):
         return [self.rator] + self.rands
@@ -715,8 +925,59 @@ class App(AST):
             # fast path
             jit.promote(w_callable)
             w_callable = w_callable.closure
+        if not jit.we_are_jitted():
+            if isinstance(w_callable, values.W_Closure):
+                return self.call_closure(w_callable, args_w, env, cont)
+            if isinstance(w_callable, values.W_Closure1AsEnv):
+                return self.call_closure(w_callable, args_w, env, cont)
         return w_callable.call_with_extra_info(args_w, env, cont, self)
 
+    def call_cache_counts(self):
+        return self.cache_hits, self.cache_misses
+
+    @specialize.argtype(1)
+    def call_closure(self, w_closure, args_w, env, cont):
+        entry = self.lookup_call_cache(w_closure.caselam, len(args_w))
+        if entry is None:
+            self.cache_misses += 1
+            index = w_closure.find_clause(args_w)
+            entry = self.add_call_cache_entry(w_closure.caselam, index)
+        else:
+            self.cache_hits += 1
+            index = entry.index
+        if env.pycketconfig().callgraph:
+            lam = w_closure.caselam.lams[index]
+            return_ast = cont.get_next_executed_ast()
+            if (entry is None or not entry.settled or
+                    entry.return_ast is not return_ast):
+                callgraph = env.toplevel_env().callgraph
+                settled = callgraph.register_call(lam, self, cont, env)
+                if entry is not None:
+                    entry.settled = settled
+                    entry.return_ast = return_ast
+        return w_closure.call_clause(index, args_w, env, cont, self, False)
+
+    def lookup_call_cache(self, caselam, args_len):
+        cache = self.cache
+        if cache is None:
+            return None
+        for entry in cache:
+            if (entry.caselam is caselam and
+                    caselam.lams[entry.index].accepts(args_len)):
+                return entry
+        return None
+
+    def add_call_cache_entry(self, caselam, index):
+        """ the new entry, or None if the cache is full """
+        entry = CallCacheEntry(caselam, index)
+        if self.cache is None:
+            self.cache = [entry]
+        elif len(self.cache) < INLINE_CACHE_SIZE:
+            self.cache.append(entry)
+        else:
+            return None
+        return entry
+
     def _tostring(self):
         return "(%s %s)"%(self.rator.tostring(), " ".join([r.tostring() for r in self.rands]))
 
@@ -774,6 +1035,36 @@ class SimplePrimApp2(App):
         result = self.run(env)
         return return_multi_vals_direct(result, env, cont)
 
+class SimplePrimAppN(App):
+    """ the application of a primitive that doesn't need env and cont to any
+    number of arguments, e.g. of the variadic arithmetic """
+    _immutable_fields_ = ['w_prim']
+    simple = True
+
+    def __init__(self, rator, rands, env_structure, w_prim):
+        App.__init__(self, rator, rands, env_structure)
+        self.w_prim = w_prim
+
+    @jit.unroll_safe
+    def run(self, env):
+        args_w = [None] * len(self.rands)
+        for i in range(len(self.rands)):
+            args_w[i] = self.rands[i].interpret_simple(env)
+        result = self.w_prim.simple_n(args_w)
+        if result is None:
+            result = values.w_void
+        return result
+
+    def interpret_simple(self, env):
+        return check_one_val(self.run(env))
+
+    def interpret(self, env, cont):
+        if not env.pycketconfig().callgraph:
+            self.set_should_enter() # to jit downrecursion
+        result = self.run(env)
+        return return_multi_vals_direct(result, env, cont)
+
+
 class SequencedBodyAST(AST):
     _immutable_fields_ = ["body[*]", "counting_asts[*]"]
     def __init__(self, body, counts_needed=-1):
@@ -796,6 +1087,12 @@ class SequencedBodyAST(AST):
             return self.body[i], env, BeginCont(
                     self.counting_asts[i + 1], env, prev)
 
+    @jit.unroll_safe
+    def interpret_body_direct(self, env):
+        for i in range(len(self.body) - 1):
+            self.body[i].interpret_direct(env)
+        return self.body[-1].interpret_direct(env)
+
 
 class Begin0(AST):
     _immutable_fields_ = ["first", "body"]
@@ -811,9 +1108,9 @@ class Begin0(AST):
         self.first = fst
         self.body = rst
 
-    def assign_convert(self, vars, env_structure):
-        return Begin0(self.first.assign_convert(vars, env_structure),
-                      self.body.assign_convert(vars, env_structure))
+    def assign_convert(self, vars, env_structure, known):
+        return Begin0(self.first.assign_convert(vars, env_structure, known),
+                      self.body.assign_convert(vars, env_structure, known))
 
     def direct_children(self):
         return [self.first, self.body]
@@ -839,8 +1136,8 @@ class Begin(SequencedBodyAST):
         else:
             return Begin(body)
 
-    def assign_convert(self, vars, env_structure):
-        return Begin.make([e.assign_convert(vars, env_structure) for e in self.body])
+    def assign_convert(self, vars, env_structure, known):
+        return Begin.make([e.assign_convert(vars, env_structure, known) for e in self.body])
 
     def direct_children(self):
         return self.body
@@ -855,6 +1152,9 @@ class Begin(SequencedBodyAST):
     def interpret(self, env, cont):
         return self.make_begin_cont(env, cont)
 
+    def interpret_direct(self, env):
+        return self.interpret_body_direct(env)
+
     def _tostring(self):
         return "(begin %s)" % (" ".join([e.tostring() for e in self.body]))
 
@@ -889,7 +1189,7 @@ class Var(AST):
 class CellRef(Var):
     simple = True
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         return CellRef(self.sym, env_structure)
 
     def _tostring(self):
@@ -925,7 +1225,7 @@ class LexicalVar(Var):
     def _set(self, w_val, env):
         assert 0
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         #assert isinstance(vars, r_dict)
         if self in vars:
             return CellRef(self.sym, env_structure)
@@ -988,7 +1288,11 @@ class ModuleVar(Var):
         except KeyError:
             raise SchemeException("can't find primitive %s" % (self.srcsym.tostring()))
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
+        if known is not None:
+            w_val = known.constant(self)
+            if w_val is not None:
+                return Quote(w_val)
         return self
         # # we use None here for hashing because we don't have the module name in the
         # # define-values when we need to look this up.
@@ -1013,7 +1317,7 @@ class ModuleVar(Var):
 #         self.srcmod = srcmod
 #         self.srcsym = srcsym
 #         self.modvar = ModuleVar(self.sym, self.srcmod, self.srcsym)
-#     def assign_convert(self, vars, env_structure):
+#     def assign_convert(self, vars, env_structure, known):
 #         return ModCellRef(self.sym, self.srcmod, self.srcsym)
 #     def _tostring(self):
 #         return "ModCellRef(%s)" %variable_name(self.sym)
@@ -1035,7 +1339,7 @@ class ToplevelVar(Var):
     def _lookup(self, env):
         return env.toplevel_env().toplevel_lookup(self.sym)
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         return self
 
     def _set(self, w_val, env):
@@ -1054,9 +1358,9 @@ class SetBang(AST):
     def interpret(self, env, cont):
         return self.rhs, env, SetBangCont(self, env, cont)
 
-    def assign_convert(self, vars, env_structure):
-        return SetBang(self.var.assign_convert(vars, env_structure),
-                       self.rhs.assign_convert(vars, env_structure))
+    def assign_convert(self, vars, env_structure, known):
+        return SetBang(self.var.assign_convert(vars, env_structure, known),
+                       self.rhs.assign_convert(vars, env_structure, known))
 
     def _mutated_vars(self):
         x = self.rhs.mutated_vars()
@@ -1103,11 +1407,24 @@ class If(AST):
         else:
             return self.thn, env, cont
 
-    def assign_convert(self, vars, env_structure):
+    def interpret_direct(self, env):
+        if self.tst.interpret_simple(env) is values.w_false:
+            return self.els.interpret_direct(env)
+        return self.thn.interpret_direct(env)
+
+    def assign_convert(self, vars, env_structure, known):
         sub_env_structure = env_structure
-        return If(self.tst.assign_convert(vars, env_structure),
-                  self.thn.assign_convert(vars, sub_env_structure),
-                  self.els.assign_convert(vars, sub_env_structure))
+        tst = self.tst.assign_convert(vars, env_structure, known)
+        # the test became a constant: a module-level constant or a folded
+        # application
+        if (isinstance(tst, Quote) and not isinstance(self.tst, Quote) and
+                known is not None):
+            if tst.w_val is values.w_false:
+                return self.els.assign_convert(vars, sub_env_structure, known)
+            return self.thn.assign_convert(vars, sub_env_structure, known)
+        return If(tst,
+                  self.thn.assign_convert(vars, sub_env_structure, known),
+                  self.els.assign_convert(vars, sub_env_structure, known))
 
     def direct_children(self):
         return [self.tst, self.thn, self.els]
@@ -1166,7 +1483,13 @@ class CaseLambda(AST):
     def make_recursive_copy(self, sym):
         return CaseLambda(self.lams, sym)
 
+    @jit.unroll_safe
+    def materialize_bodies(self):
+        for l in self.lams:
+            l.materialize_body()
+
     def interpret_simple(self, env):
+        self.materialize_bodies()
         if not env.pycketconfig().callgraph:
             self.enable_jitting() # XXX not perfectly pretty
         if not self.any_frees:
@@ -1198,8 +1521,8 @@ class CaseLambda(AST):
             x.update(l.mutated_vars())
         return x
 
-    def assign_convert(self, vars, env_structure):
-        ls = [l.assign_convert(vars, env_structure) for l in self.lams]
+    def assign_convert(self, vars, env_structure, known):
+        ls = [l.assign_convert(vars, env_structure, known) for l in self.lams]
         return CaseLambda(ls, recursive_sym=self.recursive_sym)
 
     def _tostring(self):
@@ -1243,7 +1566,6 @@ class Lambda(SequencedBodyAST):
                           ]
     simple = True
     def __init__ (self, formals, rest, args, frees, body, srcpos, srcfile, enclosing_env_structure=None, env_structure=None):
-        SequencedBodyAST.__init__(self, body)
         self.srcpos = srcpos
         self.srcfile = srcfile
         self.formals = formals
@@ -1252,9 +1574,27 @@ class Lambda(SequencedBodyAST):
         self.frees = frees
         self.enclosing_env_structure = enclosing_env_structure
         self.env_structure = env_structure
+        self.init_body(body)
+
+    def init_body(self, body):
+        SequencedBodyAST.__init__(self, body)
         for b in self.body:
             b.set_surrounding_lambda(self)
         self.body[0].the_lam = self
+        if not self.is_lazy():
+            warmup_profile.seed(self)
+
+    def is_lazy(self):
+        return isinstance(self.body[0], LazyBody)
+
+    def materialize_body(self):
+        """ Decode the body if it was loaded lazily. Like set_should_enter,
+        this mutates an immutable field. That is fine because it happens
+        before the first closure of the lambda is created, so no trace can
+        have seen the old body. """
+        body = self.body[0]
+        if isinstance(body, LazyBody):
+            self.init_body(body.materialize())
 
     def set_in_cycle(self):
         for b in self.body:
@@ -1274,7 +1614,8 @@ class Lambda(SequencedBodyAST):
     def interpret_simple(self, env):
         assert False # unreachable
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
+        self.materialize_body()
         local_muts = variable_set()
         for b in self.body:
             local_muts.update(b.mutated_vars())
@@ -1292,7 +1633,7 @@ class Lambda(SequencedBodyAST):
             sub_env_structure = SymList(new_lets, self.args)
         else:
             sub_env_structure = self.args
-        new_body = [b.assign_convert(new_vars, sub_env_structure) for b in self.body]
+        new_body = [b.assign_convert(new_vars, sub_env_structure, known) for b in self.body]
         if new_lets:
             cells = [Cell(LexicalVar(v, self.args)) for v in new_lets]
             new_body = [Let(sub_env_structure, [1] * len(new_lets), cells, new_body)]
@@ -1300,6 +1641,7 @@ class Lambda(SequencedBodyAST):
                       self.srcpos, self.srcfile, env_structure, sub_env_structure)
 
     def direct_children(self):
+        self.materialize_body()
         return self.body[:]
 
     def set_surrounding_lambda(self, lam):
@@ -1307,6 +1649,7 @@ class Lambda(SequencedBodyAST):
         # don't recurse
 
     def _mutated_vars(self):
+        self.materialize_body()
         x = variable_set()
         for b in self.body:
             x.update(b.mutated_vars())
@@ -1317,9 +1660,14 @@ class Lambda(SequencedBodyAST):
         return x
 
     def free_vars(self):
+        self.materialize_body()
         result = free_vars_lambda(self.body, self.args)
         return result
 
+    def accepts(self, args_len):
+        fmls_len = len(self.formals)
+        return fmls_len == args_len or self.rest is not None and fmls_len < args_len
+
     def match_args(self, args):
         fmls_len = len(self.formals)
         args_len = len(args)
@@ -1372,6 +1720,7 @@ class Lambda(SequencedBodyAST):
         return vals
 
     def _tostring(self):
+        self.materialize_body()
         if self.rest and not self.formals:
             return "(lambda %s %s)" % (self.rest.tostring(), [b.tostring() for b in self.body])
         if self.rest:
@@ -1383,6 +1732,25 @@ class Lambda(SequencedBodyAST):
                 self.body[0].tostring() if len(self.body) == 1 else
                 " ".join([b.tostring() for b in self.body]))
 
+class LazyBody(AST):
+    """ Stands in for the body of a Lambda loaded from the binary AST cache
+    until the body is needed, see Lambda.materialize_body. """
+    _immutable_fields_ = ["decoder", "start", "stop"]
+
+    def __init__(self, decoder, start, stop):
+        self.decoder = decoder
+        self.start = start
+        self.stop = stop
+
+    def materialize(self):
+        return self.decoder.read_body(self.start, self.stop)
+
+    def interpret(self, env, cont):
+        assert 0, "lambda body was not materialized"
+
+    def _tostring(self):
+        return "#<lazy body>"
+
 class CombinedAstAndIndex(AST):
     _immutable_fields_ = ["ast", "index"]
 
@@ -1470,7 +1838,7 @@ class Letrec(SequencedBodyAST):
                 del x[v]
         return x
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         local_muts = variable_set()
         for b in self.body + self.rhss:
             local_muts.update(b.mutated_vars())
@@ -1481,8 +1849,8 @@ class Letrec(SequencedBodyAST):
         for k, v in local_muts.iteritems():
             new_vars[k] = v
         sub_env_structure = SymList(self.args.elems, env_structure)
-        new_rhss = [rhs.assign_convert(new_vars, sub_env_structure) for rhs in self.rhss]
-        new_body = [b.assign_convert(new_vars, sub_env_structure) for b in self.body]
+        new_rhss = [rhs.assign_convert(new_vars, sub_env_structure, known) for rhs in self.rhss]
+        new_body = [b.assign_convert(new_vars, sub_env_structure, known) for b in self.body]
         return Letrec(sub_env_structure, self.counts, new_rhss, new_body)
 
     def _tostring(self):
@@ -1563,6 +1931,14 @@ class Let(SequencedBodyAST):
             remove_num_envs = [0] * (len(rhss) + 1)
         self.remove_num_envs = remove_num_envs
 
+    @staticmethod
+    def make(args, counts, rhss, body, remove_num_envs):
+        """ the Let of assign-converted rhss and body, a SimpleLet if that is
+        possible """
+        if config.superinstructions and all_nonescaping(counts, rhss):
+            return SimpleLet(args, counts, rhss, body, remove_num_envs)
+        return Let(args, counts, rhss, body, remove_num_envs)
+
     def replace_innermost_with_app(self, newsym, rator, rands):
         assert len(self.body) == 1
         body = self.body[0]
@@ -1625,7 +2001,7 @@ class Let(SequencedBodyAST):
             x.update(b.free_vars())
         return x
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         sub_env_structure = SymList(self.args.elems, env_structure)
         local_muts = variable_set()
         for b in self.body:
@@ -1638,7 +2014,7 @@ class Let(SequencedBodyAST):
 
         new_rhss = []
         for i, rhs in enumerate(self.rhss):
-            new_rhs = rhs.assign_convert(vars, env_structures[i])
+            new_rhs = rhs.assign_convert(vars, env_structures[i], known)
             need_cell_flags = [(LexicalVar(self.args.elems[i + j]) in local_muts)
                                for j in range(self.counts[i])]
             if True in need_cell_flags:
@@ -1647,8 +2023,9 @@ class Let(SequencedBodyAST):
 
         body_env_structure = env_structures[len(self.rhss)]
 
-        new_body = [b.assign_convert(new_vars, body_env_structure) for b in self.body]
-        result = Let(sub_env_structure, self.counts, new_rhss, new_body, remove_num_envs)
+        new_body = [b.assign_convert(new_vars, body_env_structure, known) for b in self.body]
+        result = Let.make(sub_env_structure, self.counts, new_rhss, new_body,
+                          remove_num_envs)
         return result
 
     def _compute_remove_num_envs(self, new_vars, sub_env_structure):
@@ -1739,6 +2116,64 @@ class Let(SequencedBodyAST):
         result.append(")")
         return "".join(result)
 
+def nonescaping(ast):
+    """ whether the continuation of ast cannot be captured, inspected or
+    returned to more than once while it is evaluated: it only applies simple
+    primitives, no closures or unknown procedures, and has no continuation
+    marks. Such an AST can be evaluated on the stack by interpret_direct. """
+    if ast.simple:
+        return True
+    if not config.escape_analysis:
+        return False
+    if isinstance(ast, If):
+        return nonescaping(ast.thn) and nonescaping(ast.els)
+    # the rhss of a SimpleLet are nonescaping already
+    if isinstance(ast, SimpleLet) or isinstance(ast, Begin):
+        for body in ast.body:
+            if not nonescaping(body):
+                return False
+        return True
+    return False
+
+def all_nonescaping(counts, rhss):
+    for i in range(len(rhss)):
+        if counts[i] != 1 or not nonescaping(rhss[i]):
+            return False
+    return True
+
+class SimpleLet(Let):
+    """ A superinstruction for a let of single values of simple expressions,
+    e.g. chains of primitive applications, or of ifs, begins and lets of
+    them. The rhss are evaluated directly, without a LetCont for each. If
+    the body is an if, the test is evaluated right away as well. """
+    _immutable_fields_ = ["if_body"]
+
+    def __init__(self, args, counts, rhss, body, remove_num_envs):
+        Let.__init__(self, args, counts, rhss, body, remove_num_envs)
+        self.if_body = None
+        if len(body) == 1 and isinstance(body[0], If):
+            self.if_body = body[0]
+
+    @jit.unroll_safe
+    def bind(self, env):
+        """ the environment of the body """
+        vals_w = [None] * len(self.rhss)
+        for i in range(len(self.rhss)):
+            env = self._prune_env(env, i)
+            vals_w[i] = self.rhss[i].interpret_direct(env)
+        env = self._prune_env(env, len(self.rhss))
+        return ConsEnv.make(vals_w, env)
+
+    def interpret_direct(self, env):
+        return self.interpret_body_direct(self.bind(env))
+
+    def interpret(self, env, cont):
+        env = self.bind(env)
+        if_body = self.if_body
+        if if_body is not None and not if_body.should_enter:
+            return if_body.interpret(env, cont)
+        return self.make_begin_cont(env, cont)
+
 class DefineValues(AST):
     _immutable_fields_ = ["names", "rhs", "display_names"]
     names = []
@@ -1758,17 +2193,17 @@ class DefineValues(AST):
     def interpret(self, env, cont):
         return self.rhs.interpret(env, cont)
 
-    def assign_convert(self, vars, env_structure):
+    def assign_convert(self, vars, env_structure, known):
         mut = False
         need_cell_flags = [(ModuleVar(i, None, i) in vars) for i in self.names]
         if True in need_cell_flags:
             return DefineValues(self.names,
-                                Cell(self.rhs.assign_convert(vars, env_structure),
+                                Cell(self.rhs.assign_convert(vars, env_structure, known),
                                      need_cell_flags),
                                 self.display_names)
         else:
             return DefineValues(self.names,
-                                self.rhs.assign_convert(vars, env_structure),
+                                self.rhs.assign_convert(vars, env_structure, known),
                                 self.display_names)
 
     def direct_children(self):
@@ -1797,16 +2232,16 @@ driver_two_state = jit.JitDriver(reds=["env", "cont"],
 def inner_interpret_two_state(ast, env, cont):
     came_from = ast
     config = env.pycketconfig()
+    if (not jit.we_are_jitted()) and ast_profiler.active:
+        # the JIT restarts the loop here whenever it leaves compiled code
+        ast_profiler.portal_entered(ast)
     while True:
         if (not jit.we_are_jitted()) and (not ast.is_label):
             ast.count += 1
             if ast.count >= 10000:
                 ast.set_should_enter()
-            if ast.count >= 10000 and (ast.count % 10000 == 0):
-                if (ast.the_lam is not None) and (not ast.in_cycle) and (not "string->num" in ast.the_lam.tostring()) and (not ast.is_bad):
-                    print "hot ast not jitted %s: %s"%(ast.count, ast.tostring())
-                    ast.is_bad = True
-                    #import pdb; pdb.set_trace()
+        if sampling_profiler.active and sampling_profiler.sample_due():
+            sampling_profiler.sample(ast, cont)
         driver_two_state.jit_merge_point(ast=ast, came_from=came_from, env=env, cont=cont)
         if config.track_header:
             came_from = ast if ast.should_enter else came_from
@@ -1818,6 +2253,8 @@ def inner_interpret_two_state(ast, env, cont):
         # (see Jones, Gomard, Sestof 1993)
         if t is Let:
             ast, env, cont = ast.interpret(env, cont)
+        elif t is SimpleLet:
+            ast, env, cont = ast.interpret(env, cont)
         elif t is If:
             ast, env, cont = ast.interpret(env, cont)
         elif t is Begin:
@@ -1825,7 +2262,11 @@ def inner_interpret_two_state(ast, env, cont):
         else:
             ast, env, cont = ast.interpret(env, cont)
         if ast.should_enter:
+            if (not jit.we_are_jitted()) and ast_profiler.active:
+                ast_profiler.before_can_enter_jit(ast)
             driver_two_state.can_enter_jit(ast=ast, came_from=came_from, env=env, cont=cont)
+            if (not jit.we_are_jitted()) and ast_profiler.active:
+                ast_profiler.after_can_enter_jit()
 
 def get_printable_location_one_state(green_ast ):
     if green_ast is None:
@@ -8,6 +8,8 @@ from .expand import (expand_file_to_json, expand_code_to_json,
                      PermException, SchemeException)
 
 from rpython.rlib import jit
+from rpython.rlib.rarithmetic import string_to_int
+from rpython.rlib.rstring import ParseStringError, ParseStringOverflowError
 
 
 def script_exprs(arg, content):
@@ -40,6 +42,18 @@ def print_help(argv):
   -u <file>, --require-script <file> : Same as -t <file> -N <file> --
  Configuration options:
   --stdlib: Use Pycket's version of stdlib (only applicable for -e)
+  -j <n>, --jobs <n> : Expand up to <n> required modules in parallel,
+                       0 (the default) means one per processor the process
+                       may use; this is only known on Linux, elsewhere the
+                       default is 1
+  --warmup-profile <file> : Arm the JIT for the loops found by earlier runs
+                            recorded in <file>, and record this run there
+  --profile-ast : Count the executions of the ASTs and the JIT entries and
+                  exits, and print a report for each lambda at exit
+  --profile-ast-json <file> : Like --profile-ast, and also write the report
+                              as JSON to <file>
+  --profile-sample <file> : Sample the running lambdas every millisecond and
+                            write the stacks to <file> for flame graphs
  Meta options:
   --jit <jitargs> : Set RPython JIT options may be 'default', 'off',
                     or 'param=value,param=value' list
@@ -84,6 +98,42 @@ def parse_args(argv):
         elif argv[i] == "--stdlib":
             config['stdlib'] = True
             i += 1
+        elif argv[i] in ["-j", "--jobs"]:
+            if to <= i + 1:
+                print "missing argument after %s" % argv[i]
+                retval = 5
+                break
+            i += 1
+            try:
+                string_to_int(argv[i])
+            except (ParseStringError, ParseStringOverflowError):
+                print "bad number of jobs %s" % argv[i]
+                retval = 5
+                break
+            names['jobs'] = argv[i]
+        elif argv[i] == "--warmup-profile":
+            if to <= i + 1:
+                print "missing argument after --warmup-profile"
+                retval = 5
+                break
+            i += 1
+            names['warmup-profile'] = argv[i]
+        elif argv[i] == "--profile-ast":
+            names['profile-ast'] = ""
+        elif argv[i] == "--profile-ast-json":
+            if to <= i + 1:
+                print "missing argument after --profile-ast-json"
+                retval = 5
+                break
+            i += 1
+            names['profile-ast'] = argv[i]
+        elif argv[i] == "--profile-sample":
+            if to <= i + 1:
+                print "missing argument after --profile-sample"
+                retval = 5
+                break
+            i += 1
+            names['profile-sample'] = argv[i]
         elif argv[i] == "-e":
             if to <= i + 1:
                 print "missing argument after -e"
@@ -134,6 +184,11 @@ def parse_args(argv):
 
     return config, names, args, retval
 
+def jobs_option(names):
+    if 'jobs' in names:
+        return string_to_int(names['jobs'])
+    return 0
+
 def _temporary_file():
     from rpython.rlib.objectmodel import we_are_translated
     if we_are_translated():
@@ -7,7 +7,7 @@ from pycket              import values_string
 from pycket.cont         import continuation, label, loop_label
 from pycket.error        import SchemeException
 from pycket.prims.expose import expose, procedure
-from rpython.rlib        import jit, objectmodel
+from rpython.rlib        import jit, objectmodel, rarithmetic
 
 # All of my hate...
 # Configuration table for information about how to perform equality checks.
@@ -160,6 +160,8 @@ def equal_func_impl(a, b, info, env, cont, n):
             return return_value(values.w_false, env, cont)
         if a.length() != b.length():
             return return_value(values.w_false, env, cont)
+        if unboxed_vectors(a, b):
+            return return_value(values.W_Bool.make(equal_unboxed(a, b)), env, cont)
         return equal_vec_func(a, b, values.W_Fixnum(0), info, env, cont)
 
     if isinstance(a, values_struct.W_RootStruct) and isinstance(b, values_struct.W_RootStruct):
@@ -189,6 +191,110 @@ def equal_func_impl(a, b, info, env, cont, n):
 
     return return_value(values.w_false, env, cont)
 
+def unboxed_vectors(a, b):
+    """ whether a and b are vectors without impersonators that store their
+    elements unboxed """
+    return (type(a) is values_vector.W_Vector and
+            type(b) is values_vector.W_Vector and
+            a.get_strategy().unboxed and b.get_strategy().unboxed)
+
+def equal_unboxed(a, b):
+    assert isinstance(a, values_vector.W_Vector)
+    assert isinstance(b, values_vector.W_Vector)
+    if not a.same_storage(b):
+        # fixnums, flonums and characters are never equal? to each other
+        return a.length() == 0
+    return a.get_strategy().equal_storage(a, b)
+
+class UnhashableError(Exception):
+    """ Raised by equal_hash_code when the hash code of a value can only be
+    computed by running user code (impersonators, prop:equal+hash). """
+
+# Upper bound on the number of values visited when hashing a compound value.
+# Values that are equal? have the same shape, so they visit the same prefix
+# and get the same code. This also makes hashing of cyclic data terminate.
+EQUAL_HASH_FUEL = 128
+
+def _hash_mix(x, y):
+    return rarithmetic.intmask((x ^ y) * 1000003)
+
+def equal_hash_code(w_obj):
+    """ An equal?-consistent hash code of w_obj that is computed without
+    calling back into the interpreter. Raises UnhashableError if that is not
+    possible. """
+    x = 0x345678
+    todo = [w_obj]
+    fuel = EQUAL_HASH_FUEL
+    while todo and fuel > 0:
+        w_v = todo.pop()
+        fuel -= 1
+        if isinstance(w_v, values.W_Cons):
+            x = _hash_mix(x, 1)
+            todo.append(w_v.cdr())
+            todo.append(w_v.car())
+        elif isinstance(w_v, values.W_MCons):
+            x = _hash_mix(x, 2)
+            todo.append(w_v.cdr())
+            todo.append(w_v.car())
+        elif isinstance(w_v, values.W_MBox):
+            x = _hash_mix(x, 3)
+            todo.append(w_v.value)
+        elif isinstance(w_v, values.W_IBox):
+            x = _hash_mix(x, 3)
+            todo.append(w_v.value)
+        elif isinstance(w_v, values.W_Box):
+            raise UnhashableError
+        elif isinstance(w_v, values_vector.W_Vector):
+            x = _hash_mix(x, _hash_mix(4, w_v.length()))
+            x, fuel = _hash_vector_items(w_v, x, fuel, todo)
+        elif isinstance(w_v, values_vector.W_FlVector):
+            x = _hash_mix(x, _hash_mix(5, w_v.length()))
+            x, fuel = _hash_vector_items(w_v, x, fuel, todo)
+        elif isinstance(w_v, values.W_MVector):
+            raise UnhashableError
+        elif isinstance(w_v, values.W_Complex):
+            x = _hash_mix(x, 6)
+            todo.append(w_v.imag)
+            todo.append(w_v.real)
+        elif isinstance(w_v, values_struct.W_Struct):
+            w_type = w_v.struct_type()
+            if w_type.read_prop(values_struct.w_prop_equal_hash):
+                raise UnhashableError
+            if w_type.isopaque:
+                x = _hash_mix(x, objectmodel.compute_hash(w_v))
+            else:
+                # mirrors the struct2vector comparison in equal_func_impl
+                fields = w_v.vals()
+                x = _hash_mix(x, _hash_mix(7, len(fields)))
+                x = _hash_mix(x, objectmodel.compute_hash(w_type.name))
+                i = min(len(fields), fuel)
+                while i > 0:
+                    i -= 1
+                    todo.append(fields[i])
+        elif isinstance(w_v, values_struct.W_RootStruct):
+            raise UnhashableError
+        else:
+            # strings, bytes, numbers, characters and everything compared by
+            # identity provide a hash_equal that agrees with equal?
+            x = _hash_mix(x, w_v.hash_equal())
+    return x
+
+@objectmodel.specialize.argtype(0)
+def _hash_vector_items(w_vector, x, fuel, todo):
+    count = min(w_vector.length(), fuel)
+    strategy = w_vector.get_strategy()
+    if strategy.unboxed:
+        # the same codes as pushing the elements, they are atoms that would
+        # be popped right away
+        for i in range(count):
+            x = _hash_mix(x, strategy.hash_item(w_vector, i))
+        return x, fuel - count
+    i = count
+    while i > 0:
+        i -= 1
+        todo.append(w_vector.ref(i))
+    return x, fuel
+
 # TODO: Should probably store these values in a uniform manner in the
 # struct property rather than parsing them every use.
 def equal_hash_args(w_prop):
@@ -206,7 +312,8 @@ def eqp_logic(a, b):
     elif isinstance(a, values.W_Fixnum) and isinstance(b, values.W_Fixnum):
         return a.value == b.value
     elif isinstance(a, values.W_Flonum) and isinstance(b, values.W_Flonum):
-        return a.value == b.value
+        # like eqv?, so that eq? tables can keep flonum keys unboxed
+        return a.eqv(b)
     elif isinstance(a, values.W_Character) and isinstance(b, values.W_Character):
         return a.value == b.value
     return False
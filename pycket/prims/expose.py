@@ -275,8 +275,11 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
         func_result_handling = _make_result_handling_func(func_arg_unwrap, simple)
         if not extra_info:
             func_result_handling = make_remove_extra_info(func_result_handling)
+        # the function of the list of arguments that returns the result,
+        # for primitives that don't need env and cont
+        call_n = func_arg_unwrap if simple else None
         cls = values.W_Prim
-        p = cls(name, func_result_handling, _arity, call1, call2)
+        p = cls(name, func_result_handling, _arity, call1, call2, call_n)
         for nam in names:
             sym = values.W_Symbol.make(nam)
             if sym in prim_env:
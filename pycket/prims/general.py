@@ -27,6 +27,7 @@ from pycket.prims import input_output
 from pycket.prims import numeric
 from pycket.prims import random
 from pycket.prims import regexp
+from pycket.prims import sort
 from pycket.prims import string
 from pycket.prims import struct_structinfo
 from pycket.prims import undefined
@@ -649,19 +650,13 @@ def notp(a):
 
 @expose("length", [values.W_List])
 def length(a):
-    n = 0
-    while True:
-        if a is values.w_null:
-            return values.W_Fixnum(n)
-        if isinstance(a, values.W_Cons):
-            a = a.cdr()
-            n = n+1
-        else:
-            raise SchemeException("length: not a list")
+    if not a.is_proper_list():
+        raise SchemeException("length: not a list")
+    return values.W_Fixnum(a.list_length())
 
 @expose("list")
 def do_list(args):
-    return values.to_list(args)
+    return values.to_array_list(args)
 
 @expose("list*")
 def do_liststar(args):
@@ -842,10 +837,12 @@ def do_map(args, env, cont):
 
     # FIXME: more errorchecking
     assert len(args) >= 0
-    return map_loop(fn, lists, env, cont)
+    return map_loop(fn, lists, [], env, cont)
 
 @loop_label
-def map_loop(f, lists, env, cont):
+def map_loop(f, lists, acc, env, cont):
+    """ acc are the results so far, the result list is only built at the
+    end, so that it can be kept in an array """
     from pycket.interpreter import return_value
     lists_new = []
     args = []
@@ -853,22 +850,31 @@ def map_loop(f, lists, env, cont):
         if not isinstance(l, values.W_Cons):
             if l is not values.w_null:
                 raise SchemeException("map: not given a proper list")
-            return return_value(values.w_null, env, cont)
+            return return_value(values.to_array_list(acc), env, cont)
         args.append(l.car())
         lists_new.append(l.cdr())
-    return f.call(args, env, map_first_cont(f, lists_new, env, cont))
+    return f.call(args, env, map_first_cont(f, lists_new, acc, len(acc), env, cont))
 
 @continuation
-def map_first_cont(f, lists, env, cont, _vals):
+def map_first_cont(f, lists, acc, n, env, cont, _vals):
     from pycket.interpreter import check_one_val
     val = check_one_val(_vals)
-    return map_loop(f, lists, env, map_cons_cont(f, lists, val, env, cont))
-
-@continuation
-def map_cons_cont(f, lists, val, env, cont, _vals):
-    from pycket.interpreter import check_one_val, return_value
-    rest = check_one_val(_vals)
-    return return_value(values.W_Cons.make(val, rest), env, cont)
+    if len(acc) != n:
+        # the continuation is re-entered, e.g. through call/cc, the results
+        # after the first n belong to the earlier return
+        acc = acc[:n]
+    acc.append(val)
+    return map_loop(f, lists, acc, env, cont)
+
+def reverse_to_array_list(w_l):
+    vals = []
+    while isinstance(w_l, values.W_Cons):
+        vals.append(w_l.car())
+        w_l = w_l.cdr()
+    if w_l is not values.w_null:
+        raise SchemeException("reverse: not given proper list")
+    vals.reverse()
+    return values.to_array_list(vals)
 
 @expose("for-each", simple=False)
 def for_each(args, env, cont):
@@ -905,20 +911,12 @@ def append(lists):
     lists, acc = lists[:-1], lists[-1]
     while lists:
         vals = values.from_list(lists.pop())
-        acc = values.to_improper(vals, acc)
+        acc = values.to_array_list(vals, acc)
     return acc
 
 @expose("reverse", [values.W_List])
 def reverse(w_l):
-    acc = values.w_null
-    while isinstance(w_l, values.W_Cons):
-        val, w_l = w_l.car(), w_l.cdr()
-        acc = values.W_Cons.make(val, acc)
-
-    if w_l is not values.w_null:
-        raise SchemeException("reverse: not given proper list")
-
-    return acc
+    return reverse_to_array_list(w_l)
 
 @expose("void")
 def do_void(args): return values.w_void
@@ -1007,21 +1005,23 @@ def listp(v):
 
 @expose("list-ref", [values.W_Cons, values.W_Fixnum])
 def list_ref(lst, pos):
-    # XXX inefficient
-    return values.from_list(lst)[pos.value]
+    if pos.value < 0:
+        raise SchemeException("list-ref: index must be non-negative")
+    w_rest = values.list_drop(lst, pos.value)
+    if not isinstance(w_rest, values.W_Cons):
+        raise SchemeException("list-ref: index too large for list")
+    return w_rest.car()
 
 @expose("list-tail", [values.W_Object, values.W_Fixnum])
 def list_tail(lst, pos):
-    start_pos = pos.value
-    if start_pos == 0:
-        return lst
-    else:
-        if isinstance(lst, values.W_Cons):
-            assert start_pos > 0
-            # XXX inefficient
-            return values.to_list(values.from_list(lst)[start_pos:])
-        else:
-            return values.w_null
+    if pos.value < 0:
+        raise SchemeException("list-tail: index must be non-negative")
+    if lst.is_proper_list() and pos.value > lst.list_length():
+        raise SchemeException("list-tail: index too large for list")
+    w_rest = values.list_drop(lst, pos.value)
+    if w_rest is None:
+        raise SchemeException("list-tail: index too large for list")
+    return w_rest
 
 @expose("current-inexact-milliseconds", [])
 def curr_millis():
@@ -1062,7 +1062,7 @@ def vector2list(v):
     es = []
     for i in range(v.len):
         es.append(v.ref(i))
-    return values.to_list(es)
+    return values.to_array_list(es)
 
 @expose("vector->immutable-vector", [values_vector.W_Vector])
 def vector2immutablevector(v):
@@ -1229,7 +1229,7 @@ def build_path(args):
     r = ""
     for a in args:
         if isinstance(a, values.W_Bytes):
-            r = r + str(a.value)
+            r = r + a.as_str()
         elif isinstance(a, values_string.W_String):
             r = r + a.as_str_utf8()
         elif isinstance(a, values.W_Path):
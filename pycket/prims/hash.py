@@ -4,8 +4,9 @@ from pycket              import impersonators as imp
 from pycket              import values
 from pycket.values_hash  import (
     W_HashTable, W_EqvHashTable, W_EqualHashTable, W_EqHashTable,
-    w_missing)
-from pycket.cont         import continuation
+    W_ImmutableEqualHashTable, W_ImmutableEqHashTable,
+    W_ImmutableEqvHashTable, w_missing)
+from pycket.cont         import continuation, loop_label
 from pycket.error        import SchemeException
 from pycket.prims.expose import default, expose, procedure, define_nyi
 
@@ -96,26 +97,68 @@ def make_weak_hasheq():
     # FIXME: not actually weak
     return W_EqvHashTable([], [])
 
-@expose("make-immutable-hash", [default(values.W_List, values.w_null)])
-def make_immutable_hash(assocs):
-    # FIXME: Not annotated as immutable
+@loop_label
+def hash_set_all(ht, keys, vals, i, env, cont):
+    """ pass ht with the keys from i on mapped to vals to cont """
+    from pycket.interpreter import return_value
+    if i >= len(keys):
+        return return_value(ht, env, cont)
+    return ht.hash_set_functional(keys[i], vals[i], env,
+            hash_set_all_cont(keys, vals, i, env, cont))
+
+@continuation
+def hash_set_all_cont(keys, vals, i, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    ht = check_one_val(_vals)
+    assert isinstance(ht, W_HashTable)
+    return hash_set_all(ht, keys, vals, i + 1, env, cont)
+
+@expose("make-immutable-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_immutable_hash(assocs, env, cont):
     lsts = values.from_list(assocs)
     keys = []
     vals = []
     for lst in lsts:
         if not isinstance(lst, values.W_Cons):
-            raise SchemeException("make-hash: expected list of pairs")
+            raise SchemeException("make-immutable-hash: expected list of pairs")
         keys.append(lst.car())
         vals.append(lst.cdr())
-    return W_EqualHashTable(keys, vals)
+    # the keys have to be compared with equal?, which can call user code
+    ht = W_ImmutableEqualHashTable.from_lists([], [])
+    return hash_set_all(ht, keys, vals, 0, env, cont)
+
+@expose("make-immutable-hasheq", [default(values.W_List, values.w_null)])
+def make_immutable_hasheq(assocs):
+    lsts = values.from_list(assocs)
+    keys = []
+    vals = []
+    for lst in lsts:
+        if not isinstance(lst, values.W_Cons):
+            raise SchemeException("make-immutable-hasheq: expected list of pairs")
+        keys.append(lst.car())
+        vals.append(lst.cdr())
+    return W_ImmutableEqHashTable.from_lists(keys, vals)
 
-@expose("hash")
-def hash(args):
+@expose("make-immutable-hasheqv", [default(values.W_List, values.w_null)])
+def make_immutable_hasheqv(assocs):
+    lsts = values.from_list(assocs)
+    keys = []
+    vals = []
+    for lst in lsts:
+        if not isinstance(lst, values.W_Cons):
+            raise SchemeException("make-immutable-hasheqv: expected list of pairs")
+        keys.append(lst.car())
+        vals.append(lst.cdr())
+    return W_ImmutableEqvHashTable.from_lists(keys, vals)
+
+@expose("hash", simple=False)
+def hash(args, env, cont):
     if len(args) % 2 != 0:
         raise SchemeException("hash: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqualHashTable(keys, vals)
+    ht = W_ImmutableEqualHashTable.from_lists([], [])
+    return hash_set_all(ht, keys, vals, 0, env, cont)
 
 @expose("hasheq")
 def hasheq(args):
@@ -123,7 +166,7 @@ def hasheq(args):
         raise SchemeException("hasheq: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqHashTable(keys, vals)
+    return W_ImmutableEqHashTable.from_lists(keys, vals)
 
 @expose("hasheqv")
 def hasheqv(args):
@@ -131,7 +174,7 @@ def hasheqv(args):
         raise SchemeException("hasheqv: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqvHashTable(keys, vals)
+    return W_ImmutableEqvHashTable.from_lists(keys, vals)
 
 @expose("make-hash", [default(values.W_List, values.w_null)])
 def make_hash(pairs):
@@ -173,7 +216,9 @@ def make_hasheqv(pairs):
 def hash_set_bang(ht, k, v, env, cont):
     return ht.hash_set(k, v, env, cont)
 
-define_nyi("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)
+@expose("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)
+def hash_set(ht, k, v, env, cont):
+    return ht.hash_set_functional(k, v, env, cont)
 
 @continuation
 def hash_ref_cont(default, env, cont, _vals):
@@ -195,7 +240,9 @@ def hash_ref(ht, k, default, env, cont):
 def hash_remove_bang(ht, k, env, cont):
     return ht.hash_remove(k, env, cont)
 
-define_nyi("hash-remove", [W_HashTable, values.W_Object])
+@expose("hash-remove", [W_HashTable, values.W_Object], simple=False)
+def hash_remove(ht, k, env, cont):
+    return ht.hash_remove_functional(k, env, cont)
 
 define_nyi("hash-clear!", [W_HashTable])
 
@@ -207,10 +254,14 @@ def hash_count(hash):
 
 define_nyi("hash-copy", [W_HashTable])
 
-# FIXME: not implemented
 @expose("equal-hash-code", [values.W_Object])
 def equal_hash_code(v):
-    return values.W_Fixnum(0)
+    from pycket.prims import equal
+    try:
+        return values.W_Fixnum(equal.equal_hash_code(v))
+    except equal.UnhashableError:
+        # FIXME: should call the prop:equal+hash procedures
+        return values.W_Fixnum(0)
 
 @expose("equal-secondary-hash-code", [values.W_Object])
 def equal_secondary_hash_code(v):
@@ -470,9 +470,8 @@ def file_position(args):
 @expose("display", [values.W_Object, default(values.W_OutputPort, None)], simple=False)
 def display(datum, out, env, cont):
     if isinstance(datum, values.W_Bytes):
-        bytes = datum.value
         port = current_out_param.get(cont) if out is None else out
-        write_bytes_avail(bytes, port , 0, len(bytes))
+        write_bytes_avail(datum, port , 0, datum.length())
         return return_void(env, cont)
     return do_print(datum.tostring(), out, env, cont)
 
@@ -677,29 +676,24 @@ def read_bytes_avail_bang(w_bstr, w_port, w_start, w_end, env, cont):
         raise SchemeException("read-bytes-avail!: given immutable byte string")
     if w_port is None:
         w_port = current_in_param.get(cont)
+    assert isinstance(w_bstr, values.W_MutableBytes)
     start = w_start.value
-    stop = len(w_bstr.value) if w_end is None else w_end.value
+    stop = w_bstr.length() if w_end is None else w_end.value
     if stop == start:
         return return_value(values.W_Fixnum(0), env, cont)
 
-
     # FIXME: assert something on indices
-    assert start >= 0 and stop <= len(w_bstr.value)
+    assert start >= 0 and stop <= w_bstr.length()
     n = stop - start
 
     res = w_port.read(n)
     reslen = len(res)
 
-    # shortcut without allocation when complete replace
-    if start == 0 and stop == len(w_bstr.value) and reslen == n:
-        w_bstr.value = list(res)
-        return return_value(values.W_Fixnum(reslen), env, cont)
-
     if reslen == 0:
         return return_value(values.eof_object, env, cont)
 
-    for i in range(0, reslen):
-        w_bstr.value[start + i] = res[i]
+    # when everything is replaced, the bytes just share the string read
+    w_bstr.setslice_str(start, res)
     return return_value(values.W_Fixnum(reslen), env, cont)
 
 # FIXME: implementation
@@ -744,16 +738,9 @@ def write_bytes_avail(w_bstr, w_port, start, stop):
         w_port.flush()
         return 0
 
-    if start == 0 and stop == len(w_bstr):
-        to_write = w_bstr
-    else:
-        slice_stop = stop
-        assert start >= 0 and slice_stop <= len(w_bstr)
-        assert slice_stop >= 0
-        to_write = w_bstr[start:slice_stop]
-
+    assert 0 <= start <= stop <= w_bstr.length()
     # FIXME: we fake here
-    w_port.write("".join(to_write))
+    w_port.write(w_bstr.getslice(start, stop))
     return stop - start
 
 @expose(["write-bytes", "write-bytes-avail"],
@@ -765,10 +752,11 @@ def wrap_write_bytes_avail(w_bstr, w_port, w_start, w_end, env, cont):
     # FIXME: custom ports
     if w_port is None:
         w_port = current_out_param.get(cont)
-    bytes = w_bstr.value
     start = 0 if w_start is None else w_start.value
-    stop = len(bytes) if w_end is None else w_end.value
-    n = write_bytes_avail(bytes, w_port, start, stop)
+    stop = w_bstr.length() if w_end is None else w_end.value
+    if not 0 <= start <= stop <= w_bstr.length():
+        raise SchemeException("write-bytes: index out of range")
+    n = write_bytes_avail(w_bstr, w_port, start, stop)
     return return_value(values.W_Fixnum(n), env, cont)
 
 # FIXME:
@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# sort, vector-sort and vector-sort! with a positional comparison procedure,
+# the keyword arguments are handled by the library wrappers.
+#
+# The built-in numeric comparisons on lists or vectors of only fixnums or only
+# flonums sort the unboxed numbers without calling back into the
+# interpreter. Any other procedure is called by a bottom-up merge sort that
+# runs in the CEK machine, one comparison per step. Both sorts are stable.
+#
+from pycket import values
+from pycket import vector as values_vector
+from pycket.cont import continuation, loop_label
+from pycket.error import SchemeException
+from pycket.prims.expose import default, expose, prim_env
+from pycket.prims.vector import check_range, copy_elements, vector_collect_loop
+from pycket.prims.vector import vector_copy_loop
+
+# imported for the comparisons in prim_env
+from pycket.prims import numeric
+
+def lookup(name):
+    return prim_env[values.W_Symbol.make(name)]
+
+FIXNUM_LESS = [lookup("<"), lookup("fx<"), lookup("unsafe-fx<")]
+FIXNUM_GREATER = [lookup(">"), lookup("fx>"), lookup("unsafe-fx>")]
+FLONUM_LESS = [lookup("<"), lookup("fl<"), lookup("unsafe-fl<")]
+FLONUM_GREATER = [lookup(">"), lookup("fl>"), lookup("unsafe-fl>")]
+
+ASCENDING = 1
+DESCENDING = -1
+UNKNOWN = 0
+
+def builtin_order(w_less, less, greater):
+    for w_prim in less:
+        if w_less is w_prim:
+            return ASCENDING
+    for w_prim in greater:
+        if w_less is w_prim:
+            return DESCENDING
+    return UNKNOWN
+
+def sort_numbers(items, w_less):
+    """ the sorted numbers of items if they are all fixnums or all flonums
+    and w_less is a comparison that applies to them, None otherwise """
+    if not items:
+        return None
+    if isinstance(items[0], values.W_Fixnum):
+        order = builtin_order(w_less, FIXNUM_LESS, FIXNUM_GREATER)
+        if order == UNKNOWN:
+            return None
+        ints = [0] * len(items)
+        for i in range(len(items)):
+            w_item = items[i]
+            if not isinstance(w_item, values.W_Fixnum):
+                return None
+            ints[i] = w_item.value
+        values_vector.sort_ints(ints, order == DESCENDING)
+        result = [None] * len(ints)
+        for i in range(len(ints)):
+            result[i] = values.W_Fixnum(ints[i])
+        return result
+    if isinstance(items[0], values.W_Flonum):
+        order = builtin_order(w_less, FLONUM_LESS, FLONUM_GREATER)
+        if order == UNKNOWN:
+            return None
+        floats = [0.0] * len(items)
+        for i in range(len(items)):
+            w_item = items[i]
+            if not isinstance(w_item, values.W_Flonum):
+                return None
+            floats[i] = w_item.value
+        values_vector.sort_floats(floats, order == DESCENDING)
+        result = [None] * len(floats)
+        for i in range(len(floats)):
+            result[i] = values.W_Flonum(floats[i])
+        return result
+    return None
+
+def unboxed_order(w_vector, w_less):
+    """ the order of w_less if it is a comparison that applies to the
+    unboxed numbers stored in w_vector """
+    strategy = w_vector.get_strategy()
+    if isinstance(strategy, values_vector.FixnumVectorStrategy):
+        return builtin_order(w_less, FIXNUM_LESS, FIXNUM_GREATER)
+    if isinstance(strategy, values_vector.FlonumVectorStrategy):
+        return builtin_order(w_less, FLONUM_LESS, FLONUM_GREATER)
+    return UNKNOWN
+
+def merge_sort(items, w_less, env, cont):
+    """ sort items with the procedure w_less, the result is a new vector.
+    items is used as scratch space. """
+    n = len(items)
+    return merge_sort_loop(w_less, items, [None] * n, 1, 0, 0, min(1, n), 0,
+                           env, cont)
+
+@loop_label
+def merge_sort_loop(w_less, src, dst, width, lo, i, j, k, env, cont):
+    """ merges the runs src[lo:lo+width] and src[lo+width:lo+2*width] into
+    dst[lo:], i and j are the next elements of the two runs and k the next
+    slot of dst """
+    from pycket.interpreter import return_value
+    src, dst, width, lo, i, j, k = next_comparison(src, dst, width, lo, i, j, k)
+    if width >= len(src):
+        return return_value(values_vector.W_Vector.fromelements(src), env, cont)
+    return w_less.call([src[j], src[i]], env,
+                       merge_sort_cont(w_less, src, dst, width, lo, i, j, k,
+                                       env, cont))
+
+def next_comparison(src, dst, width, lo, i, j, k):
+    """ the state of the merge sort at the next comparison, the elements
+    that are left over when a run is used up are copied on the way """
+    n = len(src)
+    while width < n:
+        mid = min(lo + width, n)
+        hi = min(lo + 2 * width, n)
+        if i < mid and j < hi:
+            break
+        while i < mid:
+            dst[k] = src[i]
+            i += 1
+            k += 1
+        while j < hi:
+            dst[k] = src[j]
+            j += 1
+            k += 1
+        lo = hi
+        if lo >= n:
+            src, dst = dst, src
+            width *= 2
+            lo = 0
+        i = lo
+        j = min(lo + width, n)
+        k = lo
+    return src, dst, width, lo, i, j, k
+
+@continuation
+def merge_sort_cont(w_less, src, dst, width, lo, i, j, k, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    # the right element only goes first if it is strictly smaller
+    if check_one_val(_vals) is not values.w_false:
+        dst[k] = src[j]
+        j += 1
+    else:
+        dst[k] = src[i]
+        i += 1
+    return merge_sort_loop(w_less, src, dst, width, lo, i, j, k + 1, env, cont)
+
+def vector_elements(w_vector, start, end):
+    items = [None] * (end - start)
+    for i in range(start, end):
+        items[i - start] = w_vector.unsafe_ref(i)
+    return items
+
+def check_less(name, w_less):
+    if not w_less.iscallable():
+        raise SchemeException("%s: expected a procedure" % name)
+
+@expose("sort", [values.W_List, values.W_Object], simple=False)
+def sort(w_lst, w_less, env, cont):
+    from pycket.interpreter import return_value
+    check_less("sort", w_less)
+    items = values.from_list(w_lst)
+    result = sort_numbers(items, w_less)
+    if result is not None:
+        return return_value(values.to_array_list(result), env, cont)
+    return merge_sort(items, w_less, env, sorted_list_cont(env, cont))
+
+@continuation
+def sorted_list_cont(env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    w_sorted = check_one_val(_vals)
+    assert isinstance(w_sorted, values_vector.W_Vector)
+    items = vector_elements(w_sorted, 0, w_sorted.length())
+    return return_value(values.to_array_list(items), env, cont)
+
+@expose("vector-sort",
+        [values.W_MVector, values.W_Object, default(values.W_Fixnum, None),
+         default(values.W_Fixnum, None)],
+        simple=False)
+def vector_sort(v, w_less, _start, _end, env, cont):
+    from pycket.interpreter import return_value
+    check_less("vector-sort", w_less)
+    start = _start.value if _start is not None else 0
+    end   = _end.value if _end is not None else v.length()
+    check_range("vector-sort", v, start, end)
+    if type(v) is values_vector.W_Vector:
+        order = unboxed_order(v, w_less)
+        if order != UNKNOWN:
+            w_copy = v.copy_range(start, end)
+            w_copy.get_strategy().sort_range(w_copy, 0, end - start,
+                                             order == DESCENDING)
+            return return_value(w_copy, env, cont)
+        return merge_sort(vector_elements(v, start, end), w_less, env, cont)
+    return vector_collect_loop([v], [start], [end], 0, start, values.w_null,
+                               env, vector_sort_collected_cont(w_less, env, cont))
+
+@expose("vector-sort!",
+        [values.W_MVector, values.W_Object, default(values.W_Fixnum, None),
+         default(values.W_Fixnum, None)],
+        simple=False)
+def vector_sort_bang(v, w_less, _start, _end, env, cont):
+    from pycket.interpreter import return_value
+    check_less("vector-sort!", w_less)
+    if v.immutable():
+        raise SchemeException("vector-sort!: given immutable vector")
+    start = _start.value if _start is not None else 0
+    end   = _end.value if _end is not None else v.length()
+    check_range("vector-sort!", v, start, end)
+    write_cont = vector_sort_write_cont(v, start, env, cont)
+    if type(v) is values_vector.W_Vector:
+        order = unboxed_order(v, w_less)
+        if order != UNKNOWN:
+            v.get_strategy().sort_range(v, start, end, order == DESCENDING)
+            return return_value(values.w_void, env, cont)
+        return merge_sort(vector_elements(v, start, end), w_less, env,
+                          write_cont)
+    return vector_collect_loop([v], [start], [end], 0, start, values.w_null,
+                               env, vector_sort_collected_cont(w_less, env,
+                                                               write_cont))
+
+@continuation
+def vector_sort_collected_cont(w_less, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    w_collected = check_one_val(_vals)
+    assert isinstance(w_collected, values_vector.W_Vector)
+    items = vector_elements(w_collected, 0, w_collected.length())
+    return merge_sort(items, w_less, env, cont)
+
+@continuation
+def vector_sort_write_cont(v, start, env, cont, _vals):
+    """ copy the sorted elements back into v """
+    from pycket.interpreter import check_one_val, return_value
+    w_sorted = check_one_val(_vals)
+    assert isinstance(w_sorted, values_vector.W_Vector)
+    n = w_sorted.length()
+    if type(v) is values_vector.W_Vector:
+        copy_elements(v, start, w_sorted, 0, n)
+        return return_value(values.w_void, env, cont)
+    return vector_copy_loop(w_sorted, 0, n, v, start, values.W_Fixnum(0),
+                            env, cont)
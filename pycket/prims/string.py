@@ -96,7 +96,7 @@ def string_to_bytes_locale(str, errbyte, start, end):
     assert start.value == 0
     assert end is None
     # FIXME: This ignores the locale
-    return values.W_Bytes(str.as_charlist_utf8())
+    return values.W_Bytes.from_string(str.as_str_utf8(), immutable=False)
 
 @expose("string->list", [W_String])
 def string_to_list(s):
@@ -186,23 +186,12 @@ def string_upcase(v):
 def string_append(args):
     if not args:
         return W_String.fromascii("")
-    builder = StringBuilder()
-    unibuilder = None
+    strings = []
     for a in args:
         if not isinstance(a, W_String):
             raise SchemeException("string-append: expected a string")
-        if unibuilder is None:
-            try:
-                builder.append(a.as_str_ascii())
-                continue
-            except ValueError:
-                unibuilder = UnicodeBuilder()
-                unibuilder.append(unicode(builder.build()))
-        unibuilder.append(a.as_unicode())
-    if unibuilder is None:
-        return W_String.fromascii(builder.build())
-    else:
-        return W_String.fromunicode(unibuilder.build())
+        strings.append(a)
+    return W_String.concat(strings)
 
 @expose("string-length", [W_String])
 def string_length(s1):
@@ -307,25 +296,17 @@ def bytes(args):
 
 @expose("bytes-append")
 def bytes_append(args):
-    lens = 0
+    builder = StringBuilder()
     for a in args:
         if not isinstance(a, values.W_Bytes):
             raise SchemeException(
                 "bytes-append: expected a byte string, but got %s" % a)
-        lens += len(a.value)
-
-    val = [' '] * lens # is this the fastest way to do things?
-    cnt = 0
-    for a in args:
-        assert isinstance(a, values.W_Bytes)
-        val[cnt:cnt+len(a.value)] = a.value
-        cnt += len(a.value)
-
-    return values.W_MutableBytes(val)
+        builder.append(a.as_str())
+    return values.W_Bytes.from_string(builder.build(), immutable=False)
 
 @expose("bytes-length", [values.W_Bytes])
 def bytes_length(s1):
-    return values.W_Fixnum(len(s1.value))
+    return values.W_Fixnum(s1.length())
 
 @expose("bytes-ref", [values.W_Bytes, values.W_Fixnum])
 def bytes_ref(s, n):
@@ -337,7 +318,7 @@ def bytes_set_bang(s, n, v):
 
 @expose("unsafe-bytes-length", [subclass_unsafe(values.W_Bytes)])
 def unsafe_bytes_length(s1):
-    return values.W_Fixnum(len(s1.value))
+    return values.W_Fixnum(s1.length())
 
 @expose("unsafe-bytes-ref", [subclass_unsafe(values.W_Bytes), unsafe(values.W_Fixnum)])
 def unsafe_bytes_ref(s, n):
@@ -372,20 +353,20 @@ def subbytes(w_bytes, w_start, w_end):
         start : exact-nonnegative-integer?
         end : exact-nonnegative-integer? = (bytes-length str)
     """
-    bytes = w_bytes.value
+    length = w_bytes.length()
     start = w_start.value
-    if start > len(bytes) or start < 0:
+    if start > length or start < 0:
         raise SchemeException("subbytes: end index out of bounds")
     if w_end is not None:
         end = w_end.value
-        if end > len(bytes) or end < 0:
+        if end > length or end < 0:
             raise SchemeException("subbytes: end index out of bounds")
     else:
-        end = len(bytes)
+        end = length
     if end < start:
         raise SchemeException(
             "subbytes: ending index is smaller than starting index")
-    return values.W_MutableBytes(bytes[start:end])
+    return w_bytes.subbytes(start, end)
 
 @expose(["bytes-copy!"],
          [values.W_Bytes, values.W_Fixnum, values.W_Bytes,
@@ -398,18 +379,21 @@ def bytes_copy_bang(w_dest, w_dest_start, w_src, w_src_start, w_src_end):
     if w_dest.immutable():
         raise SchemeException("bytes-copy!: given immutable bytes")
 
+    assert isinstance(w_dest, values.W_MutableBytes)
+
     dest_start = w_dest_start.value
-    dest_len = len(w_dest.value)
+    dest_len = w_dest.length()
     dest_max = (dest_len - dest_start)
 
     src_start =  w_src_start.value
-    src_end = len(w_src.value) if w_src_end is None else w_src_end.value
-
-    assert (src_end-src_start) <= dest_max
+    src_end = w_src.length() if w_src_end is None else w_src_end.value
 
-    for i in range(0, src_end - src_start):
-        w_dest.value[dest_start + i] = w_src.value[src_start + i]
+    if not (0 <= dest_start <= dest_len and 0 <= src_start <= src_end <= w_src.length()):
+        raise SchemeException("bytes-copy!: index out of range")
+    if src_end - src_start > dest_max:
+        raise SchemeException("bytes-copy!: not enough room in target bytes")
 
+    w_dest.setslice(dest_start, w_src, src_start, src_end)
     return values.w_void
 
 def define_bytes_comp(name, op):
@@ -424,7 +408,7 @@ def define_bytes_comp(name, op):
         for t in tail:
             if not isinstance(t, values.W_Bytes):
                 raise SchemeException(name + ": not given a bytes")
-            if not op(str(head.value), str(t.value)):
+            if not op(head.as_str(), t.as_str()):
                 return values.w_false
             head = t
         return values.w_true
@@ -4,7 +4,7 @@
 from pycket import impersonators as imp
 from pycket import values
 from pycket import vector as values_vector
-from pycket.cont import continuation, label
+from pycket.cont import continuation, label, loop_label
 from pycket.error import SchemeException
 from pycket.prims.expose import unsafe, default, expose, subclass_unsafe
 
@@ -84,19 +84,35 @@ def vector_copy(dest, _dest_start, src, _src_start, _src_end, env, cont):
     src_end    = _src_end.value if _src_end is not None else src.length()
     dest_start = _dest_start.value
 
-    src_range  = src_end - src_start
-    dest_range = dest.length() - dest_start
-
-    if not (0 <= dest_start < dest.length()):
+    if not (0 <= dest_start <= dest.length()):
         raise SchemeException("vector-copy!: destination start out of bounds")
-    if not (0 <= src_start < src.length()) or not (0 <= src_start < src.length()):
+    if not (0 <= src_start <= src_end <= src.length()):
         raise SchemeException("vector-copy!: source start/end out of bounds")
-    if dest_range < src_range:
+    if dest.length() - dest_start < src_end - src_start:
         raise SchemeException("vector-copy!: not enough room in target vector")
 
+    if (type(src) is values_vector.W_Vector and
+            type(dest) is values_vector.W_Vector):
+        from pycket.interpreter import return_value
+        copy_elements(dest, dest_start, src, src_start, src_end)
+        return return_value(values.w_void, env, cont)
     return vector_copy_loop(src, src_start, src_end,
                 dest, dest_start, values.W_Fixnum(0), env, cont)
 
+def copy_elements(dest, dest_start, src, src_start, src_end):
+    """ vector-copy! without impersonators, the elements are only boxed if
+    the vectors store them differently """
+    if dest.same_storage(src):
+        dest.get_strategy().copy_storage(dest, dest_start, src, src_start, src_end)
+    elif dest_start <= src_start:
+        for i in range(src_end - src_start):
+            dest.unsafe_set(dest_start + i, src.unsafe_ref(src_start + i))
+    else:
+        i = src_end - src_start - 1
+        while i >= 0:
+            dest.unsafe_set(dest_start + i, src.unsafe_ref(src_start + i))
+            i -= 1
+
 @label
 def vector_copy_loop(src, src_start, src_end, dest, dest_start, i, env, cont):
     from pycket.interpreter import return_value
@@ -123,6 +139,200 @@ def vector_copy_cont_get(src, src_start, src_end, dest, dest_start, i, env, cont
                 goto_vector_copy_loop(src, src_start, src_end,
                     dest, dest_start, next, env, cont))
 
+def check_range(name, v, start, end):
+    if not (0 <= start <= end <= v.length()):
+        raise SchemeException("%s: index out of range for vector of length %s"
+                              % (name, v.length()))
+
+def copy_range(v, start, end, env, cont):
+    """ a new mutable vector of the elements start to end of v """
+    from pycket.interpreter import return_value
+    if type(v) is values_vector.W_Vector:
+        return return_value(v.copy_range(start, end), env, cont)
+    return vector_collect_loop([v], [start], [end], 0, start, values.w_null,
+                               env, cont)
+
+@expose("vector-copy",
+        [values.W_MVector, default(values.W_Fixnum, None),
+         default(values.W_Fixnum, None)],
+        simple=False)
+def vector_copy_new(v, _start, _end, env, cont):
+    start = _start.value if _start is not None else 0
+    end   = _end.value if _end is not None else v.length()
+    check_range("vector-copy", v, start, end)
+    return copy_range(v, start, end, env, cont)
+
+@expose("vector-take", [values.W_MVector, values.W_Fixnum], simple=False)
+def vector_take(v, pos, env, cont):
+    check_range("vector-take", v, 0, pos.value)
+    return copy_range(v, 0, pos.value, env, cont)
+
+@expose("vector-drop", [values.W_MVector, values.W_Fixnum], simple=False)
+def vector_drop(v, pos, env, cont):
+    check_range("vector-drop", v, pos.value, v.length())
+    return copy_range(v, pos.value, v.length(), env, cont)
+
+@expose("vector-append", simple=False)
+def vector_append(args, env, cont):
+    from pycket.interpreter import return_value
+    vectors = []
+    length = 0
+    plain = True
+    for w_arg in args:
+        if not isinstance(w_arg, values.W_MVector):
+            raise SchemeException("vector-append: expected a vector")
+        if type(w_arg) is not values_vector.W_Vector:
+            plain = False
+        vectors.append(w_arg)
+        length += w_arg.length()
+    if not vectors:
+        return return_value(values_vector.W_Vector.fromelements([]), env, cont)
+    if not plain:
+        return vector_collect_loop(vectors, [0] * len(vectors),
+                                   [v.length() for v in vectors], 0, 0,
+                                   values.w_null, env, cont)
+    return return_value(append_vectors(vectors, length), env, cont)
+
+def append_vectors(vectors, length):
+    first = vectors[0]
+    assert isinstance(first, values_vector.W_Vector)
+    for w_vector in vectors:
+        assert isinstance(w_vector, values_vector.W_Vector)
+        if not first.same_storage(w_vector):
+            break
+    else:
+        strategy = first.get_strategy().mutable_strategy()
+        storage = strategy.append_storage(vectors, length)
+        return values_vector.W_Vector(strategy, storage, length)
+    elements = [None] * length
+    pos = 0
+    for w_vector in vectors:
+        assert isinstance(w_vector, values_vector.W_Vector)
+        for i in range(w_vector.length()):
+            elements[pos] = w_vector.unsafe_ref(i)
+            pos += 1
+    return values_vector.W_Vector.fromelements(elements)
+
+@label
+def vector_collect_loop(vectors, starts, ends, k, i, acc, env, cont):
+    """ the elements of the ranges of the impersonated vectors, read with
+    vector_ref; acc contains the elements read so far in reverse """
+    from pycket.interpreter import return_value
+    if i >= ends[k]:
+        if k + 1 < len(vectors):
+            return vector_collect_loop(vectors, starts, ends, k + 1,
+                                       starts[k + 1], acc, env, cont)
+        elements = values.from_list(acc)
+        elements.reverse()
+        return return_value(values_vector.W_Vector.fromelements(elements),
+                            env, cont)
+    return vectors[k].vector_ref(values.W_Fixnum(i), env,
+                vector_collect_cont(vectors, starts, ends, k, i, acc, env, cont))
+
+@continuation
+def vector_collect_cont(vectors, starts, ends, k, i, acc, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    val = check_one_val(_vals)
+    return vector_collect_loop(vectors, starts, ends, k, i + 1,
+                               values.W_Cons.make(val, acc), env, cont)
+
+@expose("vector-fill!", [values.W_MVector, values.W_Object], simple=False)
+def vector_fill(v, val, env, cont):
+    from pycket.interpreter import return_value
+    if v.immutable():
+        raise SchemeException("vector-fill!: given immutable vector")
+    if type(v) is values_vector.W_Vector:
+        v.fill(val)
+        return return_value(values.w_void, env, cont)
+    return vector_fill_loop(v, val, 0, env, cont)
+
+@label
+def vector_fill_loop(v, val, i, env, cont):
+    from pycket.interpreter import return_value
+    if i >= v.length():
+        return return_value(values.w_void, env, cont)
+    return v.vector_set(values.W_Fixnum(i), val, env,
+                        vector_fill_cont(v, val, i + 1, env, cont))
+
+@continuation
+def vector_fill_cont(v, val, i, env, cont, _vals):
+    return vector_fill_loop(v, val, i, env, cont)
+
+def check_vector_map_args(name, args):
+    if len(args) < 2:
+        raise SchemeException("%s: expected a procedure and at least one vector"
+                              % name)
+    f = args[0]
+    if not f.iscallable():
+        raise SchemeException("%s: expected a procedure" % name)
+    vectors = args[1:]
+    length = -1
+    for w_vector in vectors:
+        if not isinstance(w_vector, values.W_MVector):
+            raise SchemeException("%s: expected a vector" % name)
+        if length == -1:
+            length = w_vector.length()
+        elif w_vector.length() != length:
+            raise SchemeException("%s: all vectors must have same size" % name)
+    return f, vectors, length
+
+def vector_map_start(f, vectors, length, results, env, cont):
+    for w_vector in vectors:
+        if type(w_vector) is not values_vector.W_Vector:
+            break
+    else:
+        return vector_map_loop(f, vectors, 0, length, results, env, cont)
+    # the elements of impersonated vectors are read up front
+    count = len(vectors)
+    return vector_collect_loop(vectors, [0] * count, [length] * count, 0, 0,
+                               values.w_null, env,
+                               vector_map_collected_cont(f, count, length,
+                                                         results, env, cont))
+
+@expose("vector-map", simple=False)
+def vector_map(args, env, cont):
+    f, vectors, length = check_vector_map_args("vector-map", args)
+    return vector_map_start(f, vectors, length, [None] * length, env, cont)
+
+@expose("vector-for-each", simple=False)
+def vector_for_each(args, env, cont):
+    f, vectors, length = check_vector_map_args("vector-for-each", args)
+    return vector_map_start(f, vectors, length, None, env, cont)
+
+@continuation
+def vector_map_collected_cont(f, count, length, results, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    w_all = check_one_val(_vals)
+    assert isinstance(w_all, values_vector.W_Vector)
+    vectors = [None] * count
+    for k in range(count):
+        vectors[k] = w_all.copy_range(k * length, (k + 1) * length)
+    return vector_map_loop(f, vectors, 0, length, results, env, cont)
+
+@loop_label
+def vector_map_loop(f, vectors, i, length, results, env, cont):
+    """ results is None for vector-for-each """
+    from pycket.interpreter import return_value
+    if i >= length:
+        if results is None:
+            return return_value(values.w_void, env, cont)
+        return return_value(values_vector.W_Vector.fromelements(results),
+                            env, cont)
+    args = [None] * len(vectors)
+    for k in range(len(vectors)):
+        w_vector = vectors[k]
+        assert isinstance(w_vector, values_vector.W_Vector)
+        args[k] = w_vector.unsafe_ref(i)
+    return f.call(args, env,
+                  vector_map_cont(f, vectors, i, length, results, env, cont))
+
+@continuation
+def vector_map_cont(f, vectors, i, length, results, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    if results is not None:
+        results[i] = check_one_val(_vals)
+    return vector_map_loop(f, vectors, i + 1, length, results, env, cont)
+
 # FIXME: Chaperones
 @expose("unsafe-vector-ref", [subclass_unsafe(values.W_MVector), unsafe(values.W_Fixnum)], simple=False)
 def unsafe_vector_ref(v, i, env, cont):
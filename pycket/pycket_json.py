@@ -1,10 +1,30 @@
-from rpython.rlib.rstring import StringBuilder
-from rpython.rlib.runicode import unicode_encode_utf_8
-from rpython.rlib.objectmodel import specialize
-from rpython.rlib.parsing.ebnfparse import parse_ebnf, make_parse_function
-from rpython.rlib.parsing.tree import Symbol, Nonterminal, RPythonVisitor
+from rpython.rlib.rstring import StringBuilder, ParseStringError, ParseStringOverflowError
+from rpython.rlib.rarithmetic import string_to_int
+from rpython.rlib.rfloat import string_to_float
 from rpython.tool.pairtype import extendabletype
 
+def string_escape_encode(s, quote):
+    builder = StringBuilder(len(s) + 2)
+    builder.append(quote)
+    for c in s:
+        if c == '\\' or c == quote:
+            builder.append('\\')
+            builder.append(c)
+        elif c == '\t':
+            builder.append('\\t')
+        elif c == '\n':
+            builder.append('\\n')
+        elif c == '\r':
+            builder.append('\\r')
+        elif c < ' ' or c >= '\x7f':
+            builder.append('\\x')
+            builder.append("0123456789abcdef"[ord(c) >> 4])
+            builder.append("0123456789abcdef"[ord(c) & 0xf])
+        else:
+            builder.append(c)
+    builder.append(quote)
+    return builder.build()
+
 # Union-Object to represent a json structure in a static way
 class JsonBase(object):
     __metaclass__ = extendabletype
@@ -111,8 +131,6 @@ class JsonString(JsonPrimitive):
         self.value = value
 
     def tostring(self):
-        # this function should really live in a slightly more accessible place
-        from pypy.objspace.std.bytesobject import string_escape_encode
         return string_escape_encode(self.value, '"')
 
     def _unpack_deep(self):
@@ -161,117 +179,307 @@ json_true = JsonTrue()
 json_false = JsonFalse()
 
 
-class FakeSpace(object):
-
-    w_None = json_null
-    w_True = json_true
-    w_False = json_false
-    w_ValueError = ValueError
-    w_UnicodeDecodeError = UnicodeDecodeError
-    w_UnicodeEncodeError = UnicodeEncodeError
-    w_int = JsonInt
-    w_float = JsonFloat
-
-    def newtuple(self, items):
-        return None
-
-    def newdict(self):
-        return JsonObject({})
-
-    def newlist(self, items):
-        return JsonArray([])
-
-    def call_method(self, obj, name, arg):
-        assert name == 'append'
-        assert isinstance(obj, JsonArray)
-        obj.value.append(arg)
-    call_method._dont_inline_ = True
-
-    def call_function(self, w_func, *args_w):
-        assert 0
-
-    def setitem(self, d, key, value):
-        assert isinstance(d, JsonObject)
-        assert isinstance(key, JsonString)
-        d.value[key.value_string()] = value
-
-    def wrapunicode(self, x):
-        return JsonString(unicode_encode_utf_8(x, len(x), "strict"))
-
-    def wrapint(self, x):
-        return JsonInt(x)
-
-    def wrapfloat(self, x):
-        return JsonFloat(x)
-
-    def wrap(self, x):
-        if isinstance(x, int):
-            return JsonInt(x)
-        elif isinstance(x, float):
-            return JsonFloat(x)
-        return self.wrapunicode(unicode(x))
-    wrap._annspecialcase_ = "specialize:argtype(1)"
+class JsonPullParser(object):
+    """ A single pass JSON parser. It can be used to build the JsonBase tree
+    of a whole document (see loads), or be driven value by value, so that
+    large arrays and objects can be consumed without ever materializing all
+    of them:
 
-fakespace = FakeSpace()
-
-from pypy.module._pypyjson.interp_decoder import JSONDecoder
+        parser.start_object()
+        while True:
+            key = parser.next_key()      # None at the end of the object
+            if key is None:
+                break
+            value = parser.read_value()  # or parser.skip_value()
+        parser.start_array()
+        while parser.next_item():        # False at the end of the array
+            value = parser.read_value()
+        parser.finish()
+    """
 
-class OwnJSONDecoder(JSONDecoder):
     def __init__(self, s):
-        self.space = fakespace
         self.s = s
-        # we put our string in a raw buffer so:
-        # 1) we automatically get the '\0' sentinel at the end of the string,
-        #    which means that we never have to check for the "end of string"
-        self.ll_chars = s + chr(0)
         self.pos = 0
-        self.last_type = 0
-
-    def close(self):
-        pass
+        self.first = False
 
-    @specialize.arg(1)
-    def _raise(self, msg, *args):
-        raise ValueError(msg % args)
+    def _raise(self, msg):
+        raise ValueError("%s at char %d" % (msg, self.pos))
 
-    def decode_float(self, i):
-        start = i
-        while self.ll_chars[i] in "+-0123456789.eE":
+    def skip_whitespace(self):
+        s = self.s
+        i = self.pos
+        while i < len(s) and s[i] in " \t\n\r":
             i += 1
         self.pos = i
-        return self.space.wrap(float(self.getslice(start, i)))
 
-    def decode_string(self, i):
-        start = i
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.s):
+            self._raise("Unexpected end of data")
+        return self.s[self.pos]
+
+    def expect(self, c):
+        if self.peek() != c:
+            self._raise("Expected '%s'" % c)
+        self.pos += 1
+
+    # ____________________________________________________________
+    # the pull interface
+
+    def start_object(self):
+        self.expect('{')
+        self.first = True
+
+    def next_key(self):
+        """ the key of the next member of the current object, or None if
+        there are no more; the value has to be consumed next """
+        c = self.peek()
+        if c == '}':
+            self.pos += 1
+            self.first = False
+            return None
+        if not self.first:
+            self.expect(',')
+        self.first = False
+        if self.peek() != '"':
+            self._raise("Expected a key")
+        self.pos += 1
+        key = self.parse_string()
+        self.expect(':')
+        return key
+
+    def start_array(self):
+        self.expect('[')
+        self.first = True
+
+    def next_item(self):
+        """ whether the current array has another element, which has to be
+        consumed next """
+        c = self.peek()
+        if c == ']':
+            self.pos += 1
+            self.first = False
+            return False
+        if not self.first:
+            self.expect(',')
+        self.first = False
+        return True
+
+    def read_value(self):
+        return self.parse_value()
+
+    def skip_value(self):
+        self.parse_value()
+
+    def finish(self):
+        self.skip_whitespace()
+        if self.pos < len(self.s):
+            raise ValueError("Extra data: char %d - %d" % (self.pos, len(self.s) - 1))
+
+    # ____________________________________________________________
+    # building the tree
+
+    def parse_value(self):
+        c = self.peek()
+        if c == '{':
+            self.pos += 1
+            return self.parse_object()
+        if c == '[':
+            self.pos += 1
+            return self.parse_array()
+        if c == '"':
+            self.pos += 1
+            return JsonString(self.parse_string())
+        if c == 't':
+            return self.parse_constant("true", json_true)
+        if c == 'f':
+            return self.parse_constant("false", json_false)
+        if c == 'n':
+            return self.parse_constant("null", json_null)
+        if c == '-' or '0' <= c <= '9':
+            return self.parse_number()
+        self._raise("No JSON object could be decoded")
+        assert 0
+
+    def parse_constant(self, name, w_value):
+        stop = self.pos + len(name)
+        if self.s[self.pos:stop] != name:
+            self._raise("Error when decoding %s" % name)
+        self.pos = stop
+        return w_value
+
+    def parse_object(self):
+        dct = {}
+        if self.peek() == '}':
+            self.pos += 1
+            return JsonObject(dct)
+        while True:
+            self.expect('"')
+            key = self.parse_string()
+            self.expect(':')
+            dct[key] = self.parse_value()
+            c = self.peek()
+            self.pos += 1
+            if c == '}':
+                return JsonObject(dct)
+            if c != ',':
+                self._raise("Unexpected '%s' when decoding object" % c)
+
+    def parse_array(self):
+        lst = []
+        if self.peek() == ']':
+            self.pos += 1
+            return JsonArray(lst)
         while True:
-            # this loop is a fast path for strings which do not contain escape
-            # characters
-            ch = self.ll_chars[i]
+            lst.append(self.parse_value())
+            c = self.peek()
+            self.pos += 1
+            if c == ']':
+                return JsonArray(lst)
+            if c != ',':
+                self._raise("Unexpected '%s' when decoding array" % c)
+
+    def parse_number(self):
+        s = self.s
+        start = self.pos
+        i = start
+        if s[i] == '-':
             i += 1
-            if ch == '"':
-                content_utf8 = self.getslice(start, i-1)
-                self.last_type = 1
+        is_float = False
+        while i < len(s):
+            c = s[i]
+            if '0' <= c <= '9':
+                pass
+            elif c in ".eE+-":
+                is_float = True
+            else:
+                break
+            i += 1
+        self.pos = i
+        assert i >= 0
+        text = s[start:i]
+        if not is_float:
+            try:
+                return JsonInt(string_to_int(text))
+            except ParseStringOverflowError:
+                pass
+            except ParseStringError:
+                self._raise("Invalid number")
+        try:
+            return JsonFloat(string_to_float(text))
+        except ParseStringError:
+            self._raise("Invalid number")
+        assert 0
+
+    def parse_string(self):
+        """ the content of the string starting at self.pos (after the opening
+        quote) as utf-8 """
+        s = self.s
+        start = i = self.pos
+        # fast path for strings without escapes
+        while i < len(s):
+            c = s[i]
+            if c == '"':
+                self.pos = i + 1
+                assert i >= 0
+                return s[start:i]
+            if c == '\\':
+                return self.parse_string_escaped(start, i)
+            if c < '\x20':
                 self.pos = i
-                return JsonString(content_utf8)
-            elif ch == '\\':
-                content_so_far = self.getslice(start, i-1)
-                self.pos = i-1
-                return self.decode_string_escaped(start, content_so_far)
-            elif ch < '\x20':
-                self._raise("Invalid control character at char %d", self.pos-1)
+                self._raise("Invalid control character")
+            i += 1
+        self._raise("Unterminated string")
+        assert 0
 
+    def parse_string_escaped(self, start, i):
+        s = self.s
+        builder = StringBuilder(i - start + 16)
+        builder.append_slice(s, start, i)
+        while i < len(s):
+            c = s[i]
+            i += 1
+            if c == '"':
+                self.pos = i
+                return builder.build()
+            if c < '\x20':
+                self.pos = i - 1
+                self._raise("Invalid control character")
+            if c != '\\':
+                builder.append(c)
+                continue
+            if i >= len(s):
+                break
+            c = s[i]
+            i += 1
+            if c == '"' or c == '\\' or c == '/':
+                builder.append(c)
+            elif c == 'b':
+                builder.append('\b')
+            elif c == 'f':
+                builder.append('\f')
+            elif c == 'n':
+                builder.append('\n')
+            elif c == 'r':
+                builder.append('\r')
+            elif c == 't':
+                builder.append('\t')
+            elif c == 'u':
+                code = self.parse_hex4(i)
+                i += 4
+                if (0xd800 <= code <= 0xdbff and i + 1 < len(s) and
+                        s[i] == '\\' and s[i + 1] == 'u'):
+                    low = self.parse_hex4(i + 2)
+                    if 0xdc00 <= low <= 0xdfff:
+                        code = 0x10000 + (((code - 0xd800) << 10) | (low - 0xdc00))
+                        i += 6
+                append_utf8(builder, code)
+            else:
+                self.pos = i - 1
+                self._raise("Invalid \\escape")
+        self.pos = i
+        self._raise("Unterminated string")
+        assert 0
 
+    def parse_hex4(self, i):
+        s = self.s
+        if i + 4 > len(s):
+            self.pos = i
+            self._raise("Invalid \\uXXXX escape")
+        code = 0
+        for j in range(i, i + 4):
+            c = s[j]
+            if '0' <= c <= '9':
+                digit = ord(c) - ord('0')
+            elif 'a' <= c <= 'f':
+                digit = ord(c) - ord('a') + 10
+            elif 'A' <= c <= 'F':
+                digit = ord(c) - ord('A') + 10
+            else:
+                self.pos = j
+                self._raise("Invalid \\uXXXX escape")
+                assert 0
+            code = code * 16 + digit
+        return code
+
+def append_utf8(builder, code):
+    if code < 0x80:
+        builder.append(chr(code))
+    elif code < 0x800:
+        builder.append(chr(0xc0 | (code >> 6)))
+        builder.append(chr(0x80 | (code & 0x3f)))
+    elif code < 0x10000:
+        builder.append(chr(0xe0 | (code >> 12)))
+        builder.append(chr(0x80 | ((code >> 6) & 0x3f)))
+        builder.append(chr(0x80 | (code & 0x3f)))
+    else:
+        builder.append(chr(0xf0 | (code >> 18)))
+        builder.append(chr(0x80 | ((code >> 12) & 0x3f)))
+        builder.append(chr(0x80 | ((code >> 6) & 0x3f)))
+        builder.append(chr(0x80 | (code & 0x3f)))
 
 def loads(s):
-    decoder = OwnJSONDecoder(s)
-    try:
-        w_res = decoder.decode_any(0)
-        i = decoder.skip_whitespace(decoder.pos)
-        if i < len(s):
-            start = i
-            end = len(s) - 1
-            raise ValueError("Extra data: char %d - %d" % (start, end))
-        return w_res
-    finally:
-        decoder.close()
-
+    parser = JsonPullParser(s)
+    w_res = parser.read_value()
+    parser.finish()
+    return w_res
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Sampling profiler (--profile-sample <file>). A SIGPROF timer sets a flag
+# that the two-state interpreter loop checks on every iteration, also in
+# compiled code. When it is set, the continuation is walked to find the
+# lambdas that are being executed, and the stack is counted. At exit the
+# stacks are written in the collapsed format of flame graphs,
+#
+#   <module>;<outermost lambda>;...;<innermost lambda> <samples>
+#
+from rpython.rlib import jit
+from rpython.rlib.objectmodel import we_are_translated
+from rpython.rlib import streamio
+
+from pycket.cont import Cont
+
+# recursive calls of the same lambda show up as one frame, this only limits
+# the stacks of mutual recursion
+MAX_DEPTH = 100
+
+class SamplingProfiler(object):
+    _immutable_fields_ = ["active?"]
+
+    def __init__(self):
+        self.active = False
+        self.interval_usec = 1000
+        self.stacks = {}
+        self.samples = 0
+        self.flag = False # only used untranslated
+
+    def start(self, interval_usec=1000):
+        self.interval_usec = interval_usec
+        if we_are_translated():
+            from rpython.rlib import rsignal
+            rsignal.pypysig_setflag(rsignal.SIGPROF)
+            set_timer(interval_usec)
+        else:
+            import signal
+            def handler(signum, frame):
+                self.flag = True
+            old_handler = signal.signal(signal.SIGPROF, handler)
+            try:
+                signal.setitimer(signal.ITIMER_PROF, interval_usec / 1000000.0,
+                                 interval_usec / 1000000.0)
+            except:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, old_handler)
+                raise
+        # only set once the timer runs, stop() turns it off again
+        self.active = True
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        if we_are_translated():
+            from rpython.rlib import rsignal
+            set_timer(0)
+            rsignal.pypysig_ignore(rsignal.SIGPROF)
+        else:
+            import signal
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    def sample_due(self):
+        if we_are_translated():
+            from rpython.rlib import rsignal
+            return rsignal.pypysig_getaddr_occurred().c_value < 0
+        return self.flag
+
+    @jit.dont_look_inside
+    def sample(self, ast, cont):
+        self.reset_flag()
+        self.samples += 1
+        lams = []
+        add_frame(lams, ast)
+        k = cont
+        while isinstance(k, Cont) and len(lams) < MAX_DEPTH:
+            add_frame(lams, k.get_ast())
+            k = k.prev
+        frames = ["<module>"]
+        for i in range(len(lams) - 1, -1, -1):
+            frames.append(frame_name(lams[i]))
+        key = ";".join(frames)
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def reset_flag(self):
+        if we_are_translated():
+            from rpython.rlib import rsignal
+            rsignal.pypysig_getaddr_occurred().c_value = 0
+            while rsignal.pypysig_poll() >= 0:
+                pass
+        else:
+            self.flag = False
+
+    def collapsed_stacks(self):
+        lines = []
+        for key, count in self.stacks.iteritems():
+            lines.append("%s %s\n" % (key, count))
+        return "".join(lines)
+
+    def dump(self, fname):
+        self.stop()
+        f = streamio.open_file_as_stream(fname, "w")
+        f.write(self.collapsed_stacks())
+        f.close()
+
+sampling_profiler = SamplingProfiler()
+
+def set_timer(interval_usec):
+    from rpython.rlib import rsignal
+    from rpython.rtyper.lltypesystem import lltype, rffi
+    sec = interval_usec / 1000000
+    usec = interval_usec % 1000000
+    with lltype.scoped_alloc(rsignal.itimervalP.TO, 1) as timer:
+        rffi.setintfield(timer[0].c_it_value, 'c_tv_sec', sec)
+        rffi.setintfield(timer[0].c_it_value, 'c_tv_usec', usec)
+        rffi.setintfield(timer[0].c_it_interval, 'c_tv_sec', sec)
+        rffi.setintfield(timer[0].c_it_interval, 'c_tv_usec', usec)
+        rsignal.c_setitimer(rsignal.ITIMER_PROF, timer,
+                            lltype.nullptr(rsignal.itimervalP.TO))
+
+def add_frame(lams, ast):
+    """ the continuations without an AST of their own repeat the AST of the
+    next one, and recursive calls repeat the lambda, these are skipped """
+    if ast is None:
+        return
+    lam = ast.surrounding_lambda
+    if lam is None:
+        return
+    if lams and lams[-1] is lam:
+        return
+    lams.append(lam)
+
+def frame_name(lam):
+    if not lam.srcfile:
+        return "<lambda>"
+    name = lam.srcfile
+    slash = name.rfind("/") + 1
+    if slash > 0:
+        name = name[slash:]
+    if lam.srcpos < 0:
+        return name
+    return "%s:%s" % (name, lam.srcpos)
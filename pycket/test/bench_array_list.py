@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Count the objects allocated by a list of [length] fixnums, built as one cons
+# per element, as a cdr-coded list whose cdr allocated a fresh view every
+# time (the first version of W_ArrayCons) and as the cdr-coded list that keeps
+# its conses, and time building it and walking it [walks] times:
+#
+#   python pycket/test/bench_array_list.py [length] [walks]
+#
+# length and list-ref only look at the array, a walk cdrs through all of it.
+#
+import sys
+import time
+
+from pycket.values import (W_Fixnum, W_Cons, W_ArrayCons, to_improper,
+    to_array_list, w_null)
+
+class OldArrayCons(W_Cons):
+    """ the W_ArrayCons that made its cdr on demand """
+    allocated = 0
+
+    def __init__(self, items, index, tail):
+        OldArrayCons.allocated += 1
+        self.items = items
+        self.index = index
+        self.tail = tail
+
+    def car(self):
+        return self.items[self.index]
+
+    def cdr(self):
+        index = self.index + 1
+        if index == len(self.items):
+            return self.tail
+        return OldArrayCons(self.items, index, self.tail)
+
+def make_conses(elems):
+    return to_improper(elems, w_null)
+
+def make_old(elems):
+    return OldArrayCons(elems[:], 0, w_null)
+
+def make_new(elems):
+    return to_array_list(elems)
+
+def count_old(w_lst):
+    # the items array and the views
+    return 1 + OldArrayCons.allocated
+
+def count_new(w_lst):
+    # the items array, the storage, the first cons, the cells array and the
+    # conses in it
+    assert isinstance(w_lst, W_ArrayCons)
+    storage = w_lst.storage
+    if storage.cells is None:
+        return 3
+    return 4 + len([c for c in storage.cells if c is not None])
+
+def walk(w_lst):
+    while isinstance(w_lst, W_Cons):
+        w_lst.car()
+        w_lst = w_lst.cdr()
+
+def bench(make, length, walks):
+    elems = [W_Fixnum(i) for i in range(length)]
+    OldArrayCons.allocated = 0
+    start = time.time()
+    w_lst = make(elems)
+    for i in range(walks):
+        walk(w_lst)
+    return w_lst, time.time() - start
+
+def main(argv):
+    length = int(argv[1]) if len(argv) > 1 else 1000
+    walks = int(argv[2]) if len(argv) > 2 else 10
+    for nwalks in [0, 1, walks]:
+        w_conses, t_conses = bench(make_conses, length, nwalks)
+        w_old, t_old = bench(make_old, length, nwalks)
+        old = count_old(w_old)
+        w_new, t_new = bench(make_new, length, nwalks)
+        new = count_new(w_new)
+        print "%d walks: conses %d objects %s s, views %d objects %s s, " \
+              "cells %d objects %s s" % (
+            nwalks, length, t_conses, old, t_old, new, t_new)
+    return 0
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Register 10^5 call edges with the callgraph and compare with the recursion
+# search it replaced, which ran a fresh depth-first search per edge:
+#
+#   python pycket/test/bench_callgraph.py [edges] [lambdas] [old-edges]
+#
+# The old search only gets the first [old-edges] edges, it takes far too long
+# for all of them.
+#
+import time
+import random
+
+from pycket.callgraph import CallGraph
+
+class FakeLambda(object):
+    def __init__(self, i):
+        self.i = i
+        self.in_cycle = False
+
+    def set_in_cycle(self):
+        self.in_cycle = True
+
+class OldCallGraph(object):
+    """ the old CallGraph.is_recursive """
+    def __init__(self):
+        self.calls = {}
+        self.recursive = {}
+
+    def add_edge(self, caller, callee):
+        self.calls.setdefault(caller, {})[callee] = None
+        self.is_recursive(caller, callee)
+
+    def is_recursive(self, lam, starting_from):
+        if lam in self.recursive:
+            return True
+        todo = [(key, [starting_from]) for key in self.calls.get(starting_from, {})]
+        visited = {}
+        while todo:
+            current, path = todo.pop()
+            if current is lam:
+                lam.set_in_cycle()
+                self.recursive[lam] = None
+                for node in path:
+                    node.set_in_cycle()
+                    self.recursive[node] = None
+                return True
+            if current in visited:
+                continue
+            for key in self.calls.get(current, {}):
+                todo.append((key, path + [current]))
+            visited[current] = None
+        return False
+
+def make_edges(num_edges, num_lambdas, seed=42):
+    """ mostly calls from outer to inner functions, with some recursion. The
+    lambdas are numbered in the order a program would first call them. """
+    rng = random.Random(seed)
+    lams = [FakeLambda(i) for i in range(num_lambdas)]
+    edges = []
+    while len(edges) < num_edges:
+        i = rng.randrange(num_lambdas)
+        if rng.random() < 0.9:
+            j = min(num_lambdas - 1, i + rng.randrange(1, 50))
+        else:
+            j = rng.randrange(num_lambdas)
+        edges.append((i, j))
+    edges.sort()
+    return [(lams[i], lams[j]) for i, j in edges]
+
+def bench(graph, edges):
+    start = time.time()
+    for caller, callee in edges:
+        graph.add_edge(caller, callee)
+    return time.time() - start
+
+def main(argv):
+    num_edges = int(argv[1]) if len(argv) > 1 else 10 ** 5
+    num_lambdas = int(argv[2]) if len(argv) > 2 else 10 ** 4
+    num_old = int(argv[3]) if len(argv) > 3 else 5 * 10 ** 4
+    edges = make_edges(num_edges, num_lambdas)
+    new = bench(CallGraph(), edges)
+    print "incremental SCC: %s edges in %.3f s" % (num_edges, new)
+    new = bench(CallGraph(), edges[:num_old])
+    print "incremental SCC: %s edges in %.3f s" % (num_old, new)
+    old = bench(OldCallGraph(), edges[:num_old])
+    print "search per edge: %s edges in %.3f s" % (num_old, old)
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv)
@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare the JSON parser of pycket_json with the one it replaced, which was
+# built on pypy's _pypyjson decoder. Run it on expanded programs:
+#
+#   python pycket/test/bench_json.py pycket/test/nqueens.rkt ...
+#
+# or translate it (rpython targetted at this file) for numbers that reflect
+# pycket-c. Arguments ending in .rkt are expanded first.
+#
+import time
+
+from rpython.rlib.objectmodel import specialize
+from rpython.rlib.runicode import unicode_encode_utf_8
+
+from pycket.pycket_json import (loads, JsonPullParser, JsonObject, JsonArray,
+    JsonString, JsonInt, JsonFloat, json_null, json_true, json_false)
+from pycket.expand import readfile_rpython, ensure_json_ast_run
+
+ITERATIONS = 10
+
+# ____________________________________________________________
+# the old parser
+
+class FakeSpace(object):
+
+    w_None = json_null
+    w_True = json_true
+    w_False = json_false
+    w_ValueError = ValueError
+    w_UnicodeDecodeError = UnicodeDecodeError
+    w_UnicodeEncodeError = UnicodeEncodeError
+    w_int = JsonInt
+    w_float = JsonFloat
+
+    def newtuple(self, items):
+        return None
+
+    def newdict(self):
+        return JsonObject({})
+
+    def newlist(self, items):
+        return JsonArray([])
+
+    def call_method(self, obj, name, arg):
+        assert name == 'append'
+        assert isinstance(obj, JsonArray)
+        obj.value.append(arg)
+    call_method._dont_inline_ = True
+
+    def call_function(self, w_func, *args_w):
+        assert 0
+
+    def setitem(self, d, key, value):
+        assert isinstance(d, JsonObject)
+        assert isinstance(key, JsonString)
+        d.value[key.value_string()] = value
+
+    def wrapunicode(self, x):
+        return JsonString(unicode_encode_utf_8(x, len(x), "strict"))
+
+    def wrapint(self, x):
+        return JsonInt(x)
+
+    def wrapfloat(self, x):
+        return JsonFloat(x)
+
+    def wrap(self, x):
+        if isinstance(x, int):
+            return JsonInt(x)
+        elif isinstance(x, float):
+            return JsonFloat(x)
+        return self.wrapunicode(unicode(x))
+    wrap._annspecialcase_ = "specialize:argtype(1)"
+
+fakespace = FakeSpace()
+
+from pypy.module._pypyjson.interp_decoder import JSONDecoder
+
+class OwnJSONDecoder(JSONDecoder):
+    def __init__(self, s):
+        self.space = fakespace
+        self.s = s
+        # we put our string in a raw buffer so:
+        # 1) we automatically get the '\0' sentinel at the end of the string,
+        #    which means that we never have to check for the "end of string"
+        self.ll_chars = s + chr(0)
+        self.pos = 0
+        self.last_type = 0
+
+    def close(self):
+        pass
+
+    @specialize.arg(1)
+    def _raise(self, msg, *args):
+        raise ValueError(msg % args)
+
+    def decode_float(self, i):
+        start = i
+        while self.ll_chars[i] in "+-0123456789.eE":
+            i += 1
+        self.pos = i
+        return self.space.wrap(float(self.getslice(start, i)))
+
+    def decode_string(self, i):
+        start = i
+        while True:
+            # this loop is a fast path for strings which do not contain escape
+            # characters
+            ch = self.ll_chars[i]
+            i += 1
+            if ch == '"':
+                content_utf8 = self.getslice(start, i-1)
+                self.last_type = 1
+                self.pos = i
+                return JsonString(content_utf8)
+            elif ch == '\\':
+                content_so_far = self.getslice(start, i-1)
+                self.pos = i-1
+                return self.decode_string_escaped(start, content_so_far)
+            elif ch < '\x20':
+                self._raise("Invalid control character at char %d", self.pos-1)
+
+
+
+def loads_pypyjson(s):
+    decoder = OwnJSONDecoder(s)
+    try:
+        w_res = decoder.decode_any(0)
+        i = decoder.skip_whitespace(decoder.pos)
+        if i < len(s):
+            start = i
+            end = len(s) - 1
+            raise ValueError("Extra data: char %d - %d" % (start, end))
+        return w_res
+    finally:
+        decoder.close()
+
+
+# ____________________________________________________________
+
+def skip_all(s):
+    """ pull through the whole document without building the tree of the
+    top-level object, the lower bound for _read_module """
+    parser = JsonPullParser(s)
+    parser.start_object()
+    while parser.next_key() is not None:
+        parser.skip_value()
+    parser.finish()
+
+@specialize.arg(0)
+def bench(func, data):
+    start = time.time()
+    for i in range(ITERATIONS):
+        func(data)
+    return (time.time() - start) / ITERATIONS
+
+def main(argv):
+    if len(argv) < 2:
+        print "usage: %s <file.json or file.rkt> ..." % argv[0]
+        return 1
+    for fname in argv[1:]:
+        if fname.endswith(".rkt"):
+            fname = ensure_json_ast_run(fname)
+        data = readfile_rpython(fname)
+        old = bench(loads_pypyjson, data)
+        new = bench(loads, data)
+        pull = bench(skip_all, data)
+        print "%s (%d bytes): _pypyjson %s s, pycket_json %s s, pull/skip %s s" % (
+            fname, len(data), old, new, pull)
+    return 0
+
+def target(*args):
+    return main
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv)
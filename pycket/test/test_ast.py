@@ -5,7 +5,8 @@ from pycket.expand import _to_ast, to_ast, parse_module
 from pycket.interpreter import (LexicalVar, ModuleVar, Done, CaseLambda,
                                 variable_set, variables_equal,
                                 Lambda, Letrec, Let, Quote, App, If,
-                                SimplePrimApp1, SimplePrimApp2
+                                SimplePrimApp1, SimplePrimApp2,
+                                SimplePrimAppN, SimpleLet, DefineValues
                                 )
 from pycket.test.testhelper import format_pycket_mod
 
@@ -198,3 +199,148 @@ def test_simple_prim_calls_are_simple_expressions():
     p = expr_ast("(car (cons 1 2))")
     assert isinstance(p, SimplePrimApp1)
 
+
+def test_specialized_app_for_variadic_prims():
+    caselam = expr_ast("(lambda (x) (+ 1 x (* 3 x)))")
+    p = caselam.lams[0].body[0]
+    assert isinstance(p, SimplePrimAppN)
+    assert isinstance(p.rands[2], SimplePrimAppN)
+
+def test_prim_calls_keep_their_order():
+    caselam = expr_ast("(lambda (f g x) (f (+ x 1) (g x)))")
+    let = caselam.lams[0].body[0]
+    assert isinstance(let, Let)
+    assert isinstance(let.rhss[0], SimplePrimAppN)
+    assert let.rhss[1].rator.sym is caselam.lams[0].args.elems[1]
+
+def test_simple_let():
+    caselam = expr_ast("(lambda (x) (let ([a (+ x 1)] [b (* x 2)]) (if (< a b) a b)))")
+    let = caselam.lams[0].body[0]
+    assert isinstance(let, SimpleLet)
+    assert let.if_body is let.body[0]
+
+    caselam = expr_ast("(lambda (f x) (let ([a (f x)]) (+ a 1)))")
+    let = caselam.lams[0].body[0]
+    assert isinstance(let, Let) and not isinstance(let, SimpleLet)
+
+def test_simple_let_disabled(monkeypatch):
+    from pycket import config
+    monkeypatch.setattr(config, "superinstructions", False)
+    caselam = expr_ast("(lambda (x) (let ([a (+ x 1)] [b (* x 2)]) (if (< a b) a b)))")
+    assert type(caselam.lams[0].body[0]) is Let
+
+def test_simple_let_results():
+    from pycket.test.testhelper import run_mod_expr
+    from pycket.values import W_Fixnum
+    run_mod_expr("""
+    (let ([f (lambda (x)
+               (let ([a (+ x 1)] [b (* x 2)])
+                 (let ([c (- b a)])
+                   (if (< c 0) (list a b c) (let ([d (lambda () (+ a c))]) (d))))))])
+      (+ (f 5) (car (f 0))))
+    """, W_Fixnum(11))
+
+def test_nonescaping_let():
+    from pycket.interpreter import nonescaping
+    caselam = expr_ast("(lambda (f x) (f (if (< x 0) (- x) x) (+ x 1)))")
+    let = caselam.lams[0].body[0]
+    assert isinstance(let, SimpleLet)
+    assert isinstance(let.rhss[0], If) and nonescaping(let.rhss[0])
+
+    # the call to f could capture the continuation of the if
+    caselam = expr_ast("(lambda (f g x) (g (if (< x 0) (f x) x)))")
+    let = caselam.lams[0].body[0]
+    assert type(let) is Let
+
+def test_nonescaping_let_disabled(monkeypatch):
+    from pycket import config
+    monkeypatch.setattr(config, "escape_analysis", False)
+    caselam = expr_ast("(lambda (f x) (f (if (< x 0) (- x) x) (+ x 1)))")
+    assert type(caselam.lams[0].body[0]) is Let
+
+def test_nonescaping_let_results():
+    from pycket.test.testhelper import run_mod_expr
+    from pycket.values import W_Fixnum
+    run_mod_expr("""
+    (let ([f (lambda (x)
+               (list (if (< x 0) (let ([y (- x)]) (* y 2)) x)
+                     (begin (+ x 1) (if (= x 3) 'three x))))])
+      (+ (car (f -2)) (car (f 3)) (cadr (f 5))))
+    """, W_Fixnum(12))
+
+def module_definitions(s):
+    m = parse_module(expand_string(format_pycket_mod(s)))
+    return dict([(form.names[0].utf8value, form.rhs) for form in m.body
+                 if isinstance(form, DefineValues)])
+
+FOLDING_MODULE = """
+(define n (* 2 512))
+(define debug #f)
+(define (sq x) (* x x))
+(define (f x) (if debug (car x) (+ (sq x) n)))
+(define (fact k) (if (< k 2) 1 (* k (fact (- k 1)))))
+"""
+
+def test_fold_constants():
+    defs = module_definitions(FOLDING_MODULE)
+    assert isinstance(defs["n"], Quote) and defs["n"].w_val.value == 1024
+    # the if is folded, sq is inlined and n replaced by its value
+    let = defs["f"].lams[0].body[0]
+    assert isinstance(let, Let)
+    assert isinstance(let.rhss[0], Let)
+    w_n = let.body[0].rands[1]
+    assert isinstance(w_n, Quote) and w_n.w_val.value == 1024
+    # recursive functions are called
+    body = defs["fact"].lams[0].body[0]
+    assert isinstance(body, If)
+    assert isinstance(body.els.rhss[0], App)
+
+def test_fold_constants_bounded():
+    # folding a huge shift would allocate or hang while the module loads,
+    # even though it is never evaluated
+    defs = module_definitions("""
+    (define debug #t)
+    (define (f) (if debug 0 (arithmetic-shift 1 100000000000)))
+    """)
+    body = defs["f"].lams[0].body[0]
+    assert isinstance(body, Quote) and body.w_val.value == 0
+    defs = module_definitions("""
+    (define (f) (arithmetic-shift 1 100000000000))
+    (define big (* 100000000000000000000 100000000000000000000))
+    (define m (* 4611686018427387903 4611686018427387903))
+    """)
+    assert isinstance(defs["f"].lams[0].body[0], App)
+    assert isinstance(defs["big"], App)
+    assert isinstance(defs["m"], App)
+
+def test_fold_constants_per_module(tmpdir):
+    from pycket.test.testhelper import run_mod_defs
+    other = tmpdir.join("other.rkt")
+    other.write(format_pycket_mod("""
+    (provide get)
+    (define n 2)
+    (define (get) n)
+    """))
+    m = run_mod_defs("""
+    (define n 1)
+    (define x (list n (get)))
+    """, extra='(require (file "%s"))' % other)
+    assert m.defs[W_Symbol.make("x")].tostring() == "(1 2)"
+
+def test_fold_constants_disabled(monkeypatch):
+    from pycket import config
+    monkeypatch.setattr(config, "fold_constants", False)
+    defs = module_definitions(FOLDING_MODULE)
+    assert isinstance(defs["n"], App)
+    assert isinstance(defs["f"].lams[0].body[0], If)
+
+def test_fold_constants_results():
+    from pycket.test.testhelper import run_mod_defs
+    m = run_mod_defs("""
+    (define n 10)
+    (define (sq x) (* x x))
+    (define (sum-sq a b) (+ (sq a) (sq b)))
+    (define (bad) (quotient n 0))
+    (define x (list (sum-sq n 2) (if (zero? n) 'zero (sq (add1 n))) (eq? n 10)))
+    """)
+    assert m.defs[W_Symbol.make("x")].tostring() == "(104 121 #t)"
@@ -0,0 +1,65 @@
+from pycket.ast_profiler import ASTProfiler
+from pycket.pycket_json import loads
+from pycket.test.testhelper import run_mod_defs
+
+def test_ast_profile():
+    profiler = ASTProfiler()
+    profiler.start()
+    mod = run_mod_defs("""
+    (define (loop n acc) (if (zero? n) acc (loop (sub1 n) (+ acc 1))))
+    (define (never x) x)
+    (define x (loop 100 0))
+    """)
+    profile = profiler.finish([mod])
+    # untranslated there is no JIT to enter
+    assert profile.jit_time == 0.0
+    [lam_profile] = [l for l in profile.lambdas if l.lam.body[0].in_cycle]
+    assert lam_profile.calls() == 101
+    assert lam_profile.executions > 101
+    assert profile.lambdas[0] is lam_profile
+    assert lam_profile.location() in profile.report()
+
+    data = loads(profile.tojson().tostring())._unpack_deep()
+    [lam] = [l for l in data["lambdas"] if l["in-cycle"]]
+    assert lam["calls"] == 101
+    assert sum([ast["executions"] for ast in lam["asts"]]) == lam["executions"]
+
+def test_inline_cache_profile():
+    from pycket.interpreter import App, INLINE_CACHE_SIZE
+    from pycket.values import W_Symbol
+    from pycket.warmup import body_nodes
+    profiler = ASTProfiler()
+    profiler.start()
+    mod = run_mod_defs("""
+    (define f
+      (case-lambda
+        [(n) (f n 0)]
+        [(n acc) (if (zero? n) acc (f (sub1 n) (+ acc 1)))]))
+    (define (call g) (g 1))
+    (define x (f 10))
+    (define y (list (call (lambda (a) a)) (call (lambda (a) (+ a 1)))
+                    (call (lambda (a) (+ a 2))) (call (lambda (a) (+ a 3)))
+                    (call (lambda (a) (+ a 4))) (call (lambda (a) (+ a 5)))))
+    """)
+    profile = profiler.finish([mod])
+    w_f = mod.defs[W_Symbol.make("f")].closure
+    [loop] = [ast for ast in body_nodes(w_f.caselam.lams[1])
+              if type(ast) is App and ast.cache]
+    assert loop.call_cache_counts() == (9, 1)
+    [entry] = loop.cache
+    assert entry.caselam is w_f.caselam and entry.index == 1
+
+    # every lambda misses once, the call site is megamorphic after that
+    w_call = mod.defs[W_Symbol.make("call")].closure
+    [call] = [ast for ast in body_nodes(w_call.caselam.lams[0])
+              if type(ast) is App]
+    assert call.call_cache_counts() == (0, 6)
+    assert len(call.cache) == INLINE_CACHE_SIZE
+
+    assert "inline caches of calls" in profile.report()
+    data = loads(profile.tojson().tostring())._unpack_deep()
+    lams = data["lambdas"]
+    assert sum([lam["cache-hits"] for lam in lams]) == 9
+    for lam in lams:
+        assert (sum([ast["cache-misses"] for ast in lam["asts"]]) ==
+                lam["cache-misses"])
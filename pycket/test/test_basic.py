@@ -550,6 +550,30 @@ def test_callgraph_reconstruction():
     assert env.callgraph.recursive == {f: None, g: None}
     assert g.body[0].should_enter
 
+def test_callgraph_components():
+    from pycket.callgraph import CallGraph
+    class FakeLambda(object):
+        in_cycle = False
+        def set_in_cycle(self):
+            self.in_cycle = True
+    a, b, c, d, e = [FakeLambda() for i in range(5)]
+    cg = CallGraph()
+    cg.add_edge(a, b)
+    cg.add_edge(b, c)
+    cg.add_edge(c, d)
+    assert cg.recursive == {}
+    # closes the cycle b -> c -> d -> b, a stays outside
+    cg.add_edge(d, b)
+    assert cg.recursive == {b: None, c: None, d: None}
+    assert b.in_cycle and c.in_cycle and d.in_cycle and not a.in_cycle
+    assert cg.components[b] is cg.components[c] is cg.components[d]
+    assert cg.components[a].order < cg.components[b].order
+    cg.add_edge(e, a)
+    assert cg.components[e].order < cg.components[a].order
+    cg.add_edge(e, e)
+    assert cg.is_recursive(e)
+    assert not cg.is_recursive(a)
+
 def test_callgraph_reconstruction_through_primitives():
     from pycket.expand import expand_string, parse_module
     from pycket        import config
@@ -0,0 +1,107 @@
+import pytest
+from pycket.expand import expand_string, parse_module, ModTable
+from pycket.binary_ast import dumps, loads
+from pycket.test.testhelper import format_pycket_mod, run_ast
+from pycket import values
+
+def _roundtrip(code, source="source"):
+    mod = parse_module(expand_string(format_pycket_mod(code)))
+    data = dumps(mod, source)
+    mod2 = loads(data, ModTable(), source)
+    assert mod2.tostring() == mod.tostring()
+    return mod2
+
+def test_roundtrip_simple():
+    mod = _roundtrip("(define x (+ 1 2))")
+    run_ast(mod)
+    assert mod.defs[values.W_Symbol.make("x")].value == 3
+
+def test_roundtrip_constants():
+    mod = _roundtrip("""
+    (define x '(1 -2.5 #\\a "abc" #"def" sym #:kw 1/2 1+2i 100000000000000000000 #(1 2) #&3 . 4))
+    (define y #rx"a*b")
+    """)
+    run_ast(mod)
+    w_y = mod.defs[values.W_Symbol.make("y")]
+    assert w_y.source == "a*b"
+
+def test_roundtrip_closures():
+    mod = _roundtrip("""
+    (define (make-counter)
+      (let ([n 0])
+        (lambda () (set! n (add1 n)) n)))
+    (define c (make-counter))
+    (c)
+    (define x (c))
+    (define (f x) (letrec ([even? (lambda (n) (if (zero? n) #t (odd? (sub1 n))))]
+                           [odd? (lambda (n) (if (zero? n) #f (even? (sub1 n))))])
+                    (even? x)))
+    (define y (f 10))
+    """)
+    run_ast(mod)
+    assert mod.defs[values.W_Symbol.make("x")].value == 2
+    assert mod.defs[values.W_Symbol.make("y")] is values.w_true
+
+def test_stale_source():
+    mod = parse_module(expand_string(format_pycket_mod("(define x 1)")))
+    data = dumps(mod, "(define x 1)")
+    assert loads(data, ModTable(), "(define x 2)") is None
+    assert loads(data[:-1], ModTable(), "(define x 1)") is None
+
+def test_stale_expansion():
+    mod = parse_module(expand_string(format_pycket_mod("(define x 1)")))
+    data = dumps(mod, "source", "expanded")
+    assert loads(data, ModTable(), "source", "expanded") is not None
+    assert loads(data, ModTable(), "source", "expanded again") is None
+
+def test_load_ast_cached(tmpdir):
+    from pycket.expand import load_ast_cached
+    rkt = tmpdir.join("m.rkt")
+    rkt.write(format_pycket_mod("(define x 1)"))
+    json = tmpdir.join("m.rkt.json")
+    json.write(expand_string(format_pycket_mod("(define x 1)")))
+    load_ast_cached(str(rkt), str(json), ModTable())
+    assert tmpdir.join("m.rkt.bin").check()
+    # a new expansion of the same source must not use the old cache
+    json.write(expand_string(format_pycket_mod("(define x 2)")))
+    mod = load_ast_cached(str(rkt), str(json), ModTable())
+    run_ast(mod)
+    assert mod.defs[values.W_Symbol.make("x")].value == 2
+    # expanded JSON given directly is never cached
+    load_ast_cached(str(json), str(json), ModTable())
+    assert not tmpdir.join("m.rkt.json.bin").check()
+
+def test_lazy_bodies():
+    from pycket.interpreter import DefineValues, CaseLambda, LazyBody
+    code = """
+    (define (used x) (+ x 1))
+    (define (unused x) (* x 2))
+    (define y (used 1))
+    """
+    mod = parse_module(expand_string(format_pycket_mod(code)))
+    mod2 = loads(dumps(mod, "source"), ModTable(), "source")
+    lams = {}
+    for form in mod2.body:
+        if isinstance(form, DefineValues) and isinstance(form.rhs, CaseLambda):
+            lams[form.names[0].utf8value] = form.rhs.lams[0]
+    assert isinstance(lams["used"].body[0], LazyBody)
+    assert isinstance(lams["unused"].body[0], LazyBody)
+    run_ast(mod2)
+    assert mod2.defs[values.W_Symbol.make("y")].value == 2
+    assert not isinstance(lams["used"].body[0], LazyBody)
+    assert isinstance(lams["unused"].body[0], LazyBody)
+    assert mod2.tostring() == mod.tostring()
+
+def test_eager_bodies(monkeypatch):
+    from pycket import config
+    from pycket.interpreter import DefineValues, SimpleLet
+    monkeypatch.setattr(config, "lazy_bodies", False)
+    mod = _roundtrip("""
+    (define (f x) (let ([a (+ x 1)] [b (* x 2)]) (let ([g (lambda () (- b a))]) (g))))
+    (define y (f 5))
+    """)
+    [lam] = [form.rhs.lams[0] for form in mod.body
+             if isinstance(form, DefineValues) and form.names[0].utf8value == "f"]
+    assert isinstance(lam.body[0], SimpleLet)
+    run_ast(mod)
+    assert mod.defs[values.W_Symbol.make("y")].value == 4
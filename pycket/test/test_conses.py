@@ -1,7 +1,10 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import pytest
+
 from pycket.values import *
+from pycket.error import SchemeException
 
 from pycket.test.testhelper import execute, run_fix, run
 
@@ -67,3 +70,54 @@ class TestConses(object):
 
         c =  W_Cons.make(W_Fixnum(1), c)
         assert c.is_proper_list()
+        assert c.list_length() == 3
+        assert w_null.list_length() == 0
+
+    def test_array_list(self):
+        elems = [W_Fixnum(i) for i in range(ARRAY_LIST_MIN_LENGTH)]
+        l = to_array_list(elems)
+        assert isinstance(l, W_ArrayCons)
+        assert l.is_proper_list()
+        assert from_list(l) == elems
+        assert l.cdr() is l.cdr()
+        assert l.cdr() is not l
+        assert list_drop(l, ARRAY_LIST_MIN_LENGTH) is w_null
+        assert list_drop(l, ARRAY_LIST_MIN_LENGTH + 1) is None
+        assert list_drop(l, 3).car().value == 3
+        assert list_drop(l, 3) is l.cdr().cdr().cdr()
+        assert l.list_length() == ARRAY_LIST_MIN_LENGTH
+        assert W_Cons.make(w_null, l.cdr()).list_length() == ARRAY_LIST_MIN_LENGTH
+        assert to_array_list(elems, l).list_length() == 2 * ARRAY_LIST_MIN_LENGTH
+        l = to_array_list(elems, W_Fixnum(42))
+        assert not l.is_proper_list()
+        assert list_drop(l, ARRAY_LIST_MIN_LENGTH).value == 42
+        assert isinstance(to_array_list(elems[:3]), W_UnwrappedFixnumConsProper)
+
+    def test_array_list_hl(self):
+        long_list = "(build-list 20 (lambda (i) i))"
+        run_fix("(length (list 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17))", 17)
+        run_fix("(length (append %s %s))" % (long_list, long_list), 40)
+        run_fix("(length (cons 1 (append %s (list 1 2))))" % long_list, 23)
+        run_fix("(length (list-tail (list 1 2 3) 3))", 0)
+        with pytest.raises(SchemeException):
+            run_fix("(length (cons 1 2))")
+        with pytest.raises(SchemeException):
+            run_fix("(list-tail (list 1 2 3) 4)")
+        run_fix("(list-ref (vector->list (make-vector 20 3)) 19)", 3)
+        run_fix("(list-ref (reverse %s) 1)" % long_list, 18)
+        run_fix("(car (list-tail (map add1 %s) 17))" % long_list, 18)
+        run("(let ([l %s]) (eq? (cdr l) (cdr l)))" % long_list, w_true)
+        run("(let ([l %s]) (memq (cdr l) (list (cdr l))))" % long_list, w_true)
+        run("(let ([x (list 1)]) (eq? (list-tail (append %s x) 20) x))"
+            % long_list, w_true)
+        run("(equal? (map add1 %s) (build-list 20 add1))" % long_list, w_true)
+        # the results of a re-entered map don't see those of the first return
+        for l in ["(list 1 2 3)", long_list]:
+            run_fix("""
+            (let* ([k #f] [n 0]
+                   [l (map (lambda (x)
+                             (call/cc (lambda (c) (when (= x 2) (set! k c)) x)))
+                           %s)])
+              (set! n (add1 n))
+              (if (< n 3) (k (* 10 n)) (apply + l)))
+            """ % l, 24 if l == "(list 1 2 3)" else 208)
@@ -52,6 +52,43 @@ class TestOptions(object):
         argv = ["arg0", "foobar", arg]
         assert (None, None, None, 0 == parse_args(argv))
 
+    def test_jobs(self, empty_json):
+        argv = ['arg0', '-j', '4', empty_json]
+        config, names, args, retval = parse_args(argv)
+        assert retval == 0
+        assert option_helper.jobs_option(names) == 4
+
+        config, names, args, retval = parse_args(['arg0', empty_json])
+        assert option_helper.jobs_option(names) == 0
+
+        config, names, args, retval = parse_args(['arg0', '-j', 'x', empty_json])
+        assert retval == 5
+
+    def test_warmup_profile(self, empty_json):
+        argv = ['arg0', '--warmup-profile', 'profile', empty_json]
+        config, names, args, retval = parse_args(argv)
+        assert retval == 0
+        assert names['warmup-profile'] == 'profile'
+
+        config, names, args, retval = parse_args(['arg0', '--warmup-profile'])
+        assert retval == 5
+
+    def test_profile_ast(self, empty_json):
+        config, names, args, retval = parse_args(['arg0', '--profile-ast', empty_json])
+        assert retval == 0
+        assert names['profile-ast'] == ''
+
+        argv = ['arg0', '--profile-ast-json', 'profile.json', empty_json]
+        config, names, args, retval = parse_args(argv)
+        assert retval == 0
+        assert names['profile-ast'] == 'profile.json'
+
+    def test_profile_sample(self, empty_json):
+        argv = ['arg0', '--profile-sample', 'stacks', empty_json]
+        config, names, args, retval = parse_args(argv)
+        assert retval == 0
+        assert names['profile-sample'] == 'stacks'
+
     def test_program_arguments_plain(self, empty_json):
         program_args = ["foo", "bar", "baz"]
         argv = ['arg0', empty_json] + program_args
@@ -0,0 +1,148 @@
+import os
+import time
+import pytest
+from subprocess import Popen
+from pycket.expand import ExpanderDaemon, ExpandException, expand_file, fn
+from pycket.pycket_json import loads
+
+@pytest.fixture
+def expander(request, tmpdir, monkeypatch):
+    sockname = str(tmpdir.join("expand.sock"))
+    process = Popen("exec racket %s --server \"%s\"" % (fn, sockname), shell=True)
+    for i in range(600):
+        if os.path.exists(sockname):
+            break
+        time.sleep(0.1)
+    monkeypatch.setenv("PYCKET_EXPAND_SOCKET", sockname)
+    daemon = ExpanderDaemon()
+    def fin():
+        daemon.close()
+        process.kill()
+    request.addfinalizer(fin)
+    return daemon
+
+def test_expand_daemon(expander, tmpdir):
+    f = tmpdir.join("daemon.rkt")
+    f.write("#lang pycket\n(define x (+ 1 2))\n")
+    data = expander.expand(str(f))
+    assert data is not None
+    assert loads(data)._unpack_deep() == loads(expand_file(str(f)))._unpack_deep()
+    # the connection is reused
+    sock = expander.sock
+    assert expander.expand(str(f)) == data
+    assert expander.sock is sock
+
+def test_expand_daemon_error(expander, tmpdir):
+    f = tmpdir.join("broken.rkt")
+    f.write("#lang pycket\n(define\n")
+    with pytest.raises(ExpandException):
+        expander.expand(str(f))
+
+def test_expand_no_daemon(tmpdir, monkeypatch):
+    monkeypatch.setenv("PYCKET_EXPAND_SOCKET", str(tmpdir.join("missing.sock")))
+    daemon = ExpanderDaemon()
+    assert daemon.expand(str(tmpdir.join("x.rkt"))) is None
+    assert daemon.disabled
+
+def test_private_socket(tmpdir):
+    import socket
+    from pycket.expand import _private_socket
+    tmpdir.chmod(0700)
+    sockname = str(tmpdir.join("expand.sock"))
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(sockname)
+    try:
+        os.chmod(sockname, 0600)
+        assert _private_socket(sockname)
+        os.chmod(sockname, 0666)
+        assert not _private_socket(sockname)
+        os.chmod(sockname, 0600)
+        # somebody else could replace the socket
+        tmpdir.chmod(0777)
+        assert not _private_socket(sockname)
+    finally:
+        tmpdir.chmod(0700)
+        listener.close()
+    plain = tmpdir.join("plain")
+    plain.write("")
+    assert not _private_socket(str(plain))
+    assert not _private_socket(str(tmpdir.join("missing.sock")))
+
+def test_json_requires():
+    from pycket.expand import json_requires
+    data = ('{"module-name":"m","language":"/a/lang.rkt","body-forms":['
+            '{"require":["/x/y.rkt","#%kernel"]},'
+            '{"quote":{"string":"{\\"require\\":[\\"/no.rkt\\"]}"}},'
+            '{"require":[]},{"require":["/w.rkt"]}]}')
+    assert json_requires(data) == ["/a/lang.rkt", "/x/y.rkt", "/w.rkt"]
+
+def test_cpu_count(monkeypatch):
+    from pycket import expand
+    assert expand._count_cpu_list("0-3,8,10-11\n") == 7
+    assert expand._count_cpu_list("x") == 0
+    assert expand._allowed_cpus("Name:\tpycket\nCpus_allowed_list:\t0-1\n") == 2
+    assert expand._allowed_cpus("Name:\tpycket\n") == 0
+    assert expand._cgroup_cpus("150000 100000\n") == 2
+    assert expand._cgroup_cpus("max 100000\n") == 0
+    files = {"/proc/self/status": "Cpus_allowed_list:\t0-7\n",
+             "/sys/fs/cgroup/cpu.max": "200000 100000\n"}
+    def readfile(fname):
+        if fname not in files:
+            raise OSError(2, fname)
+        return files[fname]
+    monkeypatch.setattr(expand, "readfile_rpython", readfile)
+    assert expand.cpu_count() == 2
+    files["/proc/cpuinfo"] = "processor\t: 0\nprocessor\t: 1\nprocessor\t: 2\n"
+    del files["/proc/self/status"]
+    del files["/sys/fs/cgroup/cpu.max"]
+    assert expand.cpu_count() == 3
+    # without /proc, e.g. not on Linux
+    files.clear()
+    assert expand.cpu_count() == 1
+
+def test_find_executable(tmpdir, monkeypatch):
+    from pycket.expand import _find_executable
+    prog = tmpdir.join("prog")
+    prog.write("")
+    monkeypatch.setenv("PATH", "/nonexistent:" + str(tmpdir))
+    assert _find_executable("prog") is None
+    prog.chmod(0755)
+    assert _find_executable("prog") == str(prog)
+    assert _find_executable("missing") is None
+
+FAKE_RACKET = """#!/bin/sh
+# racket -l pycket/expand -- --output <json> <rkt>
+echo partial > "$5"
+case "$6" in *bad*) exit 1;; esac
+"""
+
+def test_expand_files_parallel(tmpdir, monkeypatch):
+    from pycket.expand import expand_files_parallel
+    racket = tmpdir.join("racket")
+    racket.write(FAKE_RACKET)
+    racket.chmod(0755)
+    monkeypatch.setenv("PATH", str(tmpdir))
+    other = os.fork()
+    if other == 0:
+        os._exit(3)
+    files = [str(tmpdir.join(name)) for name in ["a.rkt", "bad.rkt", "c.rkt"]]
+    expand_files_parallel(files, 2)
+    assert tmpdir.join("a.rkt.json").check()
+    assert not tmpdir.join("bad.rkt.json").check()
+    assert tmpdir.join("c.rkt.json").check()
+    # other children are left alone
+    pid, status = os.waitpid(other, 0)
+    assert pid == other and os.WEXITSTATUS(status) == 3
+
+def test_expand_requires_parallel(tmpdir):
+    from pycket.expand import expand_requires_parallel, expand_file_to_json
+    a = tmpdir.join("a.rkt")
+    b = tmpdir.join("b.rkt")
+    c = tmpdir.join("c.rkt")
+    a.write('#lang pycket\n(require "b.rkt" "c.rkt")\n')
+    b.write('#lang pycket\n(require "c.rkt")\n(provide x)\n(define x 1)\n')
+    c.write('#lang pycket\n(provide y)\n(define y 2)\n')
+    json_file = expand_file_to_json(str(a), str(a) + ".json")
+    expand_requires_parallel(json_file, 2)
+    assert os.path.exists(str(b) + ".json")
+    assert os.path.exists(str(c) + ".json")
@@ -1,7 +1,10 @@
 from pycket.test.testhelper import run_mod_expr, run_mod
 from pycket.values_hash import (ll_get_dict_item, get_dict_item,
                                 StringHashmapStrategy)
-from pycket.values_hash import ByteHashmapStrategy
+from pycket.values_hash import (ByteHashmapStrategy, FlonumHashmapStrategy,
+                                CharacterHashmapStrategy,
+                                EqObjectHashmapStrategy,
+                                FixnumHashmapStrategy, SymbolHashmapStrategy)
 from pycket import values
 
 def test_hash_simple(doctest):
@@ -285,6 +288,106 @@ def test_whitebox_bytes(source):
     result = run_mod_expr(source)
     assert result.strategy is ByteHashmapStrategy.singleton
 
+def test_whitebox_flonum(source):
+    r"""
+    (let ([ht (make-hash)])
+        (hash-set! ht 1.5 'a)
+        (hash-set! ht -0.0 'b)
+        (hash-set! ht +nan.0 'c)
+        (hash-ref ht 2.5 #f)
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is FlonumHashmapStrategy.singleton
+
+def test_whitebox_char_eqv(source):
+    r"""
+    (let ([ht (make-hasheqv)])
+        (hash-set! ht #\a 1)
+        (hash-set! ht #\b 2)
+        (hash-remove! ht #\a)
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is CharacterHashmapStrategy.singleton.fixnum_values
+    assert result.length() == 1
+
+def test_whitebox_eq_generalizes(source):
+    r"""
+    (let ([ht (make-hasheq)])
+        (hash-set! ht 1 'a)
+        (hash-set! ht 'b 'b)
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is EqObjectHashmapStrategy.singleton
+
+def test_whitebox_fixnum_values(source):
+    r"""
+    (let ([ht (make-hasheqv)])
+        (for ([i (in-range 100)])
+          (hash-set! ht (modulo i 7) (add1 (hash-ref ht (modulo i 7) 0))))
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is FixnumHashmapStrategy.singleton.fixnum_values
+    assert result.length() == 7
+
+def test_whitebox_values_generalize(source):
+    r"""
+    (let ([ht (make-hash)])
+        (hash-set! ht 'a 1.5)
+        (hash-set! ht 'b 2.5)
+        (hash-set! ht 'c "three")
+        ht)
+    """
+    result = run_mod_expr(source)
+    assert result.strategy is SymbolHashmapStrategy.singleton
+    assert result.length() == 3
+
+def test_unboxed_values(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (hash-set! ht "a" 1)
+    ! (hash-set! ht "b" 2)
+    ! (define hf (make-hasheq))
+    ! (hash-set! hf 'x 1.5)
+    > (hash-ref ht "a")
+    1
+    > (hash-set! ht "b" 'two)
+    > (hash-ref ht "b")
+    'two
+    > (hash-ref ht "a")
+    1
+    > (hash-ref hf 'x)
+    1.5
+    > (hash-set! hf 'y 2)
+    > (+ (hash-ref hf 'x) (hash-ref hf 'y))
+    3.5
+    """
+
+def test_flonum_keys(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (hash-set! ht 0.0 'zero)
+    ! (hash-set! ht +nan.0 'nan)
+    ! (define hq (make-hasheq))
+    ! (hash-set! hq 2.5 'a)
+    > (hash-ref ht -0.0 'none)
+    'none
+    > (hash-ref ht (/ 0.0 0.0))
+    'nan
+    > (hash-set! ht 1 'one)
+    > (hash-ref ht 1.0 'none)
+    'none
+    > (hash-ref ht 0.0)
+    'zero
+    > (hash-ref hq (+ 2.0 0.5))
+    'a
+    > (hash-ref hq -0.0 'none)
+    'none
+    """
+
 def test_hash_iteration_enables_jitting(source):
     """
     #lang pycket
@@ -313,3 +416,172 @@ def test_hash_for(doctest):
     > (for/sum ([(k v) ht]) v)
     6
     """
+
+def test_hash_compound_keys(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (hash-set! ht (list 1 2 3) 'a)
+    ! (hash-set! ht (vector 1 2) 'b)
+    ! (hash-set! ht (cons "x" 'y) 'c)
+    ! (hash-set! ht 1.5 'd)
+    ! (hash-set! ht (list 1 2 3) 'e)
+    > (hash-ref ht (list 1 2 3))
+    'e
+    > (hash-ref ht (vector 1 2))
+    'b
+    > (hash-ref ht (cons (string #\\x) 'y))
+    'c
+    > (hash-ref ht 1.5)
+    'd
+    > (hash-ref ht (list 1 2) 'none)
+    'none
+    > (hash-count ht)
+    4
+    """
+
+def test_hash_impersonated_keys(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (define v (vector 1 2))
+    ! (define iv (impersonate-vector (vector 1 2) (lambda (v i x) x) (lambda (v i x) x)))
+    ! (hash-set! ht iv 'imp)
+    > (hash-ref ht v)
+    'imp
+    > (hash-set! ht v 'plain)
+    > (hash-ref ht iv)
+    'plain
+    > (hash-count ht)
+    1
+    """
+
+def test_equal_hash_code(doctest):
+    """
+    > (= (equal-hash-code (list 1 2 "abc")) (equal-hash-code (list 1 2 (string #\\a #\\b #\\c))))
+    #t
+    > (= (equal-hash-code (vector 1 (cons 2 3))) (equal-hash-code (vector 1 (cons 2 3))))
+    #t
+    """
+
+def test_immutable_hash(doctest):
+    """
+    ! (define h (hash 1 'a 2 'b))
+    ! (define h2 (hash-set h 3 'c))
+    ! (define h3 (hash-remove h2 1))
+    > (hash-ref h2 3)
+    'c
+    > (hash-ref h 3 'none)
+    'none
+    > (hash-count h2)
+    3
+    > (hash-ref h3 1 'none)
+    'none
+    > (hash-ref h2 1)
+    'a
+    > (hash-count (hash-set h 1 'z))
+    2
+    > (hash-ref (hash-set h 1 'z) 1)
+    'z
+    > (immutable? h)
+    #t
+    > (immutable? (make-hash))
+    #f
+    E (hash-set! h 1 'x)
+    E (hash-set (make-hash) 1 'x)
+    > (hash-count (hash-remove h 'not-there))
+    2
+    """
+
+def test_immutable_hash_equal_keys(doctest):
+    """
+    ! (define h (hash-set (hash-set (hash) (list 1 2) 'a) (vector 3) 'b))
+    ! (define h2 (hash-set h 'sym 'c))
+    > (hash-ref h (list 1 2))
+    'a
+    > (hash-ref h (vector 3))
+    'b
+    > (hash-ref h2 (list 1 2))
+    'a
+    > (hash-ref h2 'sym)
+    'c
+    > (hash-count (hash-set h2 (list 1 2) 'd))
+    3
+    > (hash-ref (hash-set h2 (list 1 2) 'd) (list 1 2))
+    'd
+    > (hash-count (hash-remove h2 (vector 3)))
+    2
+    > (hash-count (make-immutable-hash (list (cons (list 1) 1) (cons (list 1) 2))))
+    1
+    > (hash-ref (make-immutable-hash (list (cons (list 1) 1) (cons (list 1) 2))) (list 1))
+    2
+    """
+
+def test_immutable_hasheq(doctest):
+    """
+    ! (define k (list 1))
+    ! (define h (hasheq k 'a 'b 2))
+    > (hash-ref h k)
+    'a
+    > (hash-ref h (list 1) 'none)
+    'none
+    > (hash-ref (hash-set h 'c 3) 'c)
+    3
+    > (hash-count (hash-remove h k))
+    1
+    > (hash-ref (hasheqv 1.5 'x) 1.5)
+    'x
+    """
+
+def test_immutable_hash_iteration(doctest):
+    """
+    ! (define h (for/fold ([h (hash)]) ([i (in-range 100)]) (hash-set h i (* i i))))
+    > (hash-count h)
+    100
+    > (hash-ref h 99)
+    9801
+    > (for/sum ([(k v) (in-hash h)]) v)
+    328350
+    > (hash-count (for/fold ([h h]) ([i (in-range 50)]) (hash-remove h i)))
+    50
+    """
+
+def test_immutable_hash_strategies():
+    from pycket.values_hash import (W_ImmutableEqualHashTable,
+        ImmutableFixnumHashmapStrategy, ImmutableSymbolHashmapStrategy,
+        ImmutableStringHashmapStrategy, ImmutableObjectHashmapStrategy)
+    from pycket import values_string
+    ints = [values.W_Fixnum(i) for i in range(100)]
+    ht = W_ImmutableEqualHashTable.from_lists(ints, ints)
+    assert ht.strategy is ImmutableFixnumHashmapStrategy.singleton
+    assert ht.length() == 100
+    syms = [values.W_Symbol.make("s%s" % i) for i in range(10)]
+    ht = W_ImmutableEqualHashTable.from_lists(syms, syms)
+    assert ht.strategy is ImmutableSymbolHashmapStrategy.singleton
+    strs = [values_string.W_String.fromstr_utf8("s%s" % i) for i in range(10)]
+    ht = W_ImmutableEqualHashTable.from_lists(strs, strs)
+    assert ht.strategy is ImmutableStringHashmapStrategy.singleton
+    ht = W_ImmutableEqualHashTable.from_lists(ints + syms, ints + syms)
+    assert ht.strategy is ImmutableObjectHashmapStrategy.singleton
+    assert ht.length() == 110
+
+def test_hamt():
+    from pycket.hamt import make_persistent_map
+    IntMap = make_persistent_map("IntMap", lambda a, b: a == b)
+    maps = [IntMap.EMPTY]
+    # the hash i % 7 makes collision nodes, i << 25 tries of full depth
+    for hash_func in [lambda i: i, lambda i: i % 7, lambda i: i << 25]:
+        m = IntMap.EMPTY
+        for i in range(200):
+            m = m.assoc(i, hash_func(i), i * 2)
+            maps.append(m)
+        assert m.size == 200
+        for i in range(200):
+            assert m.get(i, hash_func(i), -1) == i * 2
+        for i in range(0, 200, 2):
+            m = m.without(i, hash_func(i))
+        assert m.size == 100
+        assert sorted(m.items()) == [(i, i * 2) for i in range(1, 200, 2)]
+        assert m.get(2, hash_func(2), -1) == -1
+        assert m.without(2, hash_func(2)) is m
+        # the old versions are unchanged
+        for j in range(1, len(maps)):
+            assert maps[j].size == (j - 1) % 200 + 1
@@ -44,3 +44,39 @@ def test_bug():
             [{"quote" : { "string": "\\" }},{"quote" : { "string": "Hi" }}])
 
     _compare(r'{"string" : "\\\\"}', {"string": "\\\\"})
+
+def test_unicode_escapes():
+    _compare('"\\u00e9"', "\xc3\xa9")
+    _compare('"a\\u2192b"', "a\xe2\x86\x92b")
+    _compare('"\\ud83d\\ude00"', "\xf0\x9f\x98\x80")
+
+def test_numbers():
+    _compare("-12", -12)
+    _compare("1e3", 1000.0)
+    _compare("-0.5", -0.5)
+
+def test_errors():
+    for s in ['[1,]', '{"a" 1}', '"abc', '[1 2]', 'tru', '1 2', '"\\q"', '']:
+        with pytest.raises(ValueError):
+            loads(s)
+
+def test_pull():
+    from pycket.pycket_json import JsonPullParser
+    parser = JsonPullParser('{"a": [1, {"b": 2}, "x"], "c": null, "d": []}')
+    parser.start_object()
+    keys = []
+    items = []
+    while True:
+        key = parser.next_key()
+        if key is None:
+            break
+        keys.append(key)
+        if key == "a":
+            parser.start_array()
+            while parser.next_item():
+                items.append(parser.read_value()._unpack_deep())
+        else:
+            parser.skip_value()
+    parser.finish()
+    assert keys == ["a", "c", "d"]
+    assert items == [1, {"b": 2}, "x"]
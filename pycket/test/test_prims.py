@@ -256,6 +256,56 @@ def test_bytes_copy_bang(doctest):
     #"lpply"
     """
 
+def test_subbytes_copy_on_write(doctest):
+    """
+    ! (define s (bytes 65 112 112 108 101))
+    ! (define sub (subbytes s 1 4))
+    ! (define subsub (subbytes sub 1))
+    > (bytes-set! sub 0 65)
+    > sub
+    #"Apl"
+    > subsub
+    #"pl"
+    > (bytes-set! s 2 65)
+    > s
+    #"ApAle"
+    > sub
+    #"Apl"
+    > (define lit (subbytes #"Apple" 0 2))
+    > (bytes-set! lit 1 65)
+    > lit
+    #"AA"
+    > (bytes-append lit #"pple" sub)
+    #"AApple"
+    """
+
+def test_bytes_copy_bang_whole(doctest):
+    """
+    ! (define s (make-bytes 3 0))
+    ! (define src (bytes 65 66 67 68))
+    > (bytes-copy! s 0 src 1)
+    > s
+    #"BCD"
+    > (bytes-set! src 1 65)
+    > s
+    #"BCD"
+    E (bytes-copy! s 1 src 0)
+    """
+
+def test_read_bytes_bang(doctest):
+    """
+    ! (define s (make-bytes 4 65))
+    ! (define in (open-input-bytes #"xyzw12"))
+    > (read-bytes! s in)
+    4
+    > s
+    #"xyzw"
+    > (read-bytes! s in 1 3)
+    2
+    > s
+    #"x12w"
+    """
+
 def test_open_input_bytes_and_read_bytes_line(source):
     """
     (let* ([b (string->bytes/utf-8 "ABC\nDEF\n\nGHI\n\nJKL\n\n\nMNOP\n")]
@@ -0,0 +1,24 @@
+from pycket.sampling_profiler import SamplingProfiler
+from pycket.test.testhelper import run_mod_defs
+
+def test_sampling_profiler(tmpdir):
+    profiler = SamplingProfiler()
+    import pycket.interpreter
+    old, pycket.interpreter.sampling_profiler = pycket.interpreter.sampling_profiler, profiler
+    try:
+        profiler.start(1000)
+        run_mod_defs("""
+        (define (loop n acc) (if (zero? n) acc (loop (sub1 n) (+ acc 1))))
+        (define x (loop 100000 0))
+        """)
+    finally:
+        # a timer that is left running kills the test process with SIGPROF
+        profiler.stop()
+        pycket.interpreter.sampling_profiler = old
+    fname = str(tmpdir.join("stacks"))
+    profiler.dump(fname)
+    assert not profiler.active
+    assert profiler.samples > 0
+    lines = open(fname).read().splitlines()
+    assert sum([int(line.rsplit(" ", 1)[1]) for line in lines]) == profiler.samples
+    assert [line for line in lines if line.startswith("<module>;")]
@@ -0,0 +1,70 @@
+import pytest
+from pycket import values
+from pycket.error import SchemeException
+from pycket.vector import FixnumVectorStrategy, FlonumVectorStrategy
+from pycket.test.testhelper import run, call_prim
+
+def cars_and_cdrs(w_lst):
+    return [(p.car().value, p.cdr().value) for p in values.from_list(w_lst)]
+
+def prim(name):
+    from pycket.prims.expose import prim_env
+    return prim_env[values.W_Symbol.make(name)]
+
+def test_sort_numbers():
+    lst = run("(list 3 1 2 1)")
+    result = call_prim("sort", lst, prim("<"))
+    assert [x.value for x in values.from_list(result)] == [1, 1, 2, 3]
+    result = call_prim("sort", lst, prim(">"))
+    assert [x.value for x in values.from_list(result)] == [3, 2, 1, 1]
+    result = call_prim("sort", run("(list 2.5 1.5 -1.0)"), prim("fl<"))
+    assert [x.value for x in values.from_list(result)] == [-1.0, 1.5, 2.5]
+    result = call_prim("sort", run("(list 2 1.5 1)"), prim("<"))
+    assert [x.value for x in values.from_list(result)] == [1, 1.5, 2]
+    assert call_prim("sort", values.w_null, prim("<")) is values.w_null
+
+def test_sort_stable():
+    lst = run("(list (cons 2 0) (cons 1 1) (cons 2 2) (cons 0 3) (cons 1 4))")
+    less = run("(lambda (a b) (< (car a) (car b)))")
+    result = call_prim("sort", lst, less)
+    assert cars_and_cdrs(result) == [(0, 3), (1, 1), (1, 4), (2, 0), (2, 2)]
+    greater = run("(lambda (a b) (> (car a) (car b)))")
+    result = call_prim("sort", lst, greater)
+    assert cars_and_cdrs(result) == [(2, 0), (2, 2), (1, 1), (1, 4), (0, 3)]
+
+def test_sort_long():
+    lst = run("(build-list 100 (lambda (i) (modulo (* i 37) 100)))")
+    less = run("(lambda (a b) (< a b))")
+    result = call_prim("sort", lst, less)
+    assert [x.value for x in values.from_list(result)] == range(100)
+
+def test_vector_sort_bang():
+    vec = run("(vector 5 3 4 1 2)")
+    assert call_prim("vector-sort!", vec, prim("<"), values.W_Fixnum(1),
+                     values.W_Fixnum(4)) is values.w_void
+    assert isinstance(vec.strategy, FixnumVectorStrategy)
+    assert [vec.ref(i).value for i in range(5)] == [5, 1, 3, 4, 2]
+    vec = run("(vector 'b 'c 'a)")
+    less = run("(lambda (a b) (string<? (symbol->string a) (symbol->string b)))")
+    call_prim("vector-sort!", vec, less)
+    assert [vec.ref(i).tostring() for i in range(3)] == ["a", "b", "c"]
+    with pytest.raises(SchemeException):
+        call_prim("vector-sort!", run("#(2 1)"), prim("<"))
+    with pytest.raises(SchemeException):
+        call_prim("vector-sort!", run("(vector 2 1)"), prim("<"),
+                  values.W_Fixnum(0), values.W_Fixnum(3))
+
+def test_vector_sort():
+    vec = run("(vector 1.5 -2.0 0.5)")
+    result = call_prim("vector-sort", vec, prim(">"))
+    assert isinstance(result.strategy, FlonumVectorStrategy)
+    assert [result.ref(i).value for i in range(3)] == [1.5, 0.5, -2.0]
+    assert [vec.ref(i).value for i in range(3)] == [1.5, -2.0, 0.5]
+
+def test_vector_sort_impersonated():
+    vec = run("(impersonate-vector (vector 3 1 2) (lambda (v i x) (* x 10)) (lambda (v i x) (add1 x)))")
+    result = call_prim("vector-sort", vec, prim("<"))
+    assert [result.ref(i).value for i in range(3)] == [10, 20, 30]
+    call_prim("vector-sort!", vec, prim("<"))
+    # the values are written through the impersonator
+    assert [vec.inner.ref(i).value for i in range(3)] == [11, 21, 31]
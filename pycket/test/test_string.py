@@ -130,6 +130,43 @@ def test_string_append(doctest):
     ""
     """
 
+def test_string_append_rope(doctest):
+    u"""
+    ! (define piece (make-string 100 #\\a))
+    ! (define (loop s n) (if (= n 0) s (loop (string-append s piece "b") (- n 1))))
+    ! (define s (loop "" 50))
+    ! (define t (string-append s s))
+    > (string-length t)
+    10100
+    > (string-ref s 100)
+    #\\b
+    > (string-set! piece 0 #\\x)
+    > (string-ref s 0)
+    #\\a
+    > (string-set! s 0 #\\y)
+    > (string-ref t 0)
+    #\\a
+    > (string=? (substring t 5049 5052) "baa")
+    #t
+    > (string-ref (string-append s "ä" piece) 5050)
+    #\\ä
+    > (equal? (string-append piece piece) (string-append piece piece))
+    #t
+    """
+
+def test_string_append_rope_strategy():
+    from pycket.values_string import W_String, RopeStringStrategy
+    piece = W_String.fromascii("x" * 100)
+    w_str = W_String.concat([piece, piece])
+    assert w_str.get_strategy() is RopeStringStrategy.singleton
+    w_str = W_String.concat([w_str, W_String.fromunicode(u"\xe4")])
+    assert w_str.length() == 201
+    assert w_str.get_strategy() is RopeStringStrategy.singleton
+    assert w_str.getitem(200) == u"\xe4"
+    assert w_str.get_strategy() is not RopeStringStrategy.singleton
+    assert w_str.as_unicode() == u"x" * 200 + u"\xe4"
+    assert W_String.concat([piece]).get_strategy() is not RopeStringStrategy.singleton
+
 def test_bytes_to_string_utf8(doctest):
     """
     > (bytes->string/utf-8 (bytes 65 66 67))
@@ -370,3 +407,25 @@ def test_mutable_unicode_to_bytes(doctest):
     > (string->bytes/utf-8 st)
     #"s\303\274\303\237"
     """
+
+def test_equal_mutable_immutable(doctest):
+    ur"""
+    ! (define st (string-copy "hello"))
+    ! (string-set! st 0 #\h)
+    ! (define ust (string-copy "fuß"))
+    ! (string-set! ust 0 #\f)
+    > (equal? st "hello")
+    #t
+    > (equal? "hello" st)
+    #t
+    > (equal? st "hellp")
+    #f
+    > (= (equal-hash-code st) (equal-hash-code "hello"))
+    #t
+    > (equal? ust "fuß")
+    #t
+    > (equal? "fuß" ust)
+    #t
+    > (equal? ust "fuss")
+    #f
+    """
@@ -5,7 +5,8 @@ from pycket.values import *
 from pycket.impersonators import *
 from pycket.vector import *
 from pycket.prims import *
-from pycket.test.testhelper import run_fix, run, run_mod, execute, check_equal
+from pycket.test.testhelper import (run_fix, run, run_mod, execute,
+                                    check_equal, call_prim)
 
 def test_vec():
     assert isinstance(run('(vector 1)'), W_Vector)
@@ -176,6 +177,124 @@ def test_vector_copy_bang(doctest):
     '#(l p p l y)
     """
 
+def test_vector_copy_bang_overlap(doctest):
+    """
+    > (define v (vector 1 2 3 4 5))
+    > (vector-copy! v 1 v 0 4)
+    > v
+    '#(1 1 2 3 4)
+    > (vector-copy! v 0 v 1)
+    > v
+    '#(1 2 3 4 4)
+    > (vector-copy! v 5 #())
+    > (vector-copy! v 3 (vector 'a 'b))
+    > v
+    '#(1 2 3 a b)
+    > (define fl (vector 1.5 2.5))
+    > (vector-copy! fl 0 (vector 1 2) 1)
+    > fl
+    '#(2 2.5)
+    E (vector-copy! v 4 (vector 1 2))
+    E (vector-copy! v 0 (vector 1 2) 1 3)
+    E (vector-copy! v 0 (vector 1 2) 2 1)
+    """
+
+def test_vector_copy_bang_impersonated(doctest):
+    """
+    > (define v (make-vector 3 0))
+    > (define src (impersonate-vector (vector 1 2 3) (lambda (v i x) (* x 10)) (lambda (v i x) x)))
+    > (vector-copy! v 0 src 1)
+    > v
+    '#(20 30 0)
+    """
+
+def test_vector_copy_bang_keeps_storage():
+    vec = run("(let ([v (make-vector 4 0)]) (vector-copy! v 1 (vector 1 2)) v)")
+    assert isinstance(vec.strategy, FixnumVectorStrategy)
+    assert [vec.ref(i).value for i in range(4)] == [0, 1, 2, 0]
+    vec = run("(let ([v (make-vector 2 0)]) (vector-copy! v 1 (vector 'a)) v)")
+    assert isinstance(vec.strategy, ObjectVectorStrategy)
+
+def test_vector_fill(doctest):
+    """
+    > (define v (vector 1 2 3))
+    > (vector-fill! v 'a)
+    > v
+    '#(a a a)
+    > (define w (impersonate-vector (vector 1 2) (lambda (v i x) x) (lambda (v i x) (* x 2))))
+    > (vector-fill! w 3)
+    > w
+    '#(6 6)
+    """
+    v = run("(let ([v (vector 'a 'b)]) (vector-fill! v 1.5) v)")
+    assert isinstance(v.strategy, FlonumVectorStrategy)
+
+def test_vector_slices():
+    from pycket.prims.vector import append_vectors
+    vec = W_Vector.fromelements([W_Fixnum(i) for i in range(5)])
+    part = vec.copy_range(1, 3)
+    assert isinstance(part.strategy, FixnumVectorStrategy)
+    assert [part.ref(i).value for i in range(part.length())] == [1, 2]
+    part.set(0, W_Fixnum(10))
+    assert vec.ref(1).value == 1
+    const = W_Vector.fromelements([W_Fixnum(7)], immutable=True)
+    assert not const.copy_range(0, 1).immutable()
+    both = append_vectors([vec, const], 6)
+    assert isinstance(both.strategy, FixnumVectorStrategy)
+    assert [both.ref(i).value for i in range(6)] == [0, 1, 2, 3, 4, 7]
+    mixed = append_vectors([vec, W_Vector.fromelements([w_true])], 6)
+    assert isinstance(mixed.strategy, ObjectVectorStrategy)
+    assert mixed.ref(5) is w_true
+
+def test_vector_map():
+    vec = run("(vector 1 2 3)")
+    add = run("(lambda (x y) (+ x y 0.5))")
+    result = call_prim("vector-map", add, vec, vec)
+    assert isinstance(result.strategy, FlonumVectorStrategy)
+    assert [result.ref(i).value for i in range(3)] == [2.5, 4.5, 6.5]
+    imp_vec = run("(impersonate-vector (vector 1 2 3) (lambda (v i x) (* x 10)) (lambda (v i x) x))")
+    result = call_prim("vector-map", add, vec, imp_vec)
+    assert [result.ref(i).value for i in range(3)] == [11.5, 22.5, 33.5]
+    with pytest.raises(SchemeException):
+        call_prim("vector-map", add, vec, run("(vector 1)"))
+
+def test_vector_for_each():
+    pair = run("(let ([out (vector 0 0 0)]) (cons out (lambda (x) (vector-set! out (sub1 x) x))))")
+    out, store = pair.car(), pair.cdr()
+    assert call_prim("vector-for-each", store, run("(vector 3 1 2)")) is w_void
+    assert [out.ref(i).value for i in range(3)] == [1, 2, 3]
+
+def test_vec_equal_unboxed(doctest):
+    """
+    ! (require '#%flfxnum)
+    > (equal? (make-vector 3 1.5) (vector 1.5 1.5 1.5))
+    #t
+    > (equal? (vector +nan.0 0.0) (vector +nan.0 0.0))
+    #t
+    > (equal? (vector 0.0) (vector -0.0))
+    #f
+    > (equal? (vector 1 2) (vector 1.0 2.0))
+    #f
+    > (equal? (vector #\\a #\\b) (vector #\\a #\\b))
+    #t
+    > (equal? (vector #\\a #\\b) (vector #\\a #\\c))
+    #f
+    > (equal? (flvector 1.0 +nan.0) (flvector 1.0 +nan.0))
+    #t
+    > (equal? (flvector 1.0) (flvector 2.0))
+    #f
+    """
+
+def test_vec_equal_hash_code_strategies():
+    from pycket.prims.equal import equal_hash_code
+    fixnums = run("(vector 1 2 3)")
+    objects = run("(let ([v (vector 'a 2 3)]) (vector-set! v 0 1) v)")
+    assert isinstance(fixnums.strategy, FixnumVectorStrategy)
+    assert isinstance(objects.strategy, ObjectVectorStrategy)
+    assert equal_hash_code(fixnums) == equal_hash_code(objects)
+    assert equal_hash_code(run("(vector 1.5 2.5)")) == equal_hash_code(
+        run("(let ([v (vector 'a 2.5)]) (vector-set! v 0 1.5) v)"))
+
 def test_list_vector_conversion():
     check_equal(
         "(vector->list #(1 2 3 4))", "(list 1 2 3 4)",
@@ -0,0 +1,43 @@
+from pycket.expand import expand_to_ast, ModTable
+from pycket.interpreter import DefineValues, CaseLambda
+from pycket.test.testhelper import run_ast
+from pycket import warmup
+from pycket import values
+
+def _lambdas(mod):
+    lams = {}
+    for form in mod.body:
+        if isinstance(form, DefineValues) and isinstance(form.rhs, CaseLambda):
+            lams[form.names[0].utf8value] = form.rhs.lams[0]
+    return lams
+
+def test_warmup_profile(tmpdir, monkeypatch):
+    f = tmpdir.join("loop.rkt")
+    f.write("""#lang pycket
+    (define (loop n acc) (if (zero? n) acc (loop (sub1 n) (+ acc 1))))
+    (define (once x) (+ x 1))
+    (define x (once (loop 100 0)))
+    """)
+    profile_file = str(tmpdir.join("profile"))
+    mod = expand_to_ast(str(f), ModTable())
+    run_ast(mod)
+    lams = _lambdas(mod)
+    assert lams["loop"].body[0].in_cycle
+    assert not lams["once"].body[0].in_cycle
+    warmup.WarmupProfile().dump(profile_file, [mod])
+
+    profile = warmup.WarmupProfile()
+    profile.load(profile_file)
+    assert profile.entries.keys() == [warmup.lambda_key(lams["loop"].srcfile,
+                                                        lams["loop"].srcpos)]
+    import pycket.interpreter
+    monkeypatch.setattr(pycket.interpreter, "warmup_profile", profile)
+    mod = expand_to_ast(str(f), ModTable())
+    lams = _lambdas(mod)
+    # armed before running anything
+    assert lams["loop"].body[0].in_cycle
+    assert lams["loop"].body[0].should_enter
+    assert not lams["once"].body[0].in_cycle
+    assert not lams["once"].body[0].should_enter
+    run_ast(mod)
+    assert mod.defs[values.W_Symbol.make("x")].value == 101
@@ -76,6 +76,20 @@ def run_values(p, stdlib=False):
     v = run_mod_expr(e, stdlib=stdlib)
     return values.from_list(v)
 
+def call_prim(name, *args):
+    """ call the primitive name with args, also for primitives that the
+    expander binds to library code instead """
+    from pycket.prims.expose import prim_env
+    w_prim = prim_env[values.W_Symbol.make(name)]
+    env = ToplevelEnv()
+    cont = nil_continuation
+    cont.update_cm(values.parameterization_key, values.top_level_config)
+    try:
+        ast, env, cont = w_prim.call(list(args), env, cont)
+        inner_interpret_one_state(ast, env, cont)
+    except Done, e:
+        return e.values.get_all_values()[0]
+
 def run_std(c, v):
     return run_top(c, v, stdlib=True)
 
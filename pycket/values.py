@@ -319,9 +319,17 @@ class W_UnwrappedFixnumCons(W_Cons):
         return self._cdr
 
 class W_UnwrappedFixnumConsProper(W_UnwrappedFixnumCons):
+    _immutable_fields_ = ["_length"]
+    def __init__(self, a, d):
+        W_UnwrappedFixnumCons.__init__(self, a, d)
+        self._length = d.list_length() + 1
+
     def is_proper_list(self):
         return True
 
+    def list_length(self):
+        return self._length
+
 class W_UnwrappedFlonumCons(W_Cons):
     _immutable_fields_ = ["_car", "_cdr"]
     def __init__(self, a, d):
@@ -336,9 +344,17 @@ class W_UnwrappedFlonumCons(W_Cons):
         return self._cdr
 
 class W_UnwrappedFlonumConsProper(W_UnwrappedFlonumCons):
+    _immutable_fields_ = ["_length"]
+    def __init__(self, a, d):
+        W_UnwrappedFlonumCons.__init__(self, a, d)
+        self._length = d.list_length() + 1
+
     def is_proper_list(self):
         return True
 
+    def list_length(self):
+        return self._length
+
 class W_WrappedCons(W_Cons):
     _immutable_fields_ = ["_car", "_cdr"]
     def __init__(self, a, d):
@@ -350,9 +366,83 @@ class W_WrappedCons(W_Cons):
         return self._cdr
 
 class W_WrappedConsProper(W_WrappedCons):
+    _immutable_fields_ = ["_length"]
+    def __init__(self, a, d):
+        W_WrappedCons.__init__(self, a, d)
+        self._length = d.list_length() + 1
+
     def is_proper_list(self):
         return True
 
+    def list_length(self):
+        return self._length
+
+# lists built from at least this many elements at once are kept in an array
+ARRAY_LIST_MIN_LENGTH = 16
+
+class ArrayListStorage(object):
+    """ The elements of a cdr-coded list, followed by its tail. The conses
+    after the first are made when they are first reached and kept in cells,
+    so that every position has one cons and eq? needs no special case.
+    tail_length is the length of the tail, -1 if it is not a proper list. """
+    _immutable_fields_ = ["items[*]", "tail", "tail_length"]
+
+    def __init__(self, items, tail, tail_length):
+        self.items = items
+        self.tail = tail
+        self.tail_length = tail_length
+        self.cells = None
+
+    def cell(self, index):
+        """ the list at position index > 0 """
+        assert index > 0
+        if index == len(self.items):
+            return self.tail
+        cells = self.cells
+        if cells is None:
+            # the first cons is never looked up, see to_array_list
+            cells = [None] * len(self.items)
+            self.cells = cells
+        w_cell = cells[index]
+        if w_cell is None:
+            w_cell = W_ArrayCons(self, index)
+            cells[index] = w_cell
+        return w_cell
+
+class W_ArrayCons(W_Cons):
+    """ The cons at position index of a cdr-coded list, see
+    ArrayListStorage. """
+    _immutable_fields_ = ["storage", "index"]
+
+    def __init__(self, storage, index):
+        assert 0 <= index < len(storage.items)
+        self.storage = storage
+        self.index = index
+
+    def car(self):
+        return self.storage.items[self.index]
+
+    def cdr(self):
+        return self.storage.cell(self.index + 1)
+
+    def is_proper_list(self):
+        return self.storage.tail_length >= 0
+
+    def list_length(self):
+        assert self.storage.tail_length >= 0
+        return self.array_length() + self.storage.tail_length
+
+    def array_length(self):
+        """ the number of conses before the tail """
+        return len(self.storage.items) - self.index
+
+    def drop(self, n):
+        """ the list after n conses, n < array_length() """
+        assert 0 <= n < self.array_length()
+        if n == 0:
+            return self
+        return self.storage.cell(self.index + n)
+
 class W_Box(W_Object):
     errorname = "box"
     def __init__(self):
@@ -613,16 +703,17 @@ class W_Flonum(W_Number):
         return compute_hash(self.value)
 
     def eqv(self, other):
-        from rpython.rlib.longlong2float import float2longlong
-        import math
         if not isinstance(other, W_Flonum):
             return False
-        v1 = self.value
-        v2 = other.value
-        ll1 = float2longlong(v1)
-        ll2 = float2longlong(v2)
-        # Assumes that all non-NaN values are canonical
-        return ll1 == ll2 or (math.isnan(v1) and math.isnan(v2))
+        return flonum_eqv(self.value, other.value)
+
+def flonum_eqv(v1, v2):
+    from rpython.rlib.longlong2float import float2longlong
+    import math
+    ll1 = float2longlong(v1)
+    ll2 = float2longlong(v2)
+    # Assumes that all non-NaN values are canonical
+    return ll1 == ll2 or (math.isnan(v1) and math.isnan(v2))
 
 
 class W_Bignum(W_Integer):
@@ -746,6 +837,9 @@ class W_Null(W_List):
     def is_proper_list(self):
         return True
 
+    def list_length(self):
+        return 0
+
 w_void = W_Void()
 w_null = W_Null()
 
@@ -803,79 +897,200 @@ class W_ThreadCell(W_Object):
 @memoize_constructor
 class W_Bytes(W_Object):
     errorname = "bytes"
-    _immutable_fields_ = ['value']
-    _attrs_ = ['value']
+    _attrs_ = []
+    _settled_ = True
 
     @staticmethod
     def from_string(str, immutable=True):
         if immutable:
-            return W_ImmutableBytes(list(str))
+            return W_ImmutableBytes(str)
         else:
-            return W_MutableBytes(list(str))
+            return W_MutableBytes.view(str, 0, len(str))
 
-    def __init__(self, bs):
-        assert bs is not None
-        self.value = check_list_of_chars(bs)
-        make_sure_not_resized(self.value)
+    def length(self):
+        raise NotImplementedError("abstract base class")
+
+    def getitem(self, n):
+        raise NotImplementedError("abstract base class")
+
+    def getslice(self, start, stop):
+        """ the bytes from start to stop as a string """
+        raise NotImplementedError("abstract base class")
+
+    def as_str(self):
+        return self.getslice(0, self.length())
 
     def tostring(self):
-        return "#\"%s\"" % "".join(self.value)
+        return "#\"%s\"" % self.as_str()
 
     def equal(self, other):
         if not isinstance(other, W_Bytes):
             return False
-        return len(self.value) == len(other.value) and str(self.value) == str(other.value)
+        return self.length() == other.length() and self.as_str() == other.as_str()
 
     def hash_equal(self):
-        from rpython.rlib.rarithmetic import intmask
-        # like CPython's string hash
-        s = self.value
-        length = len(s)
-        if length == 0:
-            return -1
-        x = ord(s[0]) << 7
-        i = 0
-        while i < length:
-            x = intmask((1000003*x) ^ ord(s[i]))
-            i += 1
-        x ^= length
-        return intmask(x)
+        return compute_hash(self.as_str())
 
     def immutable(self):
         raise NotImplementedError("abstract base class")
 
     def ref(self, n):
-        l = len(self.value)
+        l = self.length()
         if n < 0 or n >= l:
             raise SchemeException("bytes-ref: index %s out of bounds for length %s"% (n, l))
-        return W_Fixnum(ord(self.value[n]))
+        return W_Fixnum(ord(self.getitem(n)))
 
     def set(self, n, v):
         raise NotImplementedError("abstract base class")
 
-    def as_str(self):
-        return "".join(self.value)
+    def subbytes(self, start, stop):
+        """ new mutable bytes with the bytes from start to stop """
+        raise NotImplementedError("abstract base class")
 
 
 class W_MutableBytes(W_Bytes):
+    """ Until they are written to, mutable bytes are a view of the part
+    [start, start + size) of the string shared, e.g. of the bytes subbytes
+    was applied to, or of what a port read. The first write copies them into
+    the list chars. """
     errorname = "bytes"
+    _attrs_ = ['chars', 'shared', 'start', 'size']
+
+    def __init__(self, chars):
+        assert chars is not None
+        self.chars = check_list_of_chars(chars)
+        make_sure_not_resized(self.chars)
+        self.shared = None
+        self.start = 0
+        self.size = 0
+
+    @staticmethod
+    def view(shared, start, size):
+        assert start >= 0 and size >= 0 and start + size <= len(shared)
+        w_result = W_MutableBytes([])
+        w_result.chars = None
+        w_result.shared = shared
+        w_result.start = start
+        w_result.size = size
+        return w_result
 
     def immutable(self):
         return False
 
+    def length(self):
+        if self.chars is None:
+            return self.size
+        return len(self.chars)
+
+    def getitem(self, n):
+        if self.chars is None:
+            return self.shared[self.start + n]
+        return self.chars[n]
+
+    def getslice(self, start, stop):
+        assert 0 <= start <= stop
+        if self.chars is None:
+            shared = self.shared
+            start += self.start
+            stop += self.start
+            assert start >= 0
+            if start == 0 and stop == len(shared):
+                return shared
+            return shared[start:stop]
+        return "".join(self.chars[start:stop])
+
+    def subbytes(self, start, stop):
+        assert 0 <= start <= stop
+        if self.chars is None:
+            # writes never change the shared string, so it can be shared
+            # once more
+            return W_MutableBytes.view(self.shared, self.start + start,
+                                       stop - start)
+        return W_MutableBytes(self.chars[start:stop])
+
+    def get_chars(self):
+        chars = self.chars
+        if chars is None:
+            start = self.start
+            stop = start + self.size
+            assert start >= 0 and stop >= 0
+            chars = self.chars = list(self.shared[start:stop])
+            make_sure_not_resized(chars)
+            self.shared = None
+        return chars
+
     def set(self, n, v):
-        l = len(self.value)
+        l = self.length()
         if n < 0 or n >= l:
             raise SchemeException("bytes-set!: index %s out of bounds for length %s"% (n, l))
-        self.value[n] = chr(v)
+        self.get_chars()[n] = chr(v)
+
+    def setslice(self, n, w_from, start, stop):
+        """ copy the bytes from start to stop of w_from to n, the bounds
+        have to be checked by the caller """
+        if n == 0 and stop - start == self.length():
+            # everything is replaced, share instead of copying
+            if isinstance(w_from, W_ImmutableBytes):
+                self.chars = None
+                self.shared = w_from.value
+                self.start = start
+                self.size = stop - start
+                return
+            if isinstance(w_from, W_MutableBytes) and w_from.chars is None:
+                self.chars = None
+                self.shared = w_from.shared
+                self.start = w_from.start + start
+                self.size = stop - start
+                return
+        chars = self.get_chars()
+        if isinstance(w_from, W_MutableBytes) and w_from.chars is not None:
+            assert n >= 0 and start >= 0
+            chars[n:n + stop - start] = w_from.chars[start:stop]
+            return
+        self.setslice_str(n, w_from.getslice(start, stop))
+
+    def setslice_str(self, n, s):
+        if n == 0 and len(s) == self.length():
+            self.chars = None
+            self.shared = s
+            self.start = 0
+            self.size = len(s)
+            return
+        chars = self.get_chars()
+        for i in range(len(s)):
+            chars[n + i] = s[i]
 
 
 class W_ImmutableBytes(W_Bytes):
     errorname = "bytes"
+    _immutable_fields_ = ['value']
+    _attrs_ = ['value']
+
+    def __init__(self, value):
+        assert value is not None
+        self.value = value
 
     def immutable(self):
         return True
 
+    def length(self):
+        return len(self.value)
+
+    def getitem(self, n):
+        return self.value[n]
+
+    def getslice(self, start, stop):
+        assert 0 <= start <= stop
+        if start == 0 and stop == len(self.value):
+            return self.value
+        return self.value[start:stop]
+
+    def as_str(self):
+        return self.value
+
+    def subbytes(self, start, stop):
+        return W_MutableBytes.view(self.value, start, stop - start)
+
     def set(self, n, v):
         raise SchemeException("bytes-set!: can't mutate immutable bytes")
 
@@ -1010,15 +1225,17 @@ class W_ThunkProcCMK(W_Procedure):
 
 
 class W_Prim(W_Procedure):
-    _immutable_fields_ = ["name", "code", "arity", "simple1", "simple2"]
+    _immutable_fields_ = ["name", "code", "arity", "simple1", "simple2", "simple_n"]
 
-    def __init__ (self, name, code, arity=Arity.unknown, simple1=None, simple2=None):
+    def __init__ (self, name, code, arity=Arity.unknown, simple1=None, simple2=None,
+                  simple_n=None):
         self.name = name
         self.code = code
         assert isinstance(arity, Arity)
         self.arity = arity
         self.simple1 = simple1
         self.simple2 = simple2
+        self.simple_n = simple_n
 
     def get_arity(self):
         return self.arity
@@ -1042,6 +1259,31 @@ def to_improper(l, curr):
         curr = W_Cons.make(l[i], curr)
     return curr
 
+def to_array_list(l, tail=w_null):
+    """ Like to_improper, but long lists keep their elements in a copy of l
+    instead of allocating a cons per element. """
+    if len(l) < ARRAY_LIST_MIN_LENGTH:
+        return to_improper(l, tail)
+    tail_length = tail.list_length() if tail.is_proper_list() else -1
+    return W_ArrayCons(ArrayListStorage(l[:], tail, tail_length), 0)
+
+def list_drop(w_lst, n):
+    """ the list after the first n conses of w_lst, which skips the arrays of
+    cdr-coded lists in one step; None if w_lst has fewer conses """
+    while n > 0:
+        if isinstance(w_lst, W_ArrayCons):
+            length = w_lst.array_length()
+            if n < length:
+                return w_lst.drop(n)
+            n -= length
+            w_lst = w_lst.storage.tail
+        elif isinstance(w_lst, W_Cons):
+            n -= 1
+            w_lst = w_lst.cdr()
+        else:
+            return None
+    return w_lst
+
 def to_mlist(l): return to_mimproper(l, w_null)
 
 @jit.look_inside_iff(
@@ -1052,14 +1294,15 @@ def to_mimproper(l, curr):
     return curr
 
 def from_list(w_curr):
-    result = []
+    if not w_curr.is_proper_list():
+        raise SchemeException("Expected list, but got something else")
+    result = [None] * w_curr.list_length()
+    i = 0
     while isinstance(w_curr, W_Cons):
-        result.append(w_curr.car())
+        result[i] = w_curr.car()
         w_curr = w_curr.cdr()
-    if w_curr is w_null:
-        return result[:] # copy to make result non-resizable
-    else:
-        raise SchemeException("Expected list, but got something else")
+        i += 1
+    return result
 
 class W_Continuation(W_Procedure):
     errorname = "continuation"
@@ -1109,32 +1352,36 @@ class W_Closure(W_Procedure):
         return self.caselam.get_arity()
 
     @jit.unroll_safe
-    def _find_lam(self, args):
-        jit.promote(self.caselam)
-        for (i, lam) in enumerate(self.caselam.lams):
-            try:
-                actuals = lam.match_args(args)
-            except SchemeException:
-                if len(self.caselam.lams) == 1:
-                    lam.raise_nice_error(args)
-            else:
-                frees = self._get_list(i)
-                return (actuals, frees, lam)
+    def find_clause(self, args):
+        """ the index of the lambda of the case-lambda that accepts args """
+        lams = jit.promote(self.caselam).lams
+        for i in range(len(lams)):
+            if lams[i].accepts(len(args)):
+                return i
+        if len(lams) == 1:
+            lams[0].raise_nice_error(args)
         raise SchemeException("No matching arity in case-lambda")
 
     def call_with_extra_info(self, args, env, cont, calling_app):
+        return self.call_clause(self.find_clause(args), args, env, cont,
+                                calling_app, True)
+
+    def call_clause(self, i, args, env, cont, calling_app, register):
+        """ call lambda i of the case-lambda, which accepts args; register
+        says whether to register the call in the callgraph """
         env_structure = None
         if calling_app is not None:
             env_structure = calling_app.env_structure
         jit.promote(self.caselam)
         jit.promote(env_structure)
-        (actuals, frees, lam) = self._find_lam(args)
-        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
+        lam = self.caselam.lams[i]
+        if register and not jit.we_are_jitted() and env.pycketconfig().callgraph:
             env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
+        actuals = lam.match_args(args)
         # specialize on the fact that often we end up executing in the
         # same environment.
         prev = lam.env_structure.prev.find_env_in_chain_speculate(
-                frees, env_structure, env)
+                self._get_list(i), env_structure, env)
         return lam.make_begin_cont(
             ConsEnv.make(actuals, prev),
             cont)
@@ -1174,14 +1421,23 @@ class W_Closure1AsEnv(ConsEnv):
     def get_arity(self):
         return self.caselam.get_arity()
 
+    def find_clause(self, args):
+        lam = self.caselam.lams[0]
+        if not lam.accepts(len(args)):
+            lam.raise_nice_error(args)
+        return 0
+
     def call_with_extra_info(self, args, env, cont, calling_app):
+        return self.call_clause(0, args, env, cont, calling_app, True)
+
+    def call_clause(self, i, args, env, cont, calling_app, register):
         env_structure = None
         if calling_app is not None:
             env_structure = calling_app.env_structure
         jit.promote(self.caselam)
         jit.promote(env_structure)
         lam = self.caselam.lams[0]
-        if not jit.we_are_jitted() and env.pycketconfig().callgraph:
+        if register and not jit.we_are_jitted() and env.pycketconfig().callgraph:
             env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
         actuals = lam.match_args(args)
         # specialize on the fact that often we end up executing in the
@@ -1,10 +1,15 @@
 from pycket.base import W_Object, SingletonMeta
 from pycket import values, values_string
 from pycket.cont import continuation, label, loop_label
+from pycket.error import SchemeException
+from pycket.hamt import make_persistent_map
 from pycket import config
 
 from rpython.rlib.objectmodel import r_dict, compute_hash, import_from_mixin
-from rpython.rlib import rerased
+from rpython.rlib.longlong2float import float2longlong, longlong2float
+from rpython.rlib import rerased, rfloat
+
+import math
 
 
 class W_Missing(W_Object):
@@ -33,6 +38,18 @@ class W_HashTable(W_Object):
     def hash_remove(self, k, env, cont):
         raise NotImplementedError("abstract method")
 
+    @label
+    def hash_set_functional(self, k, v, env, cont):
+        """ pass a table like this one with k mapped to v to cont """
+        raise SchemeException("hash-set: contract violation\n"
+                              "  expected: (and/c hash? immutable?)")
+
+    @label
+    def hash_remove_functional(self, k, env, cont):
+        """ pass a table like this one without k to cont """
+        raise SchemeException("hash-remove: contract violation\n"
+                              "  expected: (and/c hash? immutable?)")
+
     def length(self):
         raise NotImplementedError("abstract method")
 
@@ -41,49 +58,76 @@ class W_HashTable(W_Object):
         raise NotImplementedError("abstract method")
 
 
-class W_SimpleHashTable(W_HashTable):
-    _attrs_ = ['data']
+class W_MutableHashTable(W_HashTable):
+    """ A mutable table, its entries are kept by a HashmapStrategy. """
+    _attrs_ = ['strategy', 'hstorage']
 
-    @staticmethod
-    def hash_value(v):
-        raise NotImplementedError("abstract method")
+    def __init__(self, keys, vals):
+        assert len(keys) == len(vals)
+        self.strategy = self.find_strategy(keys, vals)
+        self.hstorage = self.strategy.create_storage(keys, vals)
 
-    @staticmethod
-    def cmp_value(a, b):
+    def object_strategy(self):
+        """ the strategy for keys of any type """
         raise NotImplementedError("abstract method")
 
-    def __init__(self, keys, vals):
-        assert len(keys) == len(vals)
-        self.data = r_dict(self.cmp_value, self.hash_value, force_non_null=True)
-        for i, k in enumerate(keys):
-            self.data[k] = vals[i]
+    def strategy_for_key(self, w_key):
+        """ the most specialized strategy that can store w_key. eq?, eqv? and
+        equal? agree on fixnums, flonums, characters and symbols, so all
+        tables can keep them unboxed. """
+        if type(w_key) is values.W_Fixnum:
+            return FixnumHashmapStrategy.singleton
+        if type(w_key) is values.W_Flonum:
+            return FlonumHashmapStrategy.singleton
+        if type(w_key) is values.W_Character:
+            return CharacterHashmapStrategy.singleton
+        if type(w_key) is values.W_Symbol:
+            return SymbolHashmapStrategy.singleton
+        return self.object_strategy()
+
+    def find_strategy(self, keys, vals):
+        if not config.strategies:
+            return self.object_strategy()
+        if not keys:
+            return EmptyHashmapStrategy.singleton
+        strategy = self.strategy_for_key(keys[0])
+        for w_key in keys:
+            if not strategy.is_correct_type(w_key):
+                return self.object_strategy()
+        return strategy.for_values(vals)
 
     def hash_items(self):
-        return self.data.items()
+        return self.strategy.items(self)
+
+    def hash_set(self, key, val, env, cont):
+        return self.strategy.set(self, key, val, env, cont)
+
+    def hash_ref(self, key, env, cont):
+        return self.strategy.get(self, key, env, cont)
+
+    def get_item(self, i):
+        return self.strategy.get_item(self, i)
+
+    def length(self):
+        return self.strategy.length(self)
 
     def tostring(self):
-        lst = [values.W_Cons.make(k, v).tostring() for k, v in self.data.iteritems()]
+        lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
         return "#hash(%s)" % " ".join(lst)
 
-    @label
-    def hash_set(self, k, v, env, cont):
-        from pycket.interpreter import return_value
-        self.data[k] = v
-        return return_value(values.w_void, env, cont)
+class W_SimpleHashTable(W_MutableHashTable):
+    _attrs_ = []
 
-    @label
-    def hash_remove(self, k, env, cont):
-        from pycket.interpreter import return_value
-        del self.data[k]
-        return return_value(values.w_void, env, cont)
+    @staticmethod
+    def hash_value(v):
+        raise NotImplementedError("abstract method")
 
-    @label
-    def hash_ref(self, k, env, cont):
-        from pycket.interpreter import return_value
-        return return_value(self.data.get(k, w_missing), env, cont)
+    @staticmethod
+    def cmp_value(a, b):
+        raise NotImplementedError("abstract method")
 
-    def length(self):
-        return len(self.data)
+    def hash_remove(self, key, env, cont):
+        return self.strategy.remove(self, key, env, cont)
 
 class W_EqvHashTable(W_SimpleHashTable):
     @staticmethod
@@ -94,8 +138,8 @@ class W_EqvHashTable(W_SimpleHashTable):
     def cmp_value(a, b):
         return a.eqv(b)
 
-    def get_item(self, i):
-        return get_dict_item(self.data, i)
+    def object_strategy(self):
+        return EqvObjectHashmapStrategy.singleton
 
 class W_EqHashTable(W_SimpleHashTable):
     @staticmethod
@@ -104,6 +148,8 @@ class W_EqHashTable(W_SimpleHashTable):
             return compute_hash(k.value)
         if isinstance(k, values.W_Character):
             return ord(k.value)
+        if isinstance(k, values.W_Flonum):
+            return k.hash_eqv()
         else:
             return compute_hash(k)
 
@@ -112,58 +158,107 @@ class W_EqHashTable(W_SimpleHashTable):
         from pycket.prims.equal import eqp_logic
         return eqp_logic(a, b)
 
-    def get_item(self, i):
-        return get_dict_item(self.data, i)
+    def object_strategy(self):
+        return EqObjectHashmapStrategy.singleton
+
+class EqualHashStorage(object):
+    """ Storage of the ObjectHashmapStrategy. The entries are kept in
+    insertion order, buckets maps an equal-hash-code to the positions of the
+    entries whose keys have that code. Keys whose hash code can't be computed
+    without calling user code are recorded in unhashable instead; they have to
+    be compared against every key that is looked up. """
+
+    def __init__(self):
+        self.entries = []
+        self.buckets = {}
+        self.unhashable = []
+
+    def positions(self, hashable, h):
+        """ the positions of the entries that can be equal? to a key with the
+        given hash code """
+        if not hashable:
+            return range(len(self.entries))
+        bucket = self.buckets.get(h, None)
+        if bucket is None:
+            return self.unhashable
+        if not self.unhashable:
+            return bucket
+        return bucket + self.unhashable
+
+    def add(self, key, val, hashable, h):
+        pos = len(self.entries)
+        self.entries.append((key, val))
+        if not hashable:
+            self.unhashable.append(pos)
+            return
+        bucket = self.buckets.get(h, None)
+        if bucket is None:
+            self.buckets[h] = [pos]
+        else:
+            bucket.append(pos)
+
+def try_equal_hash(key):
+    from pycket.prims.equal import equal_hash_code, UnhashableError
+    try:
+        return True, equal_hash_code(key)
+    except UnhashableError:
+        return False, 0
 
 @loop_label
-def equal_hash_ref_loop(data, idx, key, env, cont):
+def equal_hash_ref_loop(storage, positions, idx, key, env, cont):
     from pycket.interpreter import return_value
     from pycket.prims.equal import equal_func, EqualInfo
-    if idx >= len(data):
+    if idx >= len(positions):
         return return_value(w_missing, env, cont)
-    k, v = data[idx]
+    k, v = storage.entries[positions[idx]]
     info = EqualInfo.BASIC_SINGLETON
     return equal_func(k, key, info, env,
-            catch_ref_is_equal_cont(data, idx, key, v, env, cont))
+            catch_ref_is_equal_cont(storage, positions, idx, key, v, env, cont))
 
 @continuation
-def catch_ref_is_equal_cont(data, idx, key, v, env, cont, _vals):
+def catch_ref_is_equal_cont(storage, positions, idx, key, v, env, cont, _vals):
     from pycket.interpreter import check_one_val, return_value
     val = check_one_val(_vals)
     if val is not values.w_false:
         return return_value(v, env, cont)
-    return equal_hash_ref_loop(data, idx + 1, key, env, cont)
+    return equal_hash_ref_loop(storage, positions, idx + 1, key, env, cont)
 
-def equal_hash_set_loop(data, idx, key, val, env, cont):
+def equal_hash_set_loop(storage, positions, idx, key, val, hashable, h, env, cont):
     from pycket.interpreter import check_one_val, return_value
     from pycket.prims.equal import equal_func, EqualInfo
-    if idx >= len(data):
-        data.append((key, val))
+    if idx >= len(positions):
+        storage.add(key, val, hashable, h)
         return return_value(values.w_void, env, cont)
-    k, _ = data[idx]
+    k, _ = storage.entries[positions[idx]]
     info = EqualInfo.BASIC_SINGLETON
     return equal_func(k, key, info, env,
-            catch_set_is_equal_cont(data, idx, key, val, env, cont))
+            catch_set_is_equal_cont(storage, positions, idx, key, val, hashable, h, env, cont))
 
 @continuation
-def catch_set_is_equal_cont(data, idx, key, val, env, cont, _vals):
+def catch_set_is_equal_cont(storage, positions, idx, key, val, hashable, h, env, cont, _vals):
     from pycket.interpreter import check_one_val, return_value
     cmp = check_one_val(_vals)
     if cmp is not values.w_false:
-        data[idx] = (key, val)
+        storage.entries[positions[idx]] = (key, val)
         return return_value(values.w_void, env, cont)
-    return equal_hash_set_loop(data, idx + 1, key, val, env, cont)
+    return equal_hash_set_loop(storage, positions, idx + 1, key, val, hashable, h, env, cont)
 
 
 class HashmapStrategy(object):
     __metaclass__ = SingletonMeta
 
+    def is_correct_type(self, w_obj):
+        raise NotImplementedError("abstract base class")
+
     def get(self, w_dict, w_key, env, cont):
         raise NotImplementedError("abstract base class")
 
     def set(self, w_dict, w_key, w_val, env, cont):
         raise NotImplementedError("abstract base class")
 
+    def remove(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
     def items(self, w_dict):
         raise NotImplementedError("abstract base class")
 
@@ -176,91 +271,167 @@ class HashmapStrategy(object):
     def create_storage(self, keys, vals):
         raise NotImplementedError("abstract base class")
 
+    def for_values(self, vals):
+        """ the strategy for the same keys that fits vals best """
+        return self
 
-def _find_strategy_class(keys):
-    if not config.strategies:
-        return ObjectHashmapStrategy.singleton
-    if len(keys) == 0:
-        return EmptyHashmapStrategy.singleton
-        # An empty vector stays empty forever. Don't implement special EmptyVectorStrategy.
-    single_class = type(keys[0])
-    for elem in keys:
-        if not isinstance(elem, single_class):
-            return ObjectHashmapStrategy.singleton
-    if single_class is values.W_Fixnum:
-        return FixnumHashmapStrategy.singleton
-    if single_class is values.W_Symbol:
-        return SymbolHashmapStrategy.singleton
-    if single_class is values_string.W_String:
-        return StringHashmapStrategy.singleton
-    if single_class is values.W_Bytes:
-        return ByteHashmapStrategy.singleton
-    return ObjectHashmapStrategy.singleton
 
 class UnwrappedHashmapStrategyMixin(object):
     # the concrete class needs to implement:
-    # erase, unerase, is_correct_type, wrap, unwrap
-    # create_storage needs to be overwritten if an r_dict is needed
+    # erase, unerase, is_correct_type, wrap, unwrap, _create_empty_dict (keys)
+    # is_correct_value, wrap_value, unwrap_value (values)
+    # object_values, fixnum_values, flonum_values (see make_unwrapped_strategies)
 
     def get(self, w_dict, w_key, env, cont):
         from pycket.interpreter import return_value
         if self.is_correct_type(w_key):
-            w_res = self.unerase(w_dict.hstorage).get(self.unwrap(w_key), w_missing)
-            return return_value(w_res, env, cont)
-        # XXX should not dehomogenize always
-        self.switch_to_object_strategy(w_dict)
-        return w_dict.hash_ref(w_key, env, cont)
+            try:
+                val = self.unerase(w_dict.hstorage)[self.unwrap(w_key)]
+            except KeyError:
+                return return_value(w_missing, env, cont)
+            return return_value(self.wrap_value(val), env, cont)
+        # keys of other types are never equal? to the keys of the table
+        return return_value(w_missing, env, cont)
 
     def set(self, w_dict, w_key, w_val, env, cont):
         from pycket.interpreter import return_value
         if self.is_correct_type(w_key):
-            self.unerase(w_dict.hstorage)[self.unwrap(w_key)] = w_val
-            return return_value(values.w_void, env, cont)
-        self.switch_to_object_strategy(w_dict)
+            if self.is_correct_value(w_val):
+                d = self.unerase(w_dict.hstorage)
+                d[self.unwrap(w_key)] = self.unwrap_value(w_val)
+                return return_value(values.w_void, env, cont)
+            self.switch_strategy(w_dict, self.object_values)
+        else:
+            self.switch_strategy(w_dict, w_dict.object_strategy())
         return w_dict.hash_set(w_key, w_val, env, cont)
 
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        if self.is_correct_type(w_key):
+            d = self.unerase(w_dict.hstorage)
+            key = self.unwrap(w_key)
+            if key in d:
+                del d[key]
+        return return_value(values.w_void, env, cont)
+
     def items(self, w_dict):
-        return [(self.wrap(key), w_val) for key, w_val in self.unerase(w_dict.hstorage).iteritems()]
+        return [(self.wrap(key), self.wrap_value(val))
+                for key, val in self.unerase(w_dict.hstorage).iteritems()]
 
     def get_item(self, w_dict, i):
-        key, w_val = get_dict_item(self.unerase(w_dict.hstorage), i)
-        return self.wrap(key), w_val
+        key, val = get_dict_item(self.unerase(w_dict.hstorage), i)
+        return self.wrap(key), self.wrap_value(val)
 
     def length(self, w_dict):
         return len(self.unerase(w_dict.hstorage))
 
     def create_storage(self, keys, vals):
         d = self._create_empty_dict()
-        if not keys:
-            return self.erase(d)
         for i, w_key in enumerate(keys):
-            d[self.unwrap(w_key)] = vals[i]
+            d[self.unwrap(w_key)] = self.unwrap_value(vals[i])
         return self.erase(d)
 
-    def _create_empty_dict(self):
-        return {}
-
-    def switch_to_object_strategy(self, w_dict):
-        d = self.unerase(w_dict.hstorage)
-        keys = [self.wrap(key) for key in d.keys()]
-        values = d.values()
-        strategy = ObjectHashmapStrategy.singleton
-        storage = strategy.create_storage(keys, values)
+    def for_values(self, vals):
+        fixnums = flonums = True
+        for w_val in vals:
+            fixnums = fixnums and isinstance(w_val, values.W_Fixnum)
+            flonums = flonums and isinstance(w_val, values.W_Flonum)
+        if fixnums:
+            return self.fixnum_values
+        if flonums:
+            return self.flonum_values
+        return self.object_values
+
+    def switch_strategy(self, w_dict, strategy):
+        keys = []
+        vals = []
+        for key, val in self.unerase(w_dict.hstorage).iteritems():
+            keys.append(self.wrap(key))
+            vals.append(self.wrap_value(val))
         w_dict.strategy = strategy
-        w_dict.hstorage = storage
+        w_dict.hstorage = strategy.create_storage(keys, vals)
+
+class ObjectValuesMixin(object):
+    def is_correct_value(self, w_val):
+        return True
+
+    def wrap_value(self, val):
+        return val
+
+    def unwrap_value(self, w_val):
+        return w_val
+
+class FixnumValuesMixin(object):
+    def is_correct_value(self, w_val):
+        return isinstance(w_val, values.W_Fixnum)
+
+    def wrap_value(self, val):
+        assert isinstance(val, int)
+        return values.W_Fixnum(val)
+
+    def unwrap_value(self, w_val):
+        assert isinstance(w_val, values.W_Fixnum)
+        return w_val.value
+
+class FlonumValuesMixin(object):
+    def is_correct_value(self, w_val):
+        return isinstance(w_val, values.W_Flonum)
+
+    def wrap_value(self, val):
+        assert isinstance(val, float)
+        return values.W_Flonum(val)
+
+    def unwrap_value(self, w_val):
+        assert isinstance(w_val, values.W_Flonum)
+        return w_val.value
+
+def make_unwrapped_strategies(name, keys_mixin):
+    """ The strategy that keeps the keys described by keys_mixin unboxed.
+    Its variants for the same keys that also keep fixnum or flonum values
+    unboxed are its attributes fixnum_values and flonum_values. Storing a
+    value of another type switches back to object_values. """
+    def make(values_mixin, values_name):
+        class Strategy(HashmapStrategy):
+            import_from_mixin(UnwrappedHashmapStrategyMixin)
+            import_from_mixin(keys_mixin)
+            import_from_mixin(values_mixin)
+
+            erase, unerase = rerased.new_static_erasing_pair(
+                "%s-%s-hashmap-strategy" % (name, values_name))
+        if values_mixin is ObjectValuesMixin:
+            Strategy.__name__ = "%sHashmapStrategy" % name.capitalize()
+        else:
+            Strategy.__name__ = "%s%sValuesHashmapStrategy" % (
+                name.capitalize(), values_name.capitalize())
+        return Strategy
+    strategies = [make(ObjectValuesMixin, "object"),
+                  make(FixnumValuesMixin, "fixnum"),
+                  make(FlonumValuesMixin, "flonum")]
+    for strategy in strategies:
+        strategy.object_values = strategies[0].singleton
+        strategy.fixnum_values = strategies[1].singleton
+        strategy.flonum_values = strategies[2].singleton
+    return strategies[0]
 
 
 class EmptyHashmapStrategy(HashmapStrategy):
     erase, unerase = rerased.new_static_erasing_pair("object-hashmap-strategry")
 
+    def is_correct_type(self, w_obj):
+        return False
+
     def get(self, w_dict, w_key, env, cont):
         from pycket.interpreter import return_value
         return return_value(w_missing, env, cont) # contains nothing
 
     def set(self, w_dict, w_key, w_val, env, cont):
-        self.switch_to_correct_strategy(w_dict, w_key)
+        self.switch_to_correct_strategy(w_dict, w_key, w_val)
         return w_dict.hash_set(w_key, w_val, env, cont)
 
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        return return_value(values.w_void, env, cont)
+
     def items(self, w_dict):
         return []
 
@@ -275,52 +446,57 @@ class EmptyHashmapStrategy(HashmapStrategy):
         assert not vals
         return self.erase(None)
 
-    def switch_to_correct_strategy(self, w_dict, w_key):
-        if type(w_key) is values.W_Fixnum:
-            strategy = FixnumHashmapStrategy.singleton
-        elif type(w_key) is values.W_Symbol:
-            strategy = SymbolHashmapStrategy.singleton
-        elif isinstance(w_key, values_string.W_String):
-            strategy = StringHashmapStrategy.singleton
-        elif isinstance(w_key, values.W_Bytes):
-            strategy = ByteHashmapStrategy.singleton
+    def switch_to_correct_strategy(self, w_dict, w_key, w_val):
+        if config.strategies:
+            strategy = w_dict.strategy_for_key(w_key).for_values([w_val])
         else:
-            strategy = ObjectHashmapStrategy.singleton
+            strategy = w_dict.object_strategy()
         storage = strategy.create_storage([], [])
         w_dict.strategy = strategy
         w_dict.hstorage = storage
 
 
 class ObjectHashmapStrategy(HashmapStrategy):
+    """ the strategy of equal?-based tables for keys of any type """
     erase, unerase = rerased.new_static_erasing_pair("object-hashmap-strategry")
 
+    def is_correct_type(self, w_obj):
+        return True
+
     def get(self, w_dict, w_key, env, cont):
-        return equal_hash_ref_loop(self.unerase(w_dict.hstorage), 0, w_key, env, cont)
+        storage = self.unerase(w_dict.hstorage)
+        hashable, h = try_equal_hash(w_key)
+        positions = storage.positions(hashable, h)
+        return equal_hash_ref_loop(storage, positions, 0, w_key, env, cont)
 
     def set(self, w_dict, w_key, w_val, env, cont):
-        return equal_hash_set_loop(self.unerase(w_dict.hstorage), 0, w_key, w_val, env, cont)
+        storage = self.unerase(w_dict.hstorage)
+        hashable, h = try_equal_hash(w_key)
+        positions = storage.positions(hashable, h)
+        return equal_hash_set_loop(storage, positions, 0, w_key, w_val,
+                                   hashable, h, env, cont)
 
     def items(self, w_dict):
-        return self.unerase(w_dict.hstorage)
+        return self.unerase(w_dict.hstorage).entries
 
     def get_item(self, w_dict, i):
         try:
-            return self.unerase(w_dict.hstorage)[i]
+            return self.unerase(w_dict.hstorage).entries[i]
         except IndexError:
             raise
 
     def length(self, w_dict):
-        return len(self.unerase(w_dict.hstorage))
+        return len(self.unerase(w_dict.hstorage).entries)
 
     def create_storage(self, keys, vals):
-        return self.erase([(k, vals[i]) for i, k in enumerate(keys)])
-
-
-class FixnumHashmapStrategy(HashmapStrategy):
-    import_from_mixin(UnwrappedHashmapStrategyMixin)
+        storage = EqualHashStorage()
+        for i, k in enumerate(keys):
+            hashable, h = try_equal_hash(k)
+            storage.add(k, vals[i], hashable, h)
+        return self.erase(storage)
 
-    erase, unerase = rerased.new_static_erasing_pair("fixnum-hashmap-strategry")
 
+class FixnumKeysMixin(object):
     def is_correct_type(self, w_obj):
         return isinstance(w_obj, values.W_Fixnum)
 
@@ -332,12 +508,13 @@ class FixnumHashmapStrategy(HashmapStrategy):
         assert isinstance(w_val, values.W_Fixnum)
         return w_val.value
 
+    def _create_empty_dict(self):
+        return {}
 
-class SymbolHashmapStrategy(HashmapStrategy):
-    import_from_mixin(UnwrappedHashmapStrategyMixin)
+FixnumHashmapStrategy = make_unwrapped_strategies("fixnum", FixnumKeysMixin)
 
-    erase, unerase = rerased.new_static_erasing_pair("symbol-hashmap-strategry")
 
+class SymbolKeysMixin(object):
     def is_correct_type(self, w_obj):
         return isinstance(w_obj, values.W_Symbol)
 
@@ -349,6 +526,55 @@ class SymbolHashmapStrategy(HashmapStrategy):
         assert isinstance(w_val, values.W_Symbol)
         return w_val
 
+    def _create_empty_dict(self):
+        return {}
+
+SymbolHashmapStrategy = make_unwrapped_strategies("symbol", SymbolKeysMixin)
+
+
+NAN_KEY = float2longlong(rfloat.NAN)
+
+def flonum_key(v):
+    """ the bits of v, which identify it up to eqv?: 0.0 and -0.0 differ,
+    but all NaNs are the same """
+    if math.isnan(v):
+        return NAN_KEY
+    return float2longlong(v)
+
+class FlonumKeysMixin(object):
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Flonum)
+
+    def wrap(self, val):
+        return values.W_Flonum(longlong2float(val))
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Flonum)
+        return flonum_key(w_val.value)
+
+    def _create_empty_dict(self):
+        return {}
+
+FlonumHashmapStrategy = make_unwrapped_strategies("flonum", FlonumKeysMixin)
+
+
+class CharacterKeysMixin(object):
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Character)
+
+    def wrap(self, val):
+        assert isinstance(val, unicode)
+        return values.W_Character(val)
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Character)
+        return w_val.value
+
+    def _create_empty_dict(self):
+        return {}
+
+CharacterHashmapStrategy = make_unwrapped_strategies("character", CharacterKeysMixin)
+
 
 def hash_strings(w_b):
     assert isinstance(w_b, values_string.W_String)
@@ -360,11 +586,7 @@ def cmp_strings(w_a, w_b):
     return w_a.equal(w_b)
 
 
-class StringHashmapStrategy(HashmapStrategy):
-    import_from_mixin(UnwrappedHashmapStrategyMixin)
-
-    erase, unerase = rerased.new_static_erasing_pair("string-hashmap-strategry")
-
+class StringKeysMixin(object):
     def is_correct_type(self, w_obj):
         return isinstance(w_obj, values_string.W_String)
 
@@ -377,6 +599,8 @@ class StringHashmapStrategy(HashmapStrategy):
     def _create_empty_dict(self):
         return r_dict(cmp_strings, hash_strings)
 
+StringHashmapStrategy = make_unwrapped_strategies("string", StringKeysMixin)
+
 
 def hash_bytes(w_b):
     assert isinstance(w_b, values.W_Bytes)
@@ -385,13 +609,9 @@ def hash_bytes(w_b):
 def cmp_bytes(w_a, w_b):
     assert isinstance(w_a, values.W_Bytes)
     assert isinstance(w_b, values.W_Bytes)
-    return w_a.value == w_b.value
-
-class ByteHashmapStrategy(HashmapStrategy):
-    import_from_mixin(UnwrappedHashmapStrategyMixin)
-
-    erase, unerase = rerased.new_static_erasing_pair("byte-hashmap-strategry")
+    return w_a.as_str() == w_b.as_str()
 
+class ByteKeysMixin(object):
     def is_correct_type(self, w_obj):
         return isinstance(w_obj, values.W_Bytes)
 
@@ -405,34 +625,587 @@ class ByteHashmapStrategy(HashmapStrategy):
     def _create_empty_dict(self):
         return r_dict(cmp_bytes, hash_bytes)
 
+ByteHashmapStrategy = make_unwrapped_strategies("byte", ByteKeysMixin)
 
 
-class W_EqualHashTable(W_HashTable):
-    _attrs_ = ['strategy', 'hstorage']
-    def __init__(self, keys, vals):
-        self.strategy = _find_strategy_class(keys)
-        self.hstorage = self.strategy.create_storage(keys, vals)
+class SimpleObjectHashmapStrategyMixin(object):
+    # the strategy of eq?- and eqv?-based tables for keys of any type, the
+    # concrete class needs to implement: erase, unerase, _create_empty_dict
 
-    def hash_items(self):
-        return self.strategy.items(self)
+    def is_correct_type(self, w_obj):
+        return True
 
-    def hash_set(self, key, val, env, cont):
-        return self.strategy.set(self, key, val, env, cont)
+    def get(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        w_res = self.unerase(w_dict.hstorage).get(w_key, w_missing)
+        return return_value(w_res, env, cont)
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        from pycket.interpreter import return_value
+        self.unerase(w_dict.hstorage)[w_key] = w_val
+        return return_value(values.w_void, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        d = self.unerase(w_dict.hstorage)
+        if w_key in d:
+            del d[w_key]
+        return return_value(values.w_void, env, cont)
+
+    def items(self, w_dict):
+        return self.unerase(w_dict.hstorage).items()
+
+    def get_item(self, w_dict, i):
+        return get_dict_item(self.unerase(w_dict.hstorage), i)
+
+    def length(self, w_dict):
+        return len(self.unerase(w_dict.hstorage))
+
+    def create_storage(self, keys, vals):
+        d = self._create_empty_dict()
+        for i, w_key in enumerate(keys):
+            d[w_key] = vals[i]
+        return self.erase(d)
+
+class EqvObjectHashmapStrategy(HashmapStrategy):
+    import_from_mixin(SimpleObjectHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("eqv-object-hashmap-strategry")
+
+    def _create_empty_dict(self):
+        return r_dict(W_EqvHashTable.cmp_value, W_EqvHashTable.hash_value,
+                      force_non_null=True)
+
+class EqObjectHashmapStrategy(HashmapStrategy):
+    import_from_mixin(SimpleObjectHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("eq-object-hashmap-strategry")
+
+    def _create_empty_dict(self):
+        return r_dict(W_EqHashTable.cmp_value, W_EqHashTable.hash_value,
+                      force_non_null=True)
 
-    def hash_ref(self, key, env, cont):
-        return self.strategy.get(self, key, env, cont)
+
+class W_EqualHashTable(W_MutableHashTable):
+    _attrs_ = []
+
+    def object_strategy(self):
+        return ObjectHashmapStrategy.singleton
+
+    def strategy_for_key(self, w_key):
+        if isinstance(w_key, values_string.W_String):
+            return StringHashmapStrategy.singleton
+        if isinstance(w_key, values.W_Bytes):
+            return ByteHashmapStrategy.singleton
+        return W_MutableHashTable.strategy_for_key(self, w_key)
+
+
+
+# Immutable tables are persistent maps (see hamt.py): hash-set and hash-remove
+# make a new table that shares all but O(log n) of its nodes with the old one.
+
+class W_ImmutableHashTable(W_HashTable):
+    _attrs_ = ['items_cache']
+
+    def __init__(self):
+        self.items_cache = None
+
+    def immutable(self):
+        return True
+
+    def compute_items(self):
+        raise NotImplementedError("abstract method")
+
+    def hash_items(self):
+        # the positions of hash-iterate-next are indices into this list, which
+        # stays valid because the table never changes
+        items = self.items_cache
+        if items is None:
+            items = self.items_cache = self.compute_items()
+        return items
 
     def get_item(self, i):
-        return self.strategy.get_item(self, i)
+        try:
+            return self.hash_items()[i]
+        except IndexError:
+            raise
 
-    def length(self):
-        return self.strategy.length(self)
+    @label
+    def hash_set(self, k, v, env, cont):
+        raise SchemeException("hash-set!: contract violation\n"
+                              "  expected: (and/c hash? (not/c immutable?))")
+
+    @label
+    def hash_remove(self, k, env, cont):
+        raise SchemeException("hash-remove!: contract violation\n"
+                              "  expected: (and/c hash? (not/c immutable?))")
 
     def tostring(self):
         lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
         return "#hash(%s)" % " ".join(lst)
 
 
+class ImmutableSimpleHashTableMixin(object):
+    # the concrete class needs to implement:
+    # hash_value, make (a table of the same class with the given trie)
+
+    def hash_ref(self, k, env, cont):
+        from pycket.interpreter import return_value
+        w_res = self.trie.get(k, self.hash_value(k), w_missing)
+        return return_value(w_res, env, cont)
+
+    def hash_set_functional(self, k, v, env, cont):
+        from pycket.interpreter import return_value
+        trie = self.trie.assoc(k, self.hash_value(k), v)
+        return return_value(self.make(trie), env, cont)
+
+    def hash_remove_functional(self, k, env, cont):
+        from pycket.interpreter import return_value
+        trie = self.trie.without(k, self.hash_value(k))
+        if trie is self.trie:
+            return return_value(self, env, cont)
+        return return_value(self.make(trie), env, cont)
+
+    def compute_items(self):
+        return self.trie.items()
+
+    def length(self):
+        return self.trie.size
+
+
+EqMap = make_persistent_map("EqMap", W_EqHashTable.cmp_value)
+EqvMap = make_persistent_map("EqvMap", W_EqvHashTable.cmp_value)
+
+class W_ImmutableEqHashTable(W_ImmutableHashTable):
+    import_from_mixin(ImmutableSimpleHashTableMixin)
+    _attrs_ = _immutable_fields_ = ['trie']
+
+    hash_value = staticmethod(W_EqHashTable.hash_value)
+
+    def __init__(self, trie):
+        W_ImmutableHashTable.__init__(self)
+        self.trie = trie
+
+    @staticmethod
+    def from_lists(keys, vals):
+        assert len(keys) == len(vals)
+        trie = EqMap.EMPTY
+        for i, k in enumerate(keys):
+            trie = trie.assoc(k, W_EqHashTable.hash_value(k), vals[i])
+        return W_ImmutableEqHashTable(trie)
+
+    def make(self, trie):
+        return W_ImmutableEqHashTable(trie)
+
+class W_ImmutableEqvHashTable(W_ImmutableHashTable):
+    import_from_mixin(ImmutableSimpleHashTableMixin)
+    _attrs_ = _immutable_fields_ = ['trie']
+
+    hash_value = staticmethod(W_EqvHashTable.hash_value)
+
+    def __init__(self, trie):
+        W_ImmutableHashTable.__init__(self)
+        self.trie = trie
+
+    @staticmethod
+    def from_lists(keys, vals):
+        assert len(keys) == len(vals)
+        trie = EqvMap.EMPTY
+        for i, k in enumerate(keys):
+            trie = trie.assoc(k, W_EqvHashTable.hash_value(k), vals[i])
+        return W_ImmutableEqvHashTable(trie)
+
+    def make(self, trie):
+        return W_ImmutableEqvHashTable(trie)
+
+
+class ImmutableHashmapStrategy(object):
+    """ Strategies of W_ImmutableEqualHashTable. set and remove pass the new
+    table to cont. """
+    __metaclass__ = SingletonMeta
+
+    def get(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    def remove(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
+    def items(self, w_dict):
+        raise NotImplementedError("abstract base class")
+
+    def length(self, w_dict):
+        raise NotImplementedError("abstract base class")
+
+    def create_storage(self, keys, vals):
+        raise NotImplementedError("abstract base class")
+
+
+def _immutable_strategy_for_key(w_key):
+    if type(w_key) is values.W_Fixnum:
+        return ImmutableFixnumHashmapStrategy.singleton
+    if type(w_key) is values.W_Symbol:
+        return ImmutableSymbolHashmapStrategy.singleton
+    if isinstance(w_key, values_string.W_String):
+        return ImmutableStringHashmapStrategy.singleton
+    return ImmutableObjectHashmapStrategy.singleton
+
+def _find_immutable_strategy_class(keys):
+    if not config.strategies:
+        return ImmutableObjectHashmapStrategy.singleton
+    if len(keys) == 0:
+        return ImmutableEmptyHashmapStrategy.singleton
+    strategy = _immutable_strategy_for_key(keys[0])
+    for elem in keys:
+        if _immutable_strategy_for_key(elem) is not strategy:
+            return ImmutableObjectHashmapStrategy.singleton
+    return strategy
+
+class UnwrappedImmutableHashmapStrategyMixin(object):
+    # the concrete class needs to implement:
+    # erase, unerase, is_correct_type, wrap, unwrap, hash, Trie
+    #
+    # a key of another type is never equal? to the keys of the table, so only
+    # adding one needs to switch to the object strategy
+
+    def get(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        if self.is_correct_type(w_key):
+            key = self.unwrap(w_key)
+            w_res = self.unerase(w_dict.hstorage).get(key, self.hash(key), w_missing)
+            return return_value(w_res, env, cont)
+        return return_value(w_missing, env, cont)
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        from pycket.interpreter import return_value
+        if self.is_correct_type(w_key):
+            key = self.unwrap(w_key)
+            trie = self.unerase(w_dict.hstorage).assoc(key, self.hash(key), w_val)
+            w_res = W_ImmutableEqualHashTable(self, self.erase(trie))
+            return return_value(w_res, env, cont)
+        w_obj_dict = self.as_object_table(w_dict)
+        return w_obj_dict.strategy.set(w_obj_dict, w_key, w_val, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        if not self.is_correct_type(w_key):
+            return return_value(w_dict, env, cont)
+        key = self.unwrap(w_key)
+        trie = self.unerase(w_dict.hstorage)
+        new_trie = trie.without(key, self.hash(key))
+        if new_trie is trie:
+            return return_value(w_dict, env, cont)
+        w_res = W_ImmutableEqualHashTable(self, self.erase(new_trie))
+        return return_value(w_res, env, cont)
+
+    def items(self, w_dict):
+        return [(self.wrap(key), w_val) for key, w_val in self.unerase(w_dict.hstorage).items()]
+
+    def length(self, w_dict):
+        return self.unerase(w_dict.hstorage).size
+
+    def create_storage(self, keys, vals):
+        trie = self.Trie.EMPTY
+        for i, w_key in enumerate(keys):
+            key = self.unwrap(w_key)
+            trie = trie.assoc(key, self.hash(key), vals[i])
+        return self.erase(trie)
+
+    def as_object_table(self, w_dict):
+        items = self.items(w_dict)
+        strategy = ImmutableObjectHashmapStrategy.singleton
+        storage = strategy.create_storage([k for k, _ in items],
+                                          [v for _, v in items])
+        return W_ImmutableEqualHashTable(strategy, storage)
+
+
+class ImmutableEmptyHashmapStrategy(ImmutableHashmapStrategy):
+    erase, unerase = rerased.new_static_erasing_pair("immutable-empty-hashmap-strategy")
+
+    def get(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        return return_value(w_missing, env, cont)
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        from pycket.interpreter import return_value
+        strategy = _immutable_strategy_for_key(w_key)
+        storage = strategy.create_storage([w_key], [w_val])
+        return return_value(W_ImmutableEqualHashTable(strategy, storage), env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        return return_value(w_dict, env, cont)
+
+    def items(self, w_dict):
+        return []
+
+    def length(self, w_dict):
+        return 0
+
+    def create_storage(self, keys, vals):
+        assert not keys
+        assert not vals
+        return self.erase(None)
+
+
+def eq_identity(a, b):
+    return a is b
+
+ObjectMap = make_persistent_map("ObjectMap", eq_identity)
+
+class ImmutableEqualStorage(object):
+    """ Storage of the ImmutableObjectHashmapStrategy. The keys that have an
+    equal-hash-code are in a trie that compares them by identity: the key
+    equal? to the one looked up is found among the keys with the same hash
+    code first. As in EqualHashStorage, the keys without a hash code are
+    kept apart in unhashable, which is copied on every update. """
+    _immutable_fields_ = ['trie', 'unhashable[*]']
+
+    def __init__(self, trie, unhashable):
+        self.trie = trie
+        self.unhashable = unhashable
+
+    def candidates(self, hashable, h):
+        """ the leaves that can be equal? to a key with the given hash code,
+        the ones of the trie first """
+        if hashable:
+            result = self.trie.leaves_with_hash(h)
+        else:
+            result = self.trie.leaves()
+        return result + self.unhashable
+
+    def length(self):
+        return self.trie.size + len(self.unhashable)
+
+@loop_label
+def immutable_equal_find_loop(candidates, idx, key, env, cont):
+    """ pass the index of the first candidate equal? to key to cont, -1 if
+    there is none """
+    from pycket.interpreter import return_value
+    from pycket.prims.equal import equal_func, EqualInfo
+    if idx >= len(candidates):
+        return return_value(values.W_Fixnum(-1), env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    return equal_func(candidates[idx].key, key, info, env,
+            immutable_equal_find_cont(candidates, idx, key, env, cont))
+
+@continuation
+def immutable_equal_find_cont(candidates, idx, key, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    val = check_one_val(_vals)
+    if val is not values.w_false:
+        return return_value(values.W_Fixnum(idx), env, cont)
+    return immutable_equal_find_loop(candidates, idx + 1, key, env, cont)
+
+@continuation
+def immutable_equal_ref_cont(candidates, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    idx = check_one_val(_vals)
+    assert isinstance(idx, values.W_Fixnum)
+    if idx.value < 0:
+        return return_value(w_missing, env, cont)
+    return return_value(candidates[idx.value].val, env, cont)
+
+@continuation
+def immutable_equal_set_cont(storage, candidates, key, val, hashable, h, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    idx = check_one_val(_vals)
+    assert isinstance(idx, values.W_Fixnum)
+    num_trie = len(candidates) - len(storage.unhashable)
+    trie = storage.trie
+    unhashable = storage.unhashable
+    if idx.value < 0:
+        if hashable:
+            trie = trie.assoc(key, h, val)
+        else:
+            unhashable = unhashable + [ObjectMap.Leaf(key, 0, val)]
+    elif idx.value < num_trie:
+        # keeps the key that is already in the table
+        leaf = candidates[idx.value]
+        trie = trie.assoc(leaf.key, leaf.hash, val)
+    else:
+        i = idx.value - num_trie
+        unhashable = unhashable[:]
+        unhashable[i] = ObjectMap.Leaf(unhashable[i].key, 0, val)
+    strategy = ImmutableObjectHashmapStrategy.singleton
+    storage = strategy.erase(ImmutableEqualStorage(trie, unhashable))
+    return return_value(W_ImmutableEqualHashTable(strategy, storage), env, cont)
+
+@continuation
+def immutable_equal_remove_cont(w_dict, storage, candidates, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    idx = check_one_val(_vals)
+    assert isinstance(idx, values.W_Fixnum)
+    if idx.value < 0:
+        return return_value(w_dict, env, cont)
+    num_trie = len(candidates) - len(storage.unhashable)
+    trie = storage.trie
+    unhashable = storage.unhashable
+    if idx.value < num_trie:
+        leaf = candidates[idx.value]
+        trie = trie.without(leaf.key, leaf.hash)
+    else:
+        i = idx.value - num_trie
+        unhashable = unhashable[:i] + unhashable[i + 1:]
+    strategy = ImmutableObjectHashmapStrategy.singleton
+    storage = strategy.erase(ImmutableEqualStorage(trie, unhashable))
+    return return_value(W_ImmutableEqualHashTable(strategy, storage), env, cont)
+
+
+class ImmutableObjectHashmapStrategy(ImmutableHashmapStrategy):
+    erase, unerase = rerased.new_static_erasing_pair("immutable-object-hashmap-strategy")
+
+    def get(self, w_dict, w_key, env, cont):
+        storage = self.unerase(w_dict.hstorage)
+        hashable, h = try_equal_hash(w_key)
+        candidates = storage.candidates(hashable, h)
+        return immutable_equal_find_loop(candidates, 0, w_key, env,
+                immutable_equal_ref_cont(candidates, env, cont))
+
+    def set(self, w_dict, w_key, w_val, env, cont):
+        storage = self.unerase(w_dict.hstorage)
+        hashable, h = try_equal_hash(w_key)
+        candidates = storage.candidates(hashable, h)
+        return immutable_equal_find_loop(candidates, 0, w_key, env,
+                immutable_equal_set_cont(storage, candidates, w_key, w_val,
+                                         hashable, h, env, cont))
+
+    def remove(self, w_dict, w_key, env, cont):
+        storage = self.unerase(w_dict.hstorage)
+        hashable, h = try_equal_hash(w_key)
+        candidates = storage.candidates(hashable, h)
+        return immutable_equal_find_loop(candidates, 0, w_key, env,
+                immutable_equal_remove_cont(w_dict, storage, candidates, env, cont))
+
+    def items(self, w_dict):
+        storage = self.unerase(w_dict.hstorage)
+        return [(leaf.key, leaf.val) for leaf in storage.trie.leaves() + storage.unhashable]
+
+    def length(self, w_dict):
+        return self.unerase(w_dict.hstorage).length()
+
+    def create_storage(self, keys, vals):
+        # the keys are only compared by identity here, equal? duplicates have
+        # to be avoided by the caller (or use set)
+        trie = ObjectMap.EMPTY
+        unhashable = []
+        for i, k in enumerate(keys):
+            hashable, h = try_equal_hash(k)
+            if hashable:
+                trie = trie.assoc(k, h, vals[i])
+            else:
+                unhashable.append(ObjectMap.Leaf(k, 0, vals[i]))
+        return self.erase(ImmutableEqualStorage(trie, unhashable))
+
+
+def hash_fixnum(n):
+    return n
+
+def cmp_fixnums(a, b):
+    return a == b
+
+FixnumMap = make_persistent_map("FixnumMap", cmp_fixnums)
+
+class ImmutableFixnumHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(UnwrappedImmutableHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("immutable-fixnum-hashmap-strategy")
+    Trie = FixnumMap
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Fixnum)
+
+    def wrap(self, val):
+        assert isinstance(val, int)
+        return values.W_Fixnum(val)
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Fixnum)
+        return w_val.value
+
+    def hash(self, val):
+        return hash_fixnum(val)
+
+
+def hash_symbol(w_sym):
+    return compute_hash(w_sym)
+
+SymbolMap = make_persistent_map("SymbolMap", eq_identity)
+
+class ImmutableSymbolHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(UnwrappedImmutableHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("immutable-symbol-hashmap-strategy")
+    Trie = SymbolMap
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Symbol)
+
+    def wrap(self, val):
+        assert isinstance(val, values.W_Symbol)
+        return val
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Symbol)
+        return w_val
+
+    def hash(self, val):
+        return hash_symbol(val)
+
+
+StringMap = make_persistent_map("StringMap", cmp_strings)
+
+class ImmutableStringHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(UnwrappedImmutableHashmapStrategyMixin)
+
+    erase, unerase = rerased.new_static_erasing_pair("immutable-string-hashmap-strategy")
+    Trie = StringMap
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values_string.W_String)
+
+    def wrap(self, w_val):
+        return w_val
+
+    def unwrap(self, w_val):
+        return w_val
+
+    def hash(self, w_val):
+        return hash_strings(w_val)
+
+
+class W_ImmutableEqualHashTable(W_ImmutableHashTable):
+    _attrs_ = _immutable_fields_ = ['strategy', 'hstorage']
+
+    def __init__(self, strategy, hstorage):
+        W_ImmutableHashTable.__init__(self)
+        self.strategy = strategy
+        self.hstorage = hstorage
+
+    @staticmethod
+    def from_lists(keys, vals):
+        """ keys must not contain keys that are equal? but not identical """
+        assert len(keys) == len(vals)
+        strategy = _find_immutable_strategy_class(keys)
+        return W_ImmutableEqualHashTable(strategy, strategy.create_storage(keys, vals))
+
+    def hash_ref(self, key, env, cont):
+        return self.strategy.get(self, key, env, cont)
+
+    def hash_set_functional(self, key, val, env, cont):
+        return self.strategy.set(self, key, val, env, cont)
+
+    def hash_remove_functional(self, key, env, cont):
+        return self.strategy.remove(self, key, env, cont)
+
+    def compute_items(self):
+        return self.strategy.items(self)
+
+    def length(self):
+        return self.strategy.length(self)
+
 
 def get_dict_item(d, i):
     """ return item of dict d at position i. Raises a KeyError if the index
@@ -5,6 +5,7 @@ from pycket import regexp
 
 from rpython.rlib.rsre import rsre_core, rsre_char
 from rpython.rlib import buffer, jit
+from rpython.rlib.objectmodel import compute_hash
 
 CACHE = regexp.RegexpCache()
 
@@ -81,6 +82,9 @@ class W_AnyRegexp(W_Object):
             return self.source == other.source
         return False
 
+    def hash_equal(self):
+        return compute_hash(self.source)
+
 
 @rsre_core.specializectx
 @jit.unroll_safe
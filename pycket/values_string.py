@@ -3,7 +3,7 @@ from pycket.error import SchemeException
 from pycket import config
 
 from rpython.rlib import rerased, jit
-from rpython.rlib.objectmodel import compute_hash, we_are_translated
+from rpython.rlib.objectmodel import compute_hash, we_are_translated, specialize
 from rpython.rlib.unicodedata import unicodedb_6_2_0 as unicodedb
 from rpython.rlib.rstring     import StringBuilder, UnicodeBuilder
 
@@ -56,6 +56,36 @@ class W_String(W_Object):
             cls = W_MutableString
         return cls(strategy, storage)
 
+    @staticmethod
+    @jit.unroll_safe
+    def concat(strings):
+        """ a mutable string with the contents of strings appended, which is
+        a rope if it gets long enough (see RopeStringStrategy) """
+        length = 0
+        for w_str in strings:
+            length += w_str.length()
+        if config.strategies and length >= ROPE_MIN_LENGTH:
+            node = rope_node(strings[0])
+            for i in range(1, len(strings)):
+                node = RopeConcat(node, rope_node(strings[i]))
+            strategy = RopeStringStrategy.singleton
+            return W_MutableString(strategy, strategy.erase(node))
+        builder = StringBuilder()
+        unibuilder = None
+        for w_str in strings:
+            if unibuilder is None:
+                try:
+                    builder.append(w_str.as_str_ascii())
+                    continue
+                except ValueError:
+                    unibuilder = UnicodeBuilder()
+                    unibuilder.append(unicode(builder.build()))
+            unibuilder.append(w_str.as_unicode())
+        if unibuilder is None:
+            return W_String.fromascii(builder.build())
+        else:
+            return W_String.fromunicode(unibuilder.build())
+
     cache = {}
     @staticmethod
     def make(val):
@@ -323,6 +353,18 @@ class StringStrategy(object):
         raise NotImplementedError("abstract base class")
 
 
+@specialize.argtype(0, 1)
+def chars_eq(s, chars):
+    """ compare the characters of an immutable string to the list of
+    characters of a mutable one without joining the list """
+    if len(s) != len(chars):
+        return False
+    for i in range(len(s)):
+        if s[i] != chars[i]:
+            return False
+    return True
+
+
 class ImmutableStringStrategy(StringStrategy):
     def as_charlist_ascii(self, w_str):
         return list(self.as_str_ascii(w_str))
@@ -396,6 +438,9 @@ class AsciiStringStrategy(ImmutableStringStrategy):
     def eq(self, w_str, w_other):
         if w_other.get_strategy() is self:
             return self.unerase(w_str.get_storage()) == self.unerase(w_other.get_storage())
+        if w_other.get_strategy() is AsciiMutableStringStrategy.singleton:
+            return chars_eq(self.unerase(w_str.get_storage()),
+                            AsciiMutableStringStrategy.unerase(w_other.get_storage()))
         return ImmutableStringStrategy.eq(self, w_str, w_other)
 
     def hash(self, w_str):
@@ -441,8 +486,15 @@ class AsciiMutableStringStrategy(MutableStringStrategy):
     def eq(self, w_str, w_other):
         if w_other.get_strategy() is self:
             return self.unerase(w_str.get_storage()) == self.unerase(w_other.get_storage())
+        if w_other.get_strategy() is AsciiStringStrategy.singleton:
+            return chars_eq(AsciiStringStrategy.unerase(w_other.get_storage()),
+                            self.unerase(w_str.get_storage()))
         return MutableStringStrategy.eq(self, w_str, w_other)
 
+    def hash(self, w_str):
+        # the same as for the immutable string
+        return compute_hash(self.as_str_ascii(w_str))
+
 
     # mutation operations
 
@@ -505,6 +557,9 @@ class UnicodeStringStrategy(ImmutableStringStrategy):
     def eq(self, w_str, w_other):
         if w_other.get_strategy() is self:
             return self.unerase(w_str.get_storage()) == self.unerase(w_other.get_storage())
+        if w_other.get_strategy() is UnicodeMutableStringStrategy.singleton:
+            return chars_eq(self.unerase(w_str.get_storage()),
+                            UnicodeMutableStringStrategy.unerase(w_other.get_storage()))
         return ImmutableStringStrategy.eq(self, w_str, w_other)
 
     def upper(self, w_str):
@@ -556,6 +611,9 @@ class UnicodeMutableStringStrategy(MutableStringStrategy):
     def eq(self, w_str, w_other):
         if w_other.get_strategy() is self:
             return self.unerase(w_str.get_storage()) == self.unerase(w_other.get_storage())
+        if w_other.get_strategy() is UnicodeStringStrategy.singleton:
+            return chars_eq(UnicodeStringStrategy.unerase(w_other.get_storage()),
+                            self.unerase(w_str.get_storage()))
         return MutableStringStrategy.eq(self, w_str, w_other)
 
 
@@ -587,3 +645,177 @@ class UnicodeMutableStringStrategy(MutableStringStrategy):
             builder.append(unichr(unicodedb.tolower(ord(ch))))
         return W_MutableString(self, self.erase(list(builder.build())))
 
+
+# Appending to a long string in a loop would copy it every time. Instead,
+# string-append makes a rope: a tree whose leaves are the appended pieces. It
+# is flattened into an ordinary strategy the first time the string is used
+# for anything but its length or for appending it again.
+
+# shorter results of string-append are copied right away
+ROPE_MIN_LENGTH = 128
+
+class RopeNode(object):
+    _attrs_ = _immutable_fields_ = ['length', 'ascii']
+    _settled_ = True
+
+class RopeAsciiLeaf(RopeNode):
+    _attrs_ = _immutable_fields_ = ['value']
+
+    def __init__(self, value):
+        self.length = len(value)
+        self.ascii = True
+        self.value = value
+
+class RopeUnicodeLeaf(RopeNode):
+    _attrs_ = _immutable_fields_ = ['value']
+
+    def __init__(self, value):
+        self.length = len(value)
+        self.ascii = False
+        self.value = value
+
+class RopeConcat(RopeNode):
+    _attrs_ = _immutable_fields_ = ['left', 'right']
+
+    def __init__(self, left, right):
+        self.length = left.length + right.length
+        self.ascii = left.ascii and right.ascii
+        self.left = left
+        self.right = right
+
+def rope_node(w_str):
+    """ the contents of w_str as a rope. The nodes are immutable, so the rope
+    of a string that is a rope already can be shared. """
+    strategy = w_str.get_strategy()
+    if strategy is RopeStringStrategy.singleton:
+        return RopeStringStrategy.singleton.unerase(w_str.get_storage())
+    try:
+        return RopeAsciiLeaf(w_str.as_str_ascii())
+    except ValueError:
+        return RopeUnicodeLeaf(w_str.as_unicode())
+
+def rope_leaves(node):
+    """ the leaves of the rope from left to right, without recursion since
+    appending in a loop makes very deep trees """
+    result = []
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, RopeConcat):
+            todo.append(node.right)
+            todo.append(node.left)
+        else:
+            result.append(node)
+    return result
+
+class RopeStringStrategy(StringStrategy):
+    """ Strategy of mutable strings whose storage is a RopeNode. Everything
+    but length flattens the string first and is then done by the strategy
+    of the flat string. """
+    erase, unerase = rerased.new_static_erasing_pair("rope-string-strategy")
+
+    def flatten(self, w_str):
+        if w_str.get_strategy() is not self:
+            return
+        node = self.unerase(w_str.get_storage())
+        leaves = rope_leaves(node)
+        if node.ascii:
+            builder = StringBuilder(node.length)
+            for leaf in leaves:
+                assert isinstance(leaf, RopeAsciiLeaf)
+                builder.append(leaf.value)
+            strategy = AsciiStringStrategy.singleton
+            storage = strategy.erase(builder.build())
+        else:
+            unibuilder = UnicodeBuilder(node.length)
+            for leaf in leaves:
+                if isinstance(leaf, RopeAsciiLeaf):
+                    unibuilder.append(unicode(leaf.value))
+                else:
+                    assert isinstance(leaf, RopeUnicodeLeaf)
+                    unibuilder.append(leaf.value)
+            strategy = UnicodeStringStrategy.singleton
+            storage = strategy.erase(unibuilder.build())
+        w_str.change_strategy(strategy, storage)
+
+    def make_mutable(self, w_str):
+        self.flatten(w_str)
+        w_str.get_strategy().make_mutable(w_str)
+
+    def as_str_ascii(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_str_ascii()
+
+    def as_str_utf8(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_str_utf8()
+
+    def as_unicode(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_unicode()
+
+    def as_charlist_ascii(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_charlist_ascii()
+
+    def as_charlist_utf8(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_charlist_utf8()
+
+    def as_unicharlist(self, w_str):
+        self.flatten(w_str)
+        return w_str.as_unicharlist()
+
+
+    # string operations
+
+    def length(self, w_str):
+        if w_str.get_strategy() is not self:
+            return w_str.length()
+        return self.unerase(w_str.get_storage()).length
+
+    def getitem(self, w_str, index):
+        self.flatten(w_str)
+        return w_str.getitem(index)
+
+    def getslice(self, w_str, start, stop):
+        self.flatten(w_str)
+        return w_str.getslice(start, stop)
+
+    def eq(self, w_str, w_other):
+        self.flatten(w_str)
+        self.flatten(w_other)
+        return w_str.equal(w_other)
+
+    def cmp(self, w_str, w_other):
+        self.flatten(w_str)
+        self.flatten(w_other)
+        return w_str.cmp(w_other)
+
+    def cmp_case_insensitive(self, w_str, w_other):
+        self.flatten(w_str)
+        self.flatten(w_other)
+        return w_str.cmp_case_insensitive(w_other)
+
+    def hash(self, w_str):
+        self.flatten(w_str)
+        return w_str.hash_equal()
+
+    def upper(self, w_str):
+        self.flatten(w_str)
+        return w_str.upper()
+
+    def lower(self, w_str):
+        self.flatten(w_str)
+        return w_str.lower()
+
+
+    # mutation operations
+
+    def setitem(self, w_str, index, unichar):
+        self.flatten(w_str)
+        return w_str.setitem(index, unichar)
+
+    def setslice(self, w_str, index, w_from, fromstart, fromend):
+        self.flatten(w_str)
+        return w_str.setslice(index, w_from, fromstart, fromend)
@@ -1,10 +1,12 @@
 
 from pycket.values import W_MVector, W_VectorSuper, W_Fixnum, W_Flonum, W_Character, UNROLLING_CUTOFF
+from pycket.values import flonum_eqv
 from pycket.base import W_Object, SingletonMeta
 from pycket import config
 
 from rpython.rlib import rerased
-from rpython.rlib.objectmodel import newlist_hint, import_from_mixin
+from rpython.rlib.listsort import make_timsort_class
+from rpython.rlib.objectmodel import newlist_hint, import_from_mixin, compute_hash
 from rpython.rlib import debug, jit
 
 
@@ -74,6 +76,11 @@ class StrategyVectorMixin(object):
         self.set_strategy(new_strategy)
         self.set_storage(new_strategy.create_storage_for_elements(old_list))
 
+    def same_storage(self, other):
+        """ whether the elements of other are stored like those of self """
+        return (self.get_strategy().mutable_strategy() is
+                other.get_strategy().mutable_strategy())
+
 
 class W_Vector(W_MVector):
     _immutable_fields_ = ["len"]
@@ -112,6 +119,18 @@ class W_Vector(W_MVector):
     def length(self):
         return self.len
 
+    def fill(self, w_val):
+        strategy = _find_strategy_class([w_val], False)
+        self.set_strategy(strategy)
+        self.set_storage(strategy.create_storage_for_element(w_val, self.len))
+
+    def copy_range(self, start, end):
+        """ a new mutable vector of the elements start to end """
+        assert 0 <= start <= end <= self.len
+        strategy = self.strategy.mutable_strategy()
+        storage = strategy.slice_storage(self, start, end)
+        return W_Vector(strategy, storage, end - start)
+
     def tostring(self):
         l = self.strategy.ref_all(self)
         return "#(%s)" % " ".join([obj.tostring() for obj in l])
@@ -167,17 +186,13 @@ class W_FlVector(W_VectorSuper):
         return "(flvector %s)" % " ".join([obj.tostring() for obj in l])
 
     def equal(self, other):
-        # XXX could be optimized more
         if not isinstance(other, W_FlVector):
             return False
         if self is other:
             return True
         if self.length() != other.length():
             return False
-        for i in range(self.length()):
-            if not self.ref(i).equal(other.ref(i)):
-                return False
-        return True
+        return self.get_strategy().equal_storage(self, other)
 
 class VectorStrategy(object):
     """ works for any W_VectorSuper that has
@@ -222,6 +237,36 @@ class VectorStrategy(object):
     def create_storage_for_elements(self, elements):
         raise NotImplementedError("abstract base class")
 
+    def mutable_strategy(self):
+        """ the mutable strategy with the same kind of storage """
+        raise NotImplementedError("abstract base class")
+
+    # the vectors passed to these have storage like this strategy, see
+    # W_VectorSuper.same_storage
+    def copy_storage(self, w_dest, dest_start, w_src, src_start, src_end):
+        raise NotImplementedError("abstract base class")
+    def slice_storage(self, w_vector, start, end):
+        raise NotImplementedError("abstract base class")
+    def append_storage(self, vectors_w, length):
+        raise NotImplementedError("abstract base class")
+
+    def sort_range(self, w_vector, start, end, descending):
+        """ sort the elements start to end with < or >, only for numbers """
+        raise NotImplementedError("abstract base class")
+
+    # the elements of unboxed vectors are atoms that equal? compares by
+    # value, they are compared and hashed without boxing them
+    unboxed = False
+
+    def equal_storage(self, w_vector, w_other):
+        """ equal? of the elements, w_other has the same length and storage
+        like this strategy, only for unboxed strategies """
+        raise NotImplementedError("abstract base class")
+
+    def hash_item(self, w_vector, i):
+        """ the equal-hash-code of element i, only for unboxed strategies """
+        raise NotImplementedError("abstract base class")
+
 
     def dehomogenize(self, w_vector):
         w_vector.change_strategy(ObjectVectorStrategy.singleton)
@@ -266,6 +311,40 @@ class UnwrappedVectorStrategyMixin(object):
         e = self.unwrap(element)
         return self.erase([e] * times)
 
+    def copy_storage(self, w_dest, dest_start, w_src, src_start, src_end):
+        # the storage can't be resized, so this can't be a slice assignment
+        dest = self._storage(w_dest)
+        src = self._storage(w_src)
+        length = src_end - src_start
+        if dest is src and src_start < dest_start:
+            i = length - 1
+            while i >= 0:
+                dest[dest_start + i] = src[src_start + i]
+                i -= 1
+        else:
+            for i in range(length):
+                dest[dest_start + i] = src[src_start + i]
+
+    def slice_storage(self, w_vector, start, end):
+        assert 0 <= start <= end
+        return self.erase(self._storage(w_vector)[start:end])
+
+    def append_storage(self, vectors_w, length):
+        result = None
+        pos = 0
+        for w_vector in vectors_w:
+            storage = self._storage(w_vector)
+            if not storage:
+                continue
+            if result is None:
+                result = [storage[0]] * length
+            for i in range(len(storage)):
+                result[pos + i] = storage[i]
+            pos += len(storage)
+        if result is None:
+            return self.erase([])
+        return self.erase(result)
+
     @jit.look_inside_iff(
         lambda self, elements_w:
             jit.loop_unrolling_heuristic(
@@ -282,6 +361,9 @@ class UnwrappedVectorStrategyMixin(object):
 class ObjectVectorStrategy(VectorStrategy):
     import_from_mixin(UnwrappedVectorStrategyMixin)
 
+    def mutable_strategy(self):
+        return ObjectVectorStrategy.singleton
+
     erase, unerase = rerased.new_erasing_pair("object-vector-strategry")
     erase = staticmethod(erase)
     unerase = staticmethod(unerase)
@@ -308,6 +390,9 @@ class ObjectImmutableVectorStrategy(ObjectVectorStrategy):
 class FixnumVectorStrategy(VectorStrategy):
     import_from_mixin(UnwrappedVectorStrategyMixin)
 
+    def mutable_strategy(self):
+        return FixnumVectorStrategy.singleton
+
     erase, unerase = rerased.new_erasing_pair("fixnum-vector-strategy")
     erase = staticmethod(erase)
     unerase = staticmethod(unerase)
@@ -323,12 +408,31 @@ class FixnumVectorStrategy(VectorStrategy):
         assert isinstance(w_val, W_Fixnum)
         return w_val.value
 
+    unboxed = True
+
+    def equal_storage(self, w_vector, w_other):
+        return self._storage(w_vector) == self._storage(w_other)
+
+    def hash_item(self, w_vector, i):
+        return self._storage(w_vector)[i]
+
+    def sort_range(self, w_vector, start, end, descending):
+        assert 0 <= start <= end
+        storage = self._storage(w_vector)
+        items = storage[start:end]
+        sort_ints(items, descending)
+        for i in range(len(items)):
+            storage[start + i] = items[i]
+
 class FixnumImmutableVectorStrategy(FixnumVectorStrategy):
     import_from_mixin(ImmutableVectorStrategyMixin)
 
 class CharacterVectorStrategy(VectorStrategy):
     import_from_mixin(UnwrappedVectorStrategyMixin)
 
+    def mutable_strategy(self):
+        return CharacterVectorStrategy.singleton
+
     erase, unerase = rerased.new_erasing_pair("character-vector-strategy")
     erase = staticmethod(erase)
     unerase = staticmethod(unerase)
@@ -337,19 +441,30 @@ class CharacterVectorStrategy(VectorStrategy):
         return isinstance(w_obj, W_Character)
 
     def wrap(self, val):
-        assert isinstance(val, str) and len(val) == 1
+        assert isinstance(val, unicode) and len(val) == 1
         return W_Character(val)
 
     def unwrap(self, w_val):
         assert isinstance(w_val, W_Character)
         return w_val.value
 
+    unboxed = True
+
+    def equal_storage(self, w_vector, w_other):
+        return self._storage(w_vector) == self._storage(w_other)
+
+    def hash_item(self, w_vector, i):
+        return ord(self._storage(w_vector)[i])
+
 class CharacterImmutableVectorStrategy(CharacterVectorStrategy):
     import_from_mixin(ImmutableVectorStrategyMixin)
 
 class FlonumVectorStrategy(VectorStrategy):
     import_from_mixin(UnwrappedVectorStrategyMixin)
 
+    def mutable_strategy(self):
+        return FlonumVectorStrategy.singleton
+
     erase, unerase = rerased.new_erasing_pair("flonum-vector-strategry")
     erase = staticmethod(erase)
     unerase = staticmethod(unerase)
@@ -365,6 +480,53 @@ class FlonumVectorStrategy(VectorStrategy):
         assert isinstance(w_val, W_Flonum)
         return w_val.value
 
+    unboxed = True
+
+    def equal_storage(self, w_vector, w_other):
+        # like eqv?, not ==, for NaNs and -0.0
+        storage = self._storage(w_vector)
+        other = self._storage(w_other)
+        for i in range(len(storage)):
+            if not flonum_eqv(storage[i], other[i]):
+                return False
+        return True
+
+    def hash_item(self, w_vector, i):
+        return compute_hash(self._storage(w_vector)[i])
+
+    def sort_range(self, w_vector, start, end, descending):
+        assert 0 <= start <= end
+        storage = self._storage(w_vector)
+        items = storage[start:end]
+        sort_floats(items, descending)
+        for i in range(len(items)):
+            storage[start + i] = items[i]
+
 
 class FlonumImmutableVectorStrategy(FlonumVectorStrategy):
     import_from_mixin(ImmutableVectorStrategyMixin)
+
+# The sorts are stable, equal elements are never swapped
+
+def _int_greater(a, b):
+    return a > b
+
+def _float_greater(a, b):
+    return a > b
+
+IntSorter = make_timsort_class()
+IntDescendingSorter = make_timsort_class(lt=_int_greater)
+FloatSorter = make_timsort_class()
+FloatDescendingSorter = make_timsort_class(lt=_float_greater)
+
+def sort_ints(items, descending):
+    if descending:
+        IntDescendingSorter(items).sort()
+    else:
+        IntSorter(items).sort()
+
+def sort_floats(items, descending):
+    if descending:
+        FloatDescendingSorter(items).sort()
+    else:
+        FloatSorter(items).sort()
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Remember which lambdas turned out to be recursive and which ASTs became JIT
+# entry points, so that the next run of the same program can arm them right
+# away instead of rediscovering them during warm-up (--warmup-profile <file>).
+#
+# The profile is a text file with a line per lambda
+#
+#   <in_cycle> <srcpos> <index>,<index>,... <srcfile>
+#
+# where the indices are the positions (see body_nodes) of the ASTs of the
+# lambda body that had should_enter set.
+#
+import os
+
+from rpython.rlib import streamio
+from rpython.rlib.rarithmetic import string_to_int
+from rpython.rlib.rstring import ParseStringError, ParseStringOverflowError
+
+class WarmupEntry(object):
+    def __init__(self):
+        self.in_cycle = False
+        self.indices = {}
+
+class WarmupProfile(object):
+    def __init__(self):
+        self.entries = {}
+
+    def load(self, fname):
+        """ Read the profile written by a previous run, if there is one. Lines
+        that do not parse are ignored, the profile is only a hint. """
+        if not os.access(fname, os.R_OK):
+            return
+        f = streamio.open_file_as_stream(fname)
+        data = f.readall()
+        f.close()
+        for line in data.split("\n"):
+            fields = line.split(" ", 3)
+            if len(fields) != 4:
+                continue
+            entry = WarmupEntry()
+            entry.in_cycle = fields[0] == "1"
+            try:
+                srcpos = string_to_int(fields[1])
+                if fields[2]:
+                    for index in fields[2].split(","):
+                        entry.indices[string_to_int(index)] = None
+            except (ParseStringError, ParseStringOverflowError):
+                continue
+            self.entries[lambda_key(fields[3], srcpos)] = entry
+
+    def dump(self, fname, modules):
+        """ Write the profile, adding what the lambdas of modules learned in
+        this run to the entries of the previous runs. """
+        for module in modules:
+            for lam in module_lambdas(module):
+                self.record(lam)
+        lines = []
+        for key, entry in self.entries.iteritems():
+            indices = [str(index) for index in entry.indices]
+            colon = key.rfind(":")
+            assert colon >= 0
+            lines.append("%s %s %s %s\n" % ("1" if entry.in_cycle else "0",
+                                            key[colon + 1:], ",".join(indices),
+                                            key[:colon]))
+        tmp_fname = fname + ".tmp"
+        f = streamio.open_file_as_stream(tmp_fname, "w")
+        f.write("".join(lines))
+        f.close()
+        os.rename(tmp_fname, fname)
+
+    def record(self, lam):
+        if not lam.srcfile or lam.srcpos < 0 or lam.is_lazy():
+            return
+        in_cycle = lam.body[0].in_cycle
+        nodes = body_nodes(lam)
+        indices = [i for i in range(len(nodes)) if nodes[i].should_enter]
+        if not in_cycle and not indices:
+            return
+        key = lambda_key(lam.srcfile, lam.srcpos)
+        entry = self.entries.get(key, None)
+        if entry is None:
+            entry = self.entries[key] = WarmupEntry()
+        entry.in_cycle = entry.in_cycle or in_cycle
+        for index in indices:
+            entry.indices[index] = None
+
+    def seed(self, lam):
+        """ Arm the JIT entry points of a lambda as the previous runs left
+        them. Several lambdas can come from the same source position (e.g.
+        from a macro), they all get the union of what was learned. """
+        if not self.entries or not lam.srcfile or lam.srcpos < 0:
+            return
+        entry = self.entries.get(lambda_key(lam.srcfile, lam.srcpos), None)
+        if entry is None:
+            return
+        if entry.in_cycle:
+            lam.set_in_cycle()
+        if entry.indices:
+            nodes = body_nodes(lam)
+            for index in entry.indices:
+                if index < len(nodes):
+                    nodes[index].set_should_enter()
+
+warmup_profile = WarmupProfile()
+
+def lambda_key(srcfile, srcpos):
+    return "%s:%s" % (srcfile, srcpos)
+
+def body_nodes(lam):
+    """ The ASTs of the body of lam in preorder, not including the bodies of
+    nested lambdas, which are profiled on their own. """
+    from pycket.interpreter import Lambda
+    result = []
+    todo = []
+    for i in range(len(lam.body) - 1, -1, -1):
+        todo.append(lam.body[i])
+    while todo:
+        ast = todo.pop()
+        if isinstance(ast, Lambda):
+            continue
+        result.append(ast)
+        children = ast.direct_children()
+        for i in range(len(children) - 1, -1, -1):
+            todo.append(children[i])
+    return result
+
+def module_lambdas(module):
+    """ All the lambdas of module whose body was decoded. """
+    from pycket.interpreter import Lambda
+    result = []
+    todo = module.body[:]
+    while todo:
+        ast = todo.pop()
+        if isinstance(ast, Lambda):
+            result.append(ast)
+            if ast.is_lazy():
+                continue
+            for b in ast.body:
+                todo.append(b)
+        else:
+            for child in ast.direct_children():
+                todo.append(child)
+    return result